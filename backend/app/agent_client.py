@@ -0,0 +1,275 @@
+"""
+Async client for the detection agent (llm_agent).
+
+All calls from a worker process share one pooled ``httpx.AsyncClient`` and one
+event loop, so connections are reused across chunks and jobs. In-flight
+requests are bounded per job (``AGENT_MAX_IN_FLIGHT_PER_JOB``) and per worker
+process (``AGENT_MAX_IN_FLIGHT_PER_PROCESS``, which also sizes the connection
+pool). Both limits are local: the worker pool as a whole keeps up to
+``WORKER_PROCESSES`` times the smaller of them in flight, and the agent's own
+admission control (429 with ``Retry-After`` when its queue is full) is what
+bounds the load across processes. Transport errors and overload responses are
+retried with exponential backoff, honouring ``Retry-After``.
+Streamed detections (``/detect/stream``) hand each segment's spans to the
+caller as they arrive; a retried stream skips segments already delivered.
+``detect_batch`` sends many transcriptions per request to ``/detect/batch``.
+"""
+import asyncio
+import json
+import os
+import random
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+import httpx
+
+AGENT_URL = os.getenv("AGENT_URL", "http://localhost:8001")
+AGENT_TIMEOUT_SEC = float(os.getenv("AGENT_TIMEOUT_SEC", "900"))
+AGENT_CONNECT_TIMEOUT_SEC = float(os.getenv("AGENT_CONNECT_TIMEOUT_SEC", "10"))
+# Per worker process; AGENT_MAX_IN_FLIGHT is the older name of the same setting
+AGENT_MAX_IN_FLIGHT_PER_PROCESS = int(
+    os.getenv("AGENT_MAX_IN_FLIGHT_PER_PROCESS", os.getenv("AGENT_MAX_IN_FLIGHT", "8"))
+)
+AGENT_MAX_IN_FLIGHT_PER_JOB = int(os.getenv("AGENT_MAX_IN_FLIGHT_PER_JOB", "4"))
+AGENT_MAX_RETRIES = int(os.getenv("AGENT_MAX_RETRIES", "4"))
+AGENT_RETRY_BACKOFF_SEC = float(os.getenv("AGENT_RETRY_BACKOFF_SEC", "1.0"))
+# Transcriptions per /detect/batch request
+AGENT_BATCH_MAX_ITEMS = int(os.getenv("AGENT_BATCH_MAX_ITEMS", "16"))
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[httpx.AsyncClient] = None
+_process_limit: Optional[asyncio.Semaphore] = None
+
+
+class AgentError(Exception):
+    """The agent could not produce a result after all retries."""
+
+
+def run(coro: Awaitable[T]) -> T:
+    """Run a coroutine on this process's long-lived loop, keeping the connection pool warm."""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client, _process_limit
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=AGENT_URL,
+            timeout=httpx.Timeout(AGENT_TIMEOUT_SEC, connect=AGENT_CONNECT_TIMEOUT_SEC),
+            limits=httpx.Limits(
+                max_connections=AGENT_MAX_IN_FLIGHT_PER_PROCESS,
+                max_keepalive_connections=AGENT_MAX_IN_FLIGHT_PER_PROCESS
+            )
+        )
+        _process_limit = asyncio.Semaphore(AGENT_MAX_IN_FLIGHT_PER_PROCESS)
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return AGENT_RETRY_BACKOFF_SEC * (2 ** attempt) * (0.5 + random.random())
+
+
+async def post_json(path: str, payload: dict, job_limit: Optional[asyncio.Semaphore] = None) -> dict:
+    """POST to the agent with bounded concurrency and retries."""
+    client = get_client()
+    job_limit = job_limit or asyncio.Semaphore(AGENT_MAX_IN_FLIGHT_PER_JOB)
+    last_error: Optional[Exception] = None
+
+    for attempt in range(AGENT_MAX_RETRIES + 1):
+        retry_after = None
+        async with job_limit, _process_limit:
+            try:
+                response = await client.post(path, json=payload)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = response.headers.get("Retry-After")
+                last_error = AgentError(f"Agent returned {response.status_code}")
+            except httpx.TransportError as e:
+                last_error = e
+
+        if attempt < AGENT_MAX_RETRIES:
+            delay = _backoff(attempt, retry_after)
+            print(f"[WARN] Agent call {path} failed ({last_error}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    raise AgentError(f"Agent call {path} failed after {AGENT_MAX_RETRIES + 1} attempts: {last_error}")
+
+
+async def detect(transcription: str, default_definitions: list = None, positive_examples: list = None,
+                 negative_examples: list = None, job_limit: Optional[asyncio.Semaphore] = None) -> dict:
+    """Send one transcription to the agent's /detect endpoint."""
+    return await post_json(
+        "/detect",
+        {
+            "transcription": transcription,
+            "default_definitions": default_definitions or [],
+            "positive_examples": positive_examples or [],
+            "negative_examples": negative_examples or []
+        },
+        job_limit
+    )
+
+
+async def _read_stream(response: httpx.Response, segment_spans: dict,
+                       on_segment: Optional[Callable[[dict], None]]) -> Optional[dict]:
+    """Consume NDJSON events into segment_spans; the final result, or None if the stream broke off."""
+    lines = response.aiter_lines()
+    try:
+        async for line in lines:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["event"] == "segment":
+                # Segmentation is deterministic, so a retried stream repeats indices
+                if event["segment_index"] in segment_spans:
+                    continue
+                segment_spans[event["segment_index"]] = event["spans"]
+                if on_segment:
+                    on_segment(event)
+            elif event["event"] == "done":
+                return {
+                    "spans": [span for i in sorted(segment_spans) for span in segment_spans[i]],
+                    "failed_segments": event.get("failed_segments", []),
+                    "skipped_segments": event.get("skipped_segments", [])
+                }
+            else:
+                raise AgentError(f"Agent reported: {event.get('detail')}")
+    finally:
+        await lines.aclose()
+    return None
+
+
+async def compile_criteria(criteria: List[str]) -> Tuple[List[str], bool]:
+    """
+    Merge overlapping criteria into a compact set via the agent's
+    /criteria/compile. Returns (criteria, whether the agent compiled them);
+    when it could not, the criteria are the input with repeats dropped.
+    """
+    response = await post_json("/criteria/compile", {"criteria": criteria})
+    return response["criteria"], response.get("compiled", True)
+
+
+async def detect_stream(transcription: str, default_definitions: list = None, positive_examples: list = None,
+                        negative_examples: list = None, on_segment: Optional[Callable[[dict], None]] = None,
+                        job_limit: Optional[asyncio.Semaphore] = None) -> dict:
+    """
+    Send one transcription to /detect/stream. on_segment gets every "segment"
+    event once, in arrival order. Returns all spans in segment order, the same
+    shape /detect returns.
+    """
+    client = get_client()
+    job_limit = job_limit or asyncio.Semaphore(AGENT_MAX_IN_FLIGHT_PER_JOB)
+    payload = {
+        "transcription": transcription,
+        "default_definitions": default_definitions or [],
+        "positive_examples": positive_examples or [],
+        "negative_examples": negative_examples or []
+    }
+    segment_spans = {}
+    last_error: Optional[Exception] = None
+
+    for attempt in range(AGENT_MAX_RETRIES + 1):
+        retry_after = None
+        async with job_limit, _process_limit:
+            try:
+                async with client.stream("POST", "/detect/stream", json=payload) as response:
+                    if response.status_code in RETRY_STATUSES:
+                        retry_after = response.headers.get("Retry-After")
+                        last_error = AgentError(f"Agent returned {response.status_code}")
+                    else:
+                        response.raise_for_status()
+                        result = await _read_stream(response, segment_spans, on_segment)
+                        if result is not None:
+                            return result
+                        last_error = AgentError("Agent stream ended without a result")
+            except (httpx.TransportError, AgentError) as e:
+                last_error = e
+
+        if attempt < AGENT_MAX_RETRIES:
+            delay = _backoff(attempt, retry_after)
+            print(f"[WARN] Agent stream failed ({last_error}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    raise AgentError(f"Agent stream failed after {AGENT_MAX_RETRIES + 1} attempts: {last_error}")
+
+
+async def detect_many(transcriptions: List[str], default_definitions: list = None, positive_examples: list = None,
+                      negative_examples: list = None,
+                      on_result: Optional[Callable[[int, dict], None]] = None,
+                      on_segment: Optional[Callable[[int, dict], None]] = None) -> List[dict]:
+    """
+    Analyse several transcriptions of one job concurrently, at most
+    AGENT_MAX_IN_FLIGHT_PER_JOB at a time. Results keep the input order;
+    on_result is called as each one arrives. With on_segment, transcriptions
+    are streamed and it is called with (transcription index, segment event)
+    as each segment is scored.
+    """
+    job_limit = asyncio.Semaphore(AGENT_MAX_IN_FLIGHT_PER_JOB)
+
+    async def _one(i: int, text: str) -> dict:
+        if on_segment:
+            result = await detect_stream(text, default_definitions, positive_examples, negative_examples,
+                                         lambda event: on_segment(i, event), job_limit)
+        else:
+            result = await detect(text, default_definitions, positive_examples, negative_examples, job_limit)
+        if on_result:
+            on_result(i, result)
+        return result
+
+    return await asyncio.gather(*(_one(i, text) for i, text in enumerate(transcriptions)))
+
+
+async def detect_batch(transcriptions: List[str], default_definitions: list = None, positive_examples: list = None,
+                       negative_examples: list = None,
+                       on_result: Optional[Callable[[int, dict], None]] = None) -> List[dict]:
+    """
+    Analyse transcriptions through /detect/batch, AGENT_BATCH_MAX_ITEMS per
+    request, so the agent deduplicates and schedules their segments as one
+    pool. Results keep the input order, each shaped like a /detect response;
+    on_result is called per transcription when its request returns.
+    """
+    job_limit = asyncio.Semaphore(AGENT_MAX_IN_FLIGHT_PER_JOB)
+    results: List[Optional[dict]] = [None] * len(transcriptions)
+
+    async def _one(start: int):
+        indices = range(start, min(start + AGENT_BATCH_MAX_ITEMS, len(transcriptions)))
+        response = await post_json(
+            "/detect/batch",
+            {
+                "items": [{"id": str(i), "transcription": transcriptions[i]} for i in indices],
+                "default_definitions": default_definitions or [],
+                "positive_examples": positive_examples or [],
+                "negative_examples": negative_examples or []
+            },
+            job_limit
+        )
+        for i in indices:
+            results[i] = {
+                "spans": response["results"].get(str(i), []),
+                "failed_segments": response.get("failed_segments", {}).get(str(i), []),
+                "skipped_segments": response.get("skipped_segments", {}).get(str(i), [])
+            }
+            if on_result:
+                on_result(i, results[i])
+
+    await asyncio.gather(*(_one(start) for start in range(0, len(transcriptions), max(1, AGENT_BATCH_MAX_ITEMS))))
+    return results
@@ -0,0 +1,223 @@
+"""
+Align LLM span texts with word timestamps.
+
+The word array of a job is normalised once and indexed by unigrams and
+n-grams. Each span is then located by looking up its rarest n-gram and
+verifying the few candidate positions, instead of comparing the span against
+every window of the transcript. When the LLM changed the wording slightly, a
+bounded fuzzy pass scores the best-voted candidate windows and accepts the
+closest one above a similarity threshold.
+
+Spans the agent already resolved to character offsets skip the text search:
+the offsets are mapped to words by bisecting the start offset of every word
+in the transcript text (words joined by single spaces, as stitching builds it).
+"""
+import string
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.word_timeline import WordTimeline
+
+NGRAM = 3
+FUZZY_THRESHOLD = 0.8
+MAX_FUZZY_CANDIDATES = 32
+MAX_POSTINGS_PER_GRAM = 256
+
+DUPLICATE = -1
+
+
+def normalize_word(word):
+    # Lowercase and strip punctuation from both ends
+    return word.strip(string.punctuation).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalised, non-empty tokens of a span or word."""
+    return [t for t in (normalize_word(w) for w in text.split()) if t]
+
+
+class SpanAligner:
+    """Index over one transcript's words; built once per job."""
+
+    def __init__(self, words: Union[WordTimeline, List[dict]]):
+        self.words = words
+        self.tokens: List[str] = []
+        self.token_word: List[int] = []  # token position -> index into words
+
+        # Character offset of every word in " ".join(words); a chunk's text starts at its first word's offset
+        self.char_starts: List[int] = []
+        self.char_ends: List[int] = []
+        offset = 0
+
+        # A timeline hands out its token table's strings, so each distinct word is normalised once
+        texts = words.word_texts() if isinstance(words, WordTimeline) else [word["word"] for word in words]
+        normalised: Dict[str, List[str]] = {}
+
+        for i, text in enumerate(texts):
+            self.char_starts.append(offset)
+            offset += len(text)
+            self.char_ends.append(offset)
+            offset += 1
+            if text not in normalised:
+                normalised[text] = tokenize(text)
+            for token in normalised[text]:
+                self.tokens.append(token)
+                self.token_word.append(i)
+
+        self.unigrams: Dict[str, List[int]] = defaultdict(list)
+        self.ngrams: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for pos, token in enumerate(self.tokens):
+            self.unigrams[token].append(pos)
+            if pos + NGRAM <= len(self.tokens):
+                self.ngrams[tuple(self.tokens[pos:pos + NGRAM])].append(pos)
+
+    def _postings(self, query: List[str], j: int, k: int) -> List[int]:
+        if k == 1:
+            return self.unigrams.get(query[j], [])
+        return self.ngrams.get(tuple(query[j:j + k]), [])
+
+    def _exact(self, query: List[str], lo: int, hi: int, used: set) -> Optional[int]:
+        m = len(query)
+        k = NGRAM if m >= NGRAM else 1
+
+        # Anchor on the rarest gram of the span; every match must contain it
+        anchors = [(len(self._postings(query, j, k)), j) for j in range(m - k + 1)]
+        count, j = min(anchors)
+        if count == 0:
+            return None
+
+        fallback = None
+        duplicate = False
+        for pos in self._postings(query, j, k):
+            start = pos - j
+            if start < 0 or self.tokens[start:start + m] != query:
+                continue
+            in_range = lo <= start < hi
+            if start in used:
+                duplicate = duplicate or in_range
+                continue
+            if in_range:
+                return start
+            if fallback is None:
+                fallback = start
+        # A span repeated by the LLM must not jump to an occurrence outside its own chunk
+        return DUPLICATE if duplicate else fallback
+
+    def _fuzzy(self, query: List[str], lo: int, hi: int, used: set) -> Optional[Tuple[int, int, float]]:
+        m = len(query)
+        k = NGRAM if m >= NGRAM else 1
+
+        # Vote for window starts implied by every gram the span shares with the transcript
+        votes: Counter = Counter()
+        for j in range(m - k + 1):
+            postings = self._postings(query, j, k)
+            if len(postings) > MAX_POSTINGS_PER_GRAM:
+                continue
+            for pos in postings:
+                votes[pos - j] += 2 if lo <= pos < hi else 1
+
+        slack = max(1, m // 5)
+        best = None
+        for start, _ in votes.most_common(MAX_FUZZY_CANDIDATES):
+            # Let the matcher trim the candidate window to the region that actually matches
+            base = max(0, start)
+            window = self.tokens[base:base + m + slack]
+            blocks = [b for b in SequenceMatcher(None, query, window, autojunk=False).get_matching_blocks() if b.size]
+            if not blocks:
+                continue
+            s, e = base + blocks[0].b, base + blocks[-1].b + blocks[-1].size
+            if s in used:
+                continue
+            score = SequenceMatcher(None, query, self.tokens[s:e], autojunk=False).ratio()
+            if best is None or score > best[2]:
+                best = (s, e, score)
+
+        if best and best[2] >= FUZZY_THRESHOLD:
+            return best
+        return None
+
+    def locate(self, span_text: str, lo_word: int = 0, hi_word: Optional[int] = None,
+               used: Optional[set] = None) -> Optional[Tuple[int, int, float]]:
+        """
+        Find span_text, preferring matches inside words[lo_word:hi_word].
+        Returns (first_word, last_word, match_score) or None.
+        """
+        query = tokenize(span_text)
+        if not query or not self.tokens:
+            return None
+        used = used if used is not None else set()
+        hi_word = len(self.words) if hi_word is None else hi_word
+
+        lo = bisect_left(self.token_word, lo_word)
+        hi = bisect_left(self.token_word, hi_word)
+
+        start = self._exact(query, lo, hi, used)
+        if start == DUPLICATE:
+            return None
+        if start is not None:
+            end, score = start + len(query), 1.0
+        else:
+            fuzzy = self._fuzzy(query, lo, hi, used)
+            if fuzzy is None:
+                return None
+            start, end, score = fuzzy
+
+        used.add(start)
+        return self.token_word[start], self.token_word[end - 1], score
+
+    def locate_offsets(self, start_char: int, end_char: int, lo_word: int = 0,
+                       hi_word: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """
+        Words covering [start_char, end_char) of the text of words[lo_word:hi_word].
+        Returns (first_word, last_word) or None if the range holds no word.
+        """
+        hi_word = len(self.words) if hi_word is None else hi_word
+        if lo_word >= hi_word or end_char <= start_char:
+            return None
+        base = self.char_starts[lo_word]
+        first = bisect_right(self.char_starts, base + start_char, lo_word, hi_word) - 1
+        if first < lo_word:
+            first = lo_word
+        elif base + start_char >= self.char_ends[first]:
+            # A range starting in the gap after a word begins at the next one
+            first += 1
+        last = bisect_right(self.char_starts, base + end_char - 1, lo_word, hi_word) - 1
+        if first > last:
+            return None
+        return first, last
+
+    def align(self, llm_spans: List[dict], lo_word: int = 0, hi_word: Optional[int] = None) -> List[dict]:
+        """Resolve all spans an agent returned for words[lo_word:hi_word] to timestamps."""
+        used: set = set()
+        seen: set = set()
+        processed_spans = []
+
+        for llm_span in llm_spans:
+            span_text = llm_span["text"]
+            if llm_span.get("start_char") is not None and llm_span.get("end_char") is not None:
+                # Resolved by the agent: offsets into this chunk's text
+                words = self.locate_offsets(llm_span["start_char"], llm_span["end_char"], lo_word, hi_word)
+                match = words + (llm_span.get("match_score") or 1.0,) if words else None
+            else:
+                # Older agents, or a quote the agent could not find in its segment
+                match = self.locate(span_text, lo_word, hi_word, used)
+            if match is None:
+                print(f"[WARN] Could not align span: {span_text[:80]!r}")
+                continue
+
+            first, last, score = match
+            if (first, last) in seen:
+                continue
+            seen.add((first, last))
+            processed_spans.append({
+                "start": self.words[first]["start"],
+                "end": self.words[last]["end"],
+                "text": span_text,
+                "rationale": llm_span["rationale"],
+                "confidence": llm_span.get("confidence", 0.0),
+                "match_score": round(score, 3)
+            })
+
+        return processed_spans
@@ -0,0 +1,83 @@
+"""
+Versioned analysis results.
+
+Every analysis run of a job writes ``<file>.v<N>.json`` and an
+``AnalysisResult`` row holding the criteria and examples it used, so
+re-analysing a batch after feedback never overwrites earlier results.
+While a job is being analysed, the spans found so far are kept in
+``<file>.partial.json`` so clients can show them before the run finishes.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import AnalysisResult, Job
+
+
+def save_analysis_result(db: Session, job: Job, result: dict, default_definitions: list,
+                         positive_examples: list, negative_examples: list) -> AnalysisResult:
+    version = (job.analysis_version or 0) + 1
+    path = Path(job.original_file_path).with_suffix(f".v{version}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=4)
+
+    row = AnalysisResult(
+        job_id=job.id,
+        version=version,
+        default_definitions=json.dumps(default_definitions or []),
+        positive_examples=json.dumps(positive_examples or []),
+        negative_examples=json.dumps(negative_examples or []),
+        path=str(path)
+    )
+    db.add(row)
+    job.analysis_version = version
+    db.commit()
+    db.refresh(row)
+    clear_partial_result(job)
+    return row
+
+
+def partial_result_path(job: Job) -> Path:
+    return Path(job.original_file_path).with_suffix(".partial.json")
+
+
+def write_partial_result(job: Job, partial: dict):
+    """Replace the in-progress result atomically, so readers never see half a file."""
+    path = partial_result_path(job)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(partial, f)
+    os.replace(tmp_path, path)
+
+
+def read_partial_result(job: Job) -> Optional[dict]:
+    try:
+        with open(partial_result_path(job), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def clear_partial_result(job: Job):
+    partial_result_path(job).unlink(missing_ok=True)
+
+
+def get_result_path(db: Session, job: Job, version: Optional[int] = None) -> Optional[Path]:
+    """
+    Path of a job's analysis result: the given version, or the latest one.
+    Jobs analysed before results were versioned only have ``<file>.json``.
+    """
+    query = db.query(AnalysisResult).filter(AnalysisResult.job_id == job.id)
+    if version is not None:
+        row = query.filter(AnalysisResult.version == version).first()
+    else:
+        row = query.order_by(AnalysisResult.version.desc()).first()
+
+    if row is not None:
+        return Path(row.path)
+    if version is None and job.original_file_path:
+        return Path(job.original_file_path).with_suffix('.json')
+    return None
@@ -1,177 +1,271 @@
-from sqlalchemy.orm import Session
-import tempfile
-import shutil
-from pathlib import Path
-from app.transcribe import convert_video_to_audio, split_audio_to_patches, transcribe_patches
-import os, platform
-from faster_whisper import WhisperModel
-from app.models import Job
-import requests
-import string
+import hashlib
 import json
-
-MODEL_SIZE = os.getenv("WHISPER_MODEL", "base")
-
-def load_whisper():
-    preferred = os.getenv("WHISPER_DEVICE")  # cuda | metal | cpu (optional)
-
-    if preferred:
-        ct_default = {"cuda": "float16", "metal": "float16", "cpu": "int8"}.get(preferred, "int8")
-        candidates = [(preferred, os.getenv("WHISPER_COMPUTE", ct_default))]
-    else:
-        candidates = [
-            ("cuda",  "float16"),
-            ("metal", "float16") if platform.system() == "Darwin" else None,
-            ("cpu",   os.getenv("WHISPER_COMPUTE", "int8")),
-        ]
-        candidates = [c for c in candidates if c]
-
-    last_err = None
-    for device, compute in candidates:
-        try:
-            print(f"[INFO] Loading Whisper model: {MODEL_SIZE} (device={device}, compute={compute})")
-            model = WhisperModel(MODEL_SIZE, device=device, compute_type=compute)
-            print("[INFO] Whisper model loaded.")
-            return model
-        except Exception as e:
-            print(f"[WARN] Failed on {device} ({compute}): {e}")
-            last_err = e
-
-    raise RuntimeError(f"Whisper init failed. Last error: {last_err}")
-
-whisper_model = load_whisper()
-
-
-def process_file(original_path: str, patch_duration_sec: int, overlap_sec: int):
-    # Import db session inside background task
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Work on a copy
-        working_path = Path(tmpdir) / Path(original_path).name
-        shutil.copy(original_path, working_path)
-
-        # If video, convert to audio
-        if working_path.suffix.lower() in ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']:
-            audio_path = Path(tmpdir) / (working_path.stem + '.wav')
-            convert_video_to_audio(str(working_path), str(audio_path))
-        else:
-            audio_path = working_path
-
-        # Split audio
-        patches = split_audio_to_patches(str(audio_path), patch_duration_sec, overlap_sec)
-
-        # Transcribe
-        all_results = transcribe_patches(patches, whisper_model)
-
-        return all_results
-
-
-def send_to_llm(transcribed_text: str, default_definitions: list = None, positive_examples: list = None, negative_examples: list = None):
-    """Send transcribed text to LLM for analysis"""
-    response = requests.post(
-        "http://localhost:8001/detect",
-        json={
-            "transcription": transcribed_text,
-            "default_definitions": default_definitions or [],
-            "positive_examples": positive_examples or [],
-            "negative_examples": negative_examples or []
-        }
-    )
-
-    result = response.json()
-
-    return result
-
-
-def normalize_word(word):
-    # Lowercase and strip punctuation from both ends
-    return word.strip(string.punctuation).lower()
-
-
-def find_matching_spans(transcribed_patches: dict, llm_spans: list):
-    full_text = transcribed_patches["patch_text"].strip()
-    words = full_text.split()
-    norm_words = [normalize_word(w) for w in words]
-    n = len(norm_words)
-
-    processed_spans = []
-
-    for llm_span in llm_spans:
-        span_text = llm_span["text"]
-
-        span_words = span_text.split()
-        norm_span_word = [normalize_word(w) for w in span_words]
-        m = len(norm_span_word)
-
-        for i in range(n - m + 1):
-            if norm_words[i:i + m] == norm_span_word:
-                start_ind = i
-                end_ind = i + m - 1
-
-                processed_spans.append({
-                    "start": transcribed_patches["words"][start_ind]["start"],
-                    "end": transcribed_patches["words"][end_ind]["end"],
-                    "text": span_text,
-                    "rationale": llm_span["rationale"],
-                    "confidence": llm_span.get("confidence", 0.0)
-                })
-
-    return processed_spans
-
-
-def main_background_function(job_id: str, original_path: str, patch_duration_sec: int, overlap_sec: int, db: Session, default_definitions: list = None, positive_examples: list = None, negative_examples: list = None):
-
-    job = db.get(Job, job_id)
-    job.status = "transcribing"
-    db.commit()
-    db.expire_all()
-
-    transcribed_patches = process_file(original_path, patch_duration_sec, overlap_sec)
-
-    print(f"Got {len(transcribed_patches)} batches")
-
-    
-    cleaned_list = []
-
-    # Save transcribed text to file
-    txt_path = Path(original_path).with_suffix('.txt')
-    with open(txt_path, 'w', encoding='utf-8') as f:
-        for transcribed_batch in transcribed_patches:
-            transcribed_text = transcribed_batch["patch_text"].strip()
-            cleaned_list.append(transcribed_text)
-            f.write(transcribed_text)
-
-    job = db.get(Job, job_id)
-    job.status = "analysing"
-    db.commit()
-    db.expire_all()
-
-    all_processed_spans = []
-    
-    for i, batch in enumerate(cleaned_list):
-        print(f"Evaluating {i + 1}/{len(transcribed_patches)} ")
-        result_from_llm = send_to_llm(batch, default_definitions, positive_examples, negative_examples)
-        llm_spans = result_from_llm["spans"]
-        processed_spans = find_matching_spans(transcribed_patches[i], llm_spans)
-        all_processed_spans.extend(processed_spans)
-        
-
-    # Read the final transcribed text from file
-    with open(Path(original_path).with_suffix('.txt'), 'r', encoding='utf-8') as f:
-        transcribed_text = f.read()
-
-    # Read the JSON dumps
-    print("Done!")
-
-    final_result = {"transcript_text": transcribed_text, "spans": all_processed_spans}
-
-    txt_path = Path(original_path).with_suffix('.json')
-    with open(txt_path, 'w', encoding='utf-8') as f:
-        json.dump(final_result, f, indent=4)
-
-    # Save final result to file
-
-    job = db.get(Job, job_id)
-    job.status = "completed"
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List
+from app.transcribe import split_audio, iter_transcribed_patches
+from app.stitching import PatchStitcher
+from app.pipeline import transcribe_and_analyse
+from app.alignment import SpanAligner
+from app import agent_client
+from app.whisper_model import MODEL_SIZE, get_transcriber, compute_type
+from app.database import SessionLocal
+from app.job_queue import set_job_status, heartbeat, complete_job
+from app.transcript_store import find_transcript, save_transcript, load_transcript
+from app.analysis_results import save_analysis_result, write_partial_result, clear_partial_result
+from app.models import Batch, Job
+from app.word_alignment import WORD_ALIGNMENT, refine_spans
+
+# Minimum seconds between rewrites of a job's in-progress result file
+PARTIAL_WRITE_INTERVAL_SEC = float(os.getenv("PARTIAL_WRITE_INTERVAL_SEC", "2"))
+# Analysis-only runs (stored transcript reused) send all chunks through /detect/batch instead of streaming
+AGENT_BATCH_REANALYSIS = os.getenv("AGENT_BATCH_REANALYSIS", "true").lower() == "true"
+# Merge a batch's overlapping criteria once with the agent's refinement prompt before detection
+CRITERIA_COMPILE = os.getenv("CRITERIA_COMPILE", "true").lower() == "true"
+
+
+def process_file(original_path: str, patch_duration_sec: int, overlap_sec: int, chunking: str,
+                 word_timestamps: bool = True) -> Iterator[dict]:
+    """Transcribed patches of a file, yielded one by one as Whisper finishes them."""
+    # ffmpeg decodes audio and video containers alike, streaming straight into the chunker and Whisper
+    patches = split_audio(original_path, patch_duration_sec, overlap_sec, chunking)
+
+    # Transcribe
+    model, batch_size = get_transcriber()
+    yield from iter_transcribed_patches(patches, model, batch_size=batch_size, word_timestamps=word_timestamps)
+
+
+def compiled_criteria(db, batch: Batch) -> list:
+    """
+    The batch's criteria as compiled by the agent, compiling them on first use
+    and again whenever default_definitions change. Falls back to the raw
+    definitions if the agent cannot compile them; fallbacks are not stored,
+    so the next job of the batch tries again.
+    """
+    definitions = batch.get_default_definitions()
+    if not CRITERIA_COMPILE or len(definitions) <= 1:
+        return definitions
+
+    definitions_hash = hashlib.sha256(json.dumps(definitions).encode("utf-8")).hexdigest()
+    if batch.compiled_criteria_hash == definitions_hash and batch.get_compiled_criteria():
+        return batch.get_compiled_criteria()
+
+    try:
+        compiled, ok = agent_client.run(agent_client.compile_criteria(definitions))
+    except Exception as e:
+        print(f"[WARN] Criteria compilation failed for batch {batch.id}, using them as given: {e}")
+        return definitions
+    if not ok:
+        print(f"[WARN] Agent could not compile the criteria of batch {batch.id}, using them as given")
+        return compiled or definitions
+
+    print(f"[INFO] Compiled {len(definitions)} criteria into {len(compiled)} for batch {batch.id}")
+    batch.set_compiled_criteria(compiled, definitions_hash)
     db.commit()
-
-    db.close()
+    return compiled or definitions
+
+
+def main_background_function(job_id: str):
+    """Run transcription and analysis for a claimed job, using a session of its own."""
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        original_path = job.original_file_path
+        patch_duration_sec = job.patch_duration_sec
+        overlap_sec = job.overlap_sec
+        chunking = job.chunking
+        default_definitions = job.batch.get_default_definitions()
+        positive_examples = job.batch.get_positive_examples()
+        negative_examples = job.batch.get_negative_examples()
+        # Prompts carry the compiled criteria; results still record the definitions the user gave
+        detection_criteria = compiled_criteria(db, job.batch)
+
+        # Reuse a stored transcript of the same bytes and settings when there is one
+        stored = job.transcript or find_transcript(
+            db, job.content_hash, MODEL_SIZE, patch_duration_sec, overlap_sec, compute_type(), chunking
+        )
+        reused_transcript = stored is not None and Path(stored.path).exists()
+
+        # Spans found so far, per chunk, published to <file>.partial.json while the job runs
+        clear_partial_result(job)
+        chunks: List[dict] = []
+        partial_spans: List[List[dict]] = []
+        progress = {
+            "transcription_done": reused_transcript, "patches_transcribed": 0,
+            "chunks_total": 0, "chunks_done": 0, "segments_done": 0, "segments_total": {}, "spans_found": 0
+        }
+        last_write = 0.0
+
+        def _publish(force: bool = False):
+            nonlocal last_write
+            if not force and time.monotonic() - last_write < PARTIAL_WRITE_INTERVAL_SEC:
+                return
+            last_write = time.monotonic()
+            write_partial_result(job, {
+                "spans": [span for spans in partial_spans for span in spans],
+                "transcription_done": progress["transcription_done"],
+                "patches_transcribed": progress["patches_transcribed"],
+                "chunks_total": progress["chunks_total"],
+                "chunks_done": progress["chunks_done"],
+                "segments_done": progress["segments_done"],
+                "segments_total": sum(progress["segments_total"].values())
+            })
+            heartbeat(db, job_id)
+
+        def _on_segment(i: int, event: dict):
+            new_spans = align_chunk(i, event["spans"])
+            partial_spans[i].extend(new_spans)
+            progress["segments_done"] += 1
+            progress["segments_total"][i] = event.get("segments_total", 0)
+            # The first finding is published at once; later ones are batched by the interval
+            first_finding = bool(new_spans) and progress["spans_found"] == 0
+            progress["spans_found"] += len(new_spans)
+            _publish(force=first_finding)
+
+        def _on_result(i: int, result: dict):
+            print(f"Evaluated chunk {i + 1}/{progress['chunks_total']}")
+            progress["chunks_done"] += 1
+            _publish()
+
+        def _on_batch_result(i: int, result: dict):
+            partial_spans[i] = align_chunk(i, result["spans"])
+            _on_result(i, result)
+
+        def _write_text(transcript: dict):
+            # Save transcribed text to file
+            txt_path = Path(original_path).with_suffix('.txt')
+            with open(txt_path, 'w', encoding='utf-8') as f:
+                f.write(transcript["text"])
+
+        if reused_transcript:
+            print(f"[INFO] Reusing stored transcript {stored.id} for job {job_id}")
+            transcript = load_transcript(stored)
+            _write_text(transcript)
+            if job.transcript_id != stored.id:
+                job.transcript_id = stored.id
+                job.transcript_from_cache = True
+                db.commit()
+            set_job_status(db, job_id, "analysing")
+
+            # Normalise and index the word array once; every span of every chunk is resolved against it
+            aligner = SpanAligner(transcript["words"])
+
+            def align_chunk(i: int, spans: List[dict]) -> List[dict]:
+                return aligner.align(spans, chunks[i]["word_start"], chunks[i]["word_end"])
+
+            chunks.extend(transcript["chunks"])
+            partial_spans.extend([] for _ in chunks)
+            progress["chunks_total"] = len(chunks)
+            print(f"Evaluating {len(chunks)} chunks")
+
+            texts = [chunk["text"] for chunk in chunks]
+            if AGENT_BATCH_REANALYSIS:
+                # The whole transcript is known up front: fewer, larger requests the agent can dedupe and pool
+                results = agent_client.run(agent_client.detect_batch(
+                    texts,
+                    detection_criteria,
+                    positive_examples,
+                    negative_examples,
+                    on_result=_on_batch_result
+                ))
+            else:
+                results = agent_client.run(agent_client.detect_many(
+                    texts,
+                    detection_criteria,
+                    positive_examples,
+                    negative_examples,
+                    on_result=_on_result,
+                    on_segment=_on_segment
+                ))
+        else:
+            set_job_status(db, job_id, "transcribing")
+            # Lazy mode skips Whisper's word alignment pass; flagged spans are aligned afterwards
+            word_timestamps = WORD_ALIGNMENT != "lazy"
+
+            # Words of each chunk are indexed on their own, as soon as the chunk is stitched
+            chunk_aligners: List[SpanAligner] = []
+
+            def align_chunk(i: int, spans: List[dict]) -> List[dict]:
+                return chunk_aligners[i].align(spans)
+
+            def _on_chunk(chunk: dict):
+                chunks.append(chunk)
+                chunk_aligners.append(SpanAligner(stitcher.timeline(chunk["word_start"], chunk["word_end"])))
+                partial_spans.append([])
+                progress["chunks_total"] = len(chunks)
+
+            def _on_patch(n: int):
+                progress["patches_transcribed"] = n
+                print(f"Transcribed patch {n}")
+                _publish()
+
+            def _on_transcribed(stitched: dict):
+                stitched["word_timestamps"] = word_timestamps
+                _write_text(stitched)
+                if job.content_hash:
+                    # Stored before analysis is awaited, so a retry after an agent failure or a requeue
+                    # reuses the transcript instead of running Whisper over the file again
+                    stored_transcript = save_transcript(
+                        db, job.content_hash, MODEL_SIZE, compute_type(),
+                        patch_duration_sec, overlap_sec, stitched, chunking
+                    )
+                    job.transcript_id = stored_transcript.id
+                    job.transcript_from_cache = False
+                    db.commit()
+                progress["transcription_done"] = True
+                set_job_status(db, job_id, "analysing")
+                _publish(force=True)
+
+            async def _analyse(i: int, chunk: dict) -> dict:
+                result = await agent_client.detect_stream(
+                    chunk["text"],
+                    detection_criteria,
+                    positive_examples,
+                    negative_examples,
+                    lambda event: _on_segment(i, event)
+                )
+                _on_result(i, result)
+                return result
+
+            # Put every word on the file's timeline and drop the words transcribed twice in overlaps;
+            # each chunk is streamed to the agent as soon as it is stitched, while Whisper moves on
+            stitcher = PatchStitcher()
+            results, transcript = agent_client.run(transcribe_and_analyse(
+                process_file(original_path, patch_duration_sec, overlap_sec, chunking, word_timestamps),
+                stitcher,
+                _analyse,
+                on_chunk=_on_chunk,
+                on_patch=_on_patch,
+                on_transcribed=_on_transcribed
+            ))
+            print(f"Got {progress['patches_transcribed']} batches")
+
+        all_processed_spans = []
+        failed_segments = []
+        # Segments the agent's pre-screen never scored: no spans there means "not checked", not "clean"
+        skipped_segments = []
+        for i, (chunk, result_from_llm) in enumerate(zip(chunks, results)):
+            processed_spans = align_chunk(i, result_from_llm["spans"])
+            all_processed_spans.extend(processed_spans)
+            # Segments the agent gave up on; every other segment's spans are kept
+            failed_segments.extend({"chunk": chunk["index"], **failed} for failed in result_from_llm.get("failed_segments", []))
+            skipped_segments.extend(
+                {"chunk": chunk["index"], "segment_index": index} for index in result_from_llm.get("skipped_segments", [])
+            )
+
+        if not transcript.get("word_timestamps", True) and all_processed_spans:
+            # Word times were interpolated; align just the audio around each flagged span
+            all_processed_spans = refine_spans(all_processed_spans, transcript, original_path, job.content_hash)
+
+        if failed_segments:
+            print(f"[WARN] {len(failed_segments)} segments of job {job_id} could not be analysed")
+
+        print("Done!")
+
+        final_result = {"transcript_text": transcript["text"], "spans": all_processed_spans, "failed_segments": failed_segments,
+                        "skipped_segments": skipped_segments}
+
+        # Save final result as a new version; earlier analyses stay readable
+        save_analysis_result(db, job, final_result, default_definitions, positive_examples, negative_examples)
+
+        complete_job(db, job_id)
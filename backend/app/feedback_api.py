@@ -3,11 +3,31 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import UserFeedback, Batch, Job
 from app.schemas import UserFeedbackCreate, UserFeedbackResponse, BatchFeedbackSummary
-from typing import List
+from typing import List, Tuple
 
 router = APIRouter()
 
 
+def collect_feedback_examples(db: Session, batch_id: str) -> Tuple[List[str], List[str]]:
+    """Turn a batch's user feedback into (positive_examples, negative_examples)"""
+    feedback_list = db.query(UserFeedback).filter(
+        UserFeedback.batch_id == batch_id
+    ).all()
+    
+    positive_examples = []
+    negative_examples = []
+    
+    for feedback in feedback_list:
+        if feedback.feedback_type == "positive":
+            # User marked this as extremist (negative example for training)
+            negative_examples.append(feedback.text)
+        elif feedback.feedback_type == "negative":
+            # User unmarked this as normal (positive example for training)
+            positive_examples.append(feedback.text)
+    
+    return positive_examples, negative_examples
+
+
 @router.post("/feedback", response_model=UserFeedbackResponse)
 async def create_user_feedback(
     feedback: UserFeedbackCreate, 
@@ -71,20 +91,7 @@ async def get_batch_feedback_summary(batch_id: str, db: Session = Depends(get_db
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
-    feedback_list = db.query(UserFeedback).filter(
-        UserFeedback.batch_id == batch_id
-    ).all()
-    
-    positive_examples = []
-    negative_examples = []
-    
-    for feedback in feedback_list:
-        if feedback.feedback_type == "positive":
-            # User marked this as extremist (negative example for training)
-            negative_examples.append(feedback.text)
-        elif feedback.feedback_type == "negative":
-            # User unmarked this as normal (positive example for training)
-            positive_examples.append(feedback.text)
+    positive_examples, negative_examples = collect_feedback_examples(db, batch_id)
     
     return BatchFeedbackSummary(
         positive_examples=positive_examples,
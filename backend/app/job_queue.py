@@ -0,0 +1,217 @@
+"""
+Persistent job queue backed by the ``jobs`` table.
+
+Uploads only insert ``pending`` rows; worker processes (see ``app.worker``)
+claim them atomically, run them with their own DB session and report the
+outcome back here. Failed jobs are retried with a delay until
+``max_attempts`` is reached. Workers heartbeat their job every
+``JOB_HEARTBEAT_INTERVAL_SEC``; jobs whose worker died are put back in the
+queue once their heartbeat goes stale, or at once when the worker pool on
+the same host restarts.
+"""
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.models import Job
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY_SEC = int(os.getenv("JOB_RETRY_DELAY_SEC", "30"))
+JOB_HEARTBEAT_INTERVAL_SEC = int(os.getenv("JOB_HEARTBEAT_INTERVAL_SEC", "30"))
+# Several missed heartbeats, so a slow DB round trip does not requeue a live job
+JOB_STALE_AFTER_SEC = int(os.getenv("JOB_STALE_AFTER_SEC", "300"))
+
+# Statuses a job goes through while a worker holds it
+ACTIVE_STATUSES = ("claimed", "transcribing", "analysing")
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, used for all queue bookkeeping columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def enqueue_job(db: Session, batch_id: str, original_filename: str, file_path: str,
+                patch_duration_sec: int, overlap_sec: int, content_hash: Optional[str] = None,
+                transcript_id: Optional[str] = None, chunking: str = "fixed") -> Job:
+    """Insert a new pending job; it is picked up by the next idle worker."""
+    job = Job(
+        batch_id=batch_id,
+        original_filename=original_filename,
+        original_file_path=file_path,
+        content_hash=content_hash,
+        transcript_id=transcript_id,
+        transcript_from_cache=transcript_id is not None,
+        patch_duration_sec=patch_duration_sec,
+        overlap_sec=overlap_sec,
+        chunking=chunking,
+        status="pending",
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_next_job(db: Session, worker_id: str, candidates: int = 10) -> Optional[Job]:
+    """
+    Atomically claim the oldest claimable job.
+
+    The claim is a conditional ``UPDATE ... WHERE status = 'pending'``, so when
+    several workers race for the same row only one of them sees a rowcount of 1.
+    """
+    now = utcnow()
+    rows = (
+        db.query(Job.id)
+        .filter(Job.status == "pending")
+        .filter(or_(Job.available_at.is_(None), Job.available_at <= now))
+        .order_by(Job.created_at)
+        .limit(candidates)
+        .all()
+    )
+
+    for (job_id,) in rows:
+        claimed = (
+            db.query(Job)
+            .filter(Job.id == job_id, Job.status == "pending")
+            .update(
+                {
+                    Job.status: "claimed",
+                    Job.claimed_by: worker_id,
+                    Job.heartbeat_at: now,
+                    Job.attempts: Job.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed == 1:
+            return db.get(Job, job_id)
+
+    return None
+
+
+def set_job_status(db: Session, job_id: str, status: str):
+    """Move a claimed job to another stage and refresh its heartbeat."""
+    job = db.get(Job, job_id)
+    job.status = status
+    job.heartbeat_at = utcnow()
+    db.commit()
+
+
+def heartbeat(db: Session, job_id: str):
+    db.query(Job).filter(Job.id == job_id).update({Job.heartbeat_at: utcnow()}, synchronize_session=False)
+    db.commit()
+
+
+def complete_job(db: Session, job_id: str):
+    job = db.get(Job, job_id)
+    job.status = "completed"
+    job.claimed_by = None
+    job.heartbeat_at = utcnow()
+    job.last_error = None
+    db.commit()
+
+
+def fail_job(db: Session, job_id: str, error: str) -> bool:
+    """
+    Record a failed attempt. Returns True if the job was put back in the queue
+    for another attempt, False if it is now permanently failed.
+    """
+    job = db.get(Job, job_id)
+    job.last_error = error
+    job.claimed_by = None
+    job.heartbeat_at = None
+
+    retry = job.attempts < job.max_attempts
+    if retry:
+        job.status = "pending"
+        job.available_at = utcnow() + timedelta(seconds=JOB_RETRY_DELAY_SEC * job.attempts)
+    else:
+        job.status = "failed"
+    db.commit()
+    return retry
+
+
+def retry_job(db: Session, job_id: str):
+    """
+    Put a job back in the queue with a fresh attempt budget. Jobs with a stored
+    transcript only re-run the analysis stage.
+    """
+    job = db.get(Job, job_id)
+    job.status = "pending"
+    job.attempts = 0
+    job.available_at = None
+    job.claimed_by = None
+    job.heartbeat_at = None
+    job.last_error = None
+    db.commit()
+
+
+def requeue_stale_jobs(db: Session) -> int:
+    """Return jobs held by workers that stopped heartbeating to the queue."""
+    cutoff = utcnow() - timedelta(seconds=JOB_STALE_AFTER_SEC)
+    stale = (
+        db.query(Job)
+        .filter(Job.status.in_(ACTIVE_STATUSES))
+        .filter(or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < cutoff))
+        .all()
+    )
+    for job in stale:
+        print(f"[WARN] Job {job.id} held by {job.claimed_by} went stale")
+        job.last_error = f"Worker {job.claimed_by} stopped responding"
+        job.claimed_by = None
+        job.heartbeat_at = None
+        job.status = "pending" if job.attempts < job.max_attempts else "failed"
+    db.commit()
+    return len(stale)
+
+
+def requeue_dead_worker_jobs(db: Session) -> int:
+    """
+    Return jobs held by workers of this host whose process is gone, without
+    waiting for their heartbeat to go stale. Run by the worker pool before it
+    starts its own workers.
+    """
+    prefix = f"{socket.gethostname()}:"
+    held = (
+        db.query(Job)
+        .filter(Job.status.in_(ACTIVE_STATUSES))
+        .filter(Job.claimed_by.like(f"{prefix}%"))
+        .all()
+    )
+    dead = []
+    for job in held:
+        try:
+            pid = int(job.claimed_by[len(prefix):].split("#", 1)[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and _pid_alive(pid):
+            continue
+        print(f"[WARN] Job {job.id} held by dead worker {job.claimed_by}, requeueing")
+        job.last_error = f"Worker {job.claimed_by} exited"
+        job.claimed_by = None
+        job.heartbeat_at = None
+        job.status = "pending" if job.attempts < job.max_attempts else "failed"
+        dead.append(job)
+    db.commit()
+    return len(dead)
@@ -1,14 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.database import engine, Base
 from app.test_user import router as user_router
 from app.upload_api import router as upload_router
 from app.retrieve import router as retrieve_router
 from app.feedback_api import router as feedback_router
+from app.reanalysis_api import router as reanalysis_router
+from app.whisper_model import whisper_status
+from app.migrate import upgrade_schema
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and add columns introduced since the database was created
+upgrade_schema()
 
 app = FastAPI(
     title="JunctionX Clappers API",
@@ -31,11 +33,6 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-app.include_router(router=user_router, prefix="/users", tags=["Users"])
-app.include_router(router=upload_router, prefix="/upload", tags=["Upload"])
-app.include_router(router=retrieve_router, tags=["Retrieve"])
-app.include_router(router=feedback_router, tags=["Feedback"])
-
 
 @app.get("/")
 def read_root():
@@ -51,8 +48,14 @@ def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "database": "connected"
+        "database": "connected",
+        "whisper": whisper_status()
     }
 
 
-
+# Included after the routes above: retrieve_router's GET /{job_id} would otherwise shadow them
+app.include_router(router=user_router, prefix="/users", tags=["Users"])
+app.include_router(router=upload_router, prefix="/upload", tags=["Upload"])
+app.include_router(router=retrieve_router, tags=["Retrieve"])
+app.include_router(router=feedback_router, tags=["Feedback"])
+app.include_router(router=reanalysis_router, tags=["Reanalysis"])
@@ -0,0 +1,75 @@
+"""
+Bring an existing database up to the current models.
+
+``Base.metadata.create_all`` creates missing tables but never alters the
+ones already there, so a database created by an earlier version (e.g. the
+MySQL volume of docker-compose) lacks the columns added since: the queue
+bookkeeping on ``jobs``, transcript reuse, analysis versions, chunking mode
+and the compiled batch criteria. ``upgrade_schema`` adds every model column
+and index missing from its table. It runs on API and worker startup and can
+be run by hand:
+
+    python -m app.migrate
+
+Columns are only ever added, never changed or dropped. Foreign keys of added
+columns are not created (SQLite cannot add them to an existing table); the
+ORM does not depend on them.
+"""
+from typing import List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+import app.models  # noqa: F401  (registers the tables on Base.metadata)
+from app.database import Base, engine
+
+
+def _default_sql(column) -> str:
+    """Literal DEFAULT for a column's scalar Python default, so existing rows get a value."""
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is None:
+        return ""
+    if isinstance(default, bool):
+        default = int(default)
+    if isinstance(default, str):
+        default = "'" + default.replace("'", "''") + "'"
+    return f" DEFAULT {default}"
+
+
+def upgrade_schema(bind: Engine = engine) -> List[str]:
+    """Create missing tables, then add missing columns and indexes. Returns the statements run."""
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    dialect = bind.dialect
+    statements = []
+
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+            default = _default_sql(column)
+            if not column.nullable and default:
+                ddl += f"{default} NOT NULL"
+            elif default:
+                ddl += default
+            statements.append(ddl)
+
+        indexed = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexed:
+                statements.append(str(CreateIndex(index).compile(dialect=dialect)))
+
+    if statements:
+        with bind.begin() as connection:
+            for statement in statements:
+                print(f"[INFO] Schema upgrade: {statement}")
+                connection.execute(text(statement))
+    return statements
+
+
+if __name__ == "__main__":
+    applied = upgrade_schema()
+    print(f"[INFO] Schema up to date ({len(applied)} changes applied)")
@@ -1,7 +1,7 @@
 import uuid
 import json
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -28,6 +28,8 @@ class Batch(Base):
     default_definitions = Column(Text, nullable=True)  # JSON array
     positive_examples = Column(Text, nullable=True)  # JSON array
     negative_examples = Column(Text, nullable=True)  # JSON array
+    compiled_criteria = Column(Text, nullable=True)  # JSON array, default_definitions merged by the agent
+    compiled_criteria_hash = Column(String(64), nullable=True)  # hash of the definitions they were compiled from
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     status = Column(String(50), default="processing")  # processing, completed, failed
 
@@ -60,6 +62,20 @@ class Batch(Base):
         """Set positive_examples from list"""
         self.positive_examples = json.dumps(data) if data else None
 
+    def get_compiled_criteria(self):
+        """Parse compiled_criteria JSON string to list"""
+        if self.compiled_criteria:
+            try:
+                return json.loads(self.compiled_criteria)
+            except json.JSONDecodeError:
+                return []
+        return []
+
+    def set_compiled_criteria(self, data, criteria_hash):
+        """Set compiled_criteria from list, with the hash of the definitions they came from"""
+        self.compiled_criteria = json.dumps(data) if data else None
+        self.compiled_criteria_hash = criteria_hash
+
     def get_negative_examples(self):
         """Parse negative_examples JSON string to list"""
         if self.negative_examples:
@@ -79,16 +95,38 @@ class Job(Base):
 
     id = Column(String(length=36), primary_key=True, default=lambda: str(uuid.uuid4()))
     batch_id = Column(String(36), ForeignKey("batches.id"), nullable=False)
-    status = Column(String(length=100), default="pending")  # pending, processing, completed, failed
+    status = Column(String(length=100), default="pending", index=True)  # pending, claimed, transcribing, analysing, completed, failed
     original_filename = Column(String(255), nullable=True)
     original_file_path = Column(String(length=256), nullable=True)
+    content_hash = Column(String(64), nullable=True, index=True)  # sha256 of the uploaded bytes
+    transcript_id = Column(String(36), ForeignKey("transcripts.id"), nullable=True)
+    transcript_from_cache = Column(Boolean, nullable=False, default=False)
+    analysis_version = Column(Integer, nullable=False, default=0)  # latest completed AnalysisResult version
+    patch_duration_sec = Column(Integer, nullable=False, default=1800)
+    overlap_sec = Column(Integer, nullable=False, default=30)
+    chunking = Column(String(20), nullable=False, default="fixed")  # vad (speech regions) or fixed (time windows)
     transcript_text = Column(Text, nullable=True)
     analysis_result = Column(Text, nullable=True)  # JSON string of analysis spans
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Queue bookkeeping: the jobs table doubles as the work queue (see app.job_queue)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    available_at = Column(DateTime, nullable=True)  # earliest time a retry may be claimed (UTC)
+    claimed_by = Column(String(255), nullable=True)  # worker id holding the job
+    heartbeat_at = Column(DateTime, nullable=True)  # last sign of life from the claiming worker (UTC)
+    last_error = Column(Text, nullable=True)
     
     # Relationship to batch
     batch = relationship("Batch", back_populates="jobs")
+
+    # Stored transcript this job was analysed from
+    transcript = relationship("Transcript")
+
+    # Every analysis run, oldest first
+    analysis_results = relationship("AnalysisResult", back_populates="job", order_by="AnalysisResult.version",
+                                    cascade="all, delete-orphan")
     
     # Relationship to user feedback
     user_feedback = relationship("UserFeedback", back_populates="job", cascade="all, delete-orphan")
@@ -110,6 +148,39 @@ class Job(Base):
             self.analysis_result = None
 
 
+class Transcript(Base):
+    """Stored transcript of a media file, reusable by every job with the same bytes and settings"""
+    __tablename__ = "transcripts"
+
+    id = Column(String(length=36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    content_hash = Column(String(64), nullable=False, index=True)
+    whisper_model = Column(String(100), nullable=False)
+    compute_type = Column(String(50), nullable=False)
+    patch_duration_sec = Column(Integer, nullable=False)
+    overlap_sec = Column(Integer, nullable=False)
+    chunking = Column(String(20), nullable=False, default="fixed")
+    chunking_params = Column(String(64), nullable=True)  # hash of the VAD settings of "vad" chunks
+    language = Column(String(20), nullable=True)
+    path = Column(String(512), nullable=False)  # word-timeline directory (or legacy JSON file) with words and analysis chunks
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AnalysisResult(Base):
+    """One versioned analysis run of a job, with the criteria and examples it used"""
+    __tablename__ = "analysis_results"
+
+    id = Column(String(length=36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_id = Column(String(36), ForeignKey("jobs.id"), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    default_definitions = Column(Text, nullable=True)  # JSON array
+    positive_examples = Column(Text, nullable=True)  # JSON array
+    negative_examples = Column(Text, nullable=True)  # JSON array
+    path = Column(String(512), nullable=False)  # JSON file with transcript_text and spans
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    job = relationship("Job", back_populates="analysis_results")
+
+
 class UserFeedback(Base):
     """User feedback model for human-in-the-loop learning"""
     __tablename__ = "user_feedback"
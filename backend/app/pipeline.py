@@ -0,0 +1,103 @@
+"""
+Overlap transcription and analysis within one job.
+
+Whisper runs on a thread of its own, one patch at a time, while the event
+loop stitches each patch as it arrives and hands finished chunks to a few
+analysis workers over a bounded queue. When the agent falls behind, the
+queue fills and transcription waits, so at most ``PIPELINE_QUEUE_DEPTH``
+chunks are ever waiting for analysis. A job then takes roughly as long as
+its slower stage instead of the sum of both. A failed analysis does not stop
+transcription: the remaining chunks are drained unanalysed, so the
+transcript can still be stored for the retry, and the error is raised once
+Whisper is done.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.agent_client import AGENT_MAX_IN_FLIGHT_PER_JOB
+from app.stitching import PatchStitcher
+
+# Stitched chunks allowed to wait for an analysis worker before transcription pauses
+PIPELINE_QUEUE_DEPTH = int(os.getenv("PIPELINE_QUEUE_DEPTH", "2"))
+
+
+async def transcribe_and_analyse(patches: Iterator[dict], stitcher: PatchStitcher,
+                                 analyse: Callable[[int, dict], Awaitable[dict]],
+                                 on_chunk: Optional[Callable[[dict], None]] = None,
+                                 on_patch: Optional[Callable[[int], None]] = None,
+                                 on_transcribed: Optional[Callable[[dict], None]] = None) -> Tuple[List[dict], dict]:
+    """
+    Pull transcribed patches from the (blocking) patches iterator on a worker
+    thread, stitch them, and run analyse(chunk position, chunk) on each chunk
+    as soon as it is final, at most AGENT_MAX_IN_FLIGHT_PER_JOB at a time.
+    Returns (analysis results in chunk order, stitched transcript).
+    on_chunk sees each chunk before it is queued, on_patch the number of
+    patches transcribed so far, and on_transcribed the transcript once Whisper is done.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, PIPELINE_QUEUE_DEPTH))
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcribe")
+    n_workers = max(1, AGENT_MAX_IN_FLIGHT_PER_JOB)
+    results: Dict[int, dict] = {}
+    transcript: Dict[str, object] = {}
+    failures: List[BaseException] = []
+
+    async def _emit(chunk: Optional[dict]):
+        if chunk is None:
+            return
+        if on_chunk:
+            on_chunk(chunk)
+        await queue.put((len(stitcher.chunks) - 1, chunk))
+
+    async def _produce():
+        transcribed = 0
+        try:
+            while True:
+                patch = await loop.run_in_executor(executor, next, patches, None)
+                if patch is None:
+                    break
+                transcribed += 1
+                if on_patch:
+                    on_patch(transcribed)
+                await _emit(stitcher.add(patch))
+        finally:
+            # Runs after any next() still in progress on the thread, which ends ffmpeg if we bail out early
+            if hasattr(patches, "close"):
+                executor.submit(patches.close)
+            executor.shutdown(wait=False)
+
+        last_chunk, stitched = stitcher.finish()
+        transcript.update(stitched)
+        if on_transcribed:
+            on_transcribed(transcript)
+        await _emit(last_chunk)
+        for _ in range(n_workers):
+            await queue.put(None)
+
+    async def _consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if failures:
+                continue
+            position, chunk = item
+            try:
+                results[position] = await analyse(position, chunk)
+            except Exception as e:
+                failures.append(e)
+
+    tasks = [asyncio.ensure_future(_produce())] + [asyncio.ensure_future(_consume()) for _ in range(n_workers)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    if failures:
+        raise failures[0]
+    return [results[i] for i in range(len(results))], transcript
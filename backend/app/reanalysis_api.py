@@ -0,0 +1,76 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from typing import List
+from pathlib import Path
+from app.database import get_db
+from app.models import Batch, Job
+from app.schemas import ReanalysisRequest, ReanalysisResponse
+from app.feedback_api import collect_feedback_examples
+from app.job_queue import retry_job, ACTIVE_STATUSES
+
+router = APIRouter()
+
+
+def _merge_unique(*lists: List[str]) -> List[str]:
+    """Concatenate lists, dropping repeats but keeping first-seen order"""
+    seen = set()
+    merged = []
+    for items in lists:
+        for item in items:
+            if item not in seen:
+                seen.add(item)
+                merged.append(item)
+    return merged
+
+
+@router.post("/batch/{batch_id}/reanalyze", response_model=ReanalysisResponse)
+async def reanalyze_batch(batch_id: str, request: ReanalysisRequest, db: Session = Depends(get_db)):
+    """
+    Re-run only the detection stage for a batch (or selected jobs) on their
+    stored transcripts, using updated criteria and examples. Each run is saved
+    as a new analysis version; earlier versions stay readable.
+    """
+    batch = db.get(Batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    if request.job_ids is not None:
+        jobs = db.query(Job).filter(Job.batch_id == batch_id, Job.id.in_(request.job_ids)).all()
+        missing = set(request.job_ids) - {job.id for job in jobs}
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Jobs not found in this batch: {sorted(missing)}")
+    else:
+        jobs = list(batch.jobs)
+
+    queued = []
+    skipped = {}
+    for job in jobs:
+        if job.status == "pending" or job.status in ACTIVE_STATUSES:
+            skipped[job.id] = f"job is {job.status}"
+        elif job.transcript is None or not Path(job.transcript.path).exists():
+            skipped[job.id] = "no stored transcript"
+        else:
+            queued.append(job.id)
+
+    # Nothing to re-run: leave the batch's criteria and examples as they were
+    if not queued:
+        raise HTTPException(status_code=409, detail={"message": "No job can be re-analysed", "skipped": skipped})
+
+    # Update the batch's criteria and examples; workers read them when the job runs
+    if request.default_definitions is not None:
+        batch.set_default_definitions(request.default_definitions)
+
+    positive_examples = request.positive_examples if request.positive_examples is not None else batch.get_positive_examples()
+    negative_examples = request.negative_examples if request.negative_examples is not None else batch.get_negative_examples()
+    if request.include_feedback:
+        feedback_positive, feedback_negative = collect_feedback_examples(db, batch_id)
+        positive_examples = _merge_unique(positive_examples, feedback_positive)
+        negative_examples = _merge_unique(negative_examples, feedback_negative)
+    batch.set_positive_examples(positive_examples)
+    batch.set_negative_examples(negative_examples)
+
+    # The batch update is committed together with the first requeued job
+    for job_id in queued:
+        retry_job(db, job_id)
+
+    return ReanalysisResponse(batch_id=batch_id, queued_job_ids=queued, skipped=skipped)
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
+from typing import List, Optional
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Batch, Job
-from app.schemas import BatchResponse, JobAnalysisResult, AnalysisSpan, JobInfo
+from app.models import Batch, Job, AnalysisResult
+from app.schemas import BatchResponse, JobAnalysisResult, AnalysisSpan, JobInfo, AnalysisVersionInfo
+from app.analysis_results import get_result_path, read_partial_result
 import os
 import mimetypes
 import json
@@ -47,6 +49,18 @@ async def retrieve_file(job_id: str):
     )
 
 
+def _add_partial_result(job: Job, to_return: dict):
+    """Spans found so far by the streamed analysis, and how far each stage got."""
+    partial = read_partial_result(job)
+    if partial is not None:
+        to_return["partial_spans"] = partial.pop("spans", [])
+        to_return["transcription_progress"] = {
+            "patches_transcribed": partial.pop("patches_transcribed", None),
+            "done": partial.pop("transcription_done", job.status != "transcribing")
+        }
+        to_return["analysis_progress"] = partial
+
+
 @router.get("/{job_id}")
 async def retrieve_status_and_processed(job_id: str, db: Session = Depends(get_db)):
     """
@@ -58,9 +72,17 @@ async def retrieve_status_and_processed(job_id: str, db: Session = Depends(get_d
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    to_return = {"status": job.status}
+    to_return = {"status": job.status, "attempts": job.attempts}
+
+    if job.last_error:
+        to_return["last_error"] = job.last_error
+
+    if job.status in ("pending", "claimed"):
+        return to_return
 
     if job.status == "transcribing":
+        # Chunks are analysed while the rest of the file is still being transcribed
+        _add_partial_result(job, to_return)
         return to_return
 
     if not job.original_file_path:
@@ -74,14 +96,16 @@ async def retrieve_status_and_processed(job_id: str, db: Session = Depends(get_d
         to_return["transcript_text"] = ""
 
     if job.status == "analysing":
+        _add_partial_result(job, to_return)
         return to_return
 
-    json_path = Path(job.original_file_path).with_suffix('.json')
-    if json_path.exists():
+    json_path = get_result_path(db, job)
+    if json_path is not None and json_path.exists():
         with open(json_path, "r") as f:
             to_return["spans"] = json.load(f)
     else:
         to_return["spans"] = []
+    to_return["analysis_version"] = job.analysis_version
 
     return to_return
 
@@ -98,32 +122,35 @@ async def get_batch(batch_id: str, db: Session = Depends(get_db)):
         jobs.append(JobInfo(
             job_id=job.id,
             filename=job.original_filename or f"job_{job.id}",
-            status=job.status
+            status=job.status,
+            transcript_from_cache=bool(job.transcript_from_cache)
         ))
 
     return BatchResponse(
         name=batch.name,
         description=batch.description,
-        jobs=jobs
+        jobs=jobs,
+        cached_jobs=sum(1 for job in jobs if job.transcript_from_cache)
     )
 
 
 @router.get("/batch/{batch_id}/{job_id}", response_model=JobAnalysisResult)
-async def get_job_analysis(batch_id: str, job_id: str, db: Session = Depends(get_db)):
-    """Get job analysis results"""
+async def get_job_analysis(batch_id: str, job_id: str, version: Optional[int] = None, db: Session = Depends(get_db)):
+    """Get job analysis results (latest version unless a version is given)"""
     job = db.query(Job).filter(Job.id == job_id, Job.batch_id == batch_id).first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    if job.status != "completed":
+    # Older versions stay readable while a re-analysis is running
+    if version is None and job.status != "completed":
         raise HTTPException(status_code=400, detail=f"Job not completed yet. Current status: {job.status}")
 
     # Read analysis results from JSON file
     if not job.original_file_path:
         raise HTTPException(status_code=404, detail="Original file path not found")
 
-    json_path = Path(job.original_file_path).with_suffix('.json')
-    if not json_path.exists():
+    json_path = get_result_path(db, job, version)
+    if json_path is None or not json_path.exists():
         raise HTTPException(status_code=404, detail="Analysis results file not found")
 
     try:
@@ -157,10 +184,31 @@ async def get_job_analysis(batch_id: str, job_id: str, db: Session = Depends(get
     return JobAnalysisResult(
         audio_file_id=job.original_filename or job.id,
         transcript_text=analysis_data.get("transcript_text", ""),
-        spans=spans
+        spans=spans,
+        version=version or job.analysis_version
     )
 
 
+@router.get("/batch/{batch_id}/{job_id}/versions", response_model=List[AnalysisVersionInfo])
+async def get_job_analysis_versions(batch_id: str, job_id: str, db: Session = Depends(get_db)):
+    """List all analysis versions of a job with the criteria and examples each one used"""
+    job = db.query(Job).filter(Job.id == job_id, Job.batch_id == batch_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    results = db.query(AnalysisResult).filter(AnalysisResult.job_id == job_id).order_by(AnalysisResult.version).all()
+    return [
+        AnalysisVersionInfo(
+            version=result.version,
+            created_at=result.created_at,
+            default_definitions=json.loads(result.default_definitions or "[]"),
+            positive_examples=json.loads(result.positive_examples or "[]"),
+            negative_examples=json.loads(result.negative_examples or "[]")
+        )
+        for result in results
+    ]
+
+
 @router.get("/batch/{batch_id}/{job_id}/file")
 async def get_job_file(batch_id: str, job_id: str, db: Session = Depends(get_db)):
     """Get the original audio file for a job"""
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 class UserBase(BaseModel):
     """Base user schema"""
@@ -35,6 +35,7 @@ class JobInfo(BaseModel):
     job_id: str
     filename: str
     status: str
+    transcript_from_cache: bool = False
 
     class Config:
         from_attributes = True
@@ -45,6 +46,7 @@ class BatchResponse(BaseModel):
     name: str
     description: Optional[str] = None
     jobs: List[JobInfo]
+    cached_jobs: int = 0  # jobs whose transcript was reused from an earlier upload
 
     class Config:
         from_attributes = True
@@ -64,6 +66,7 @@ class JobAnalysisResult(BaseModel):
     audio_file_id: str
     transcript_text: str
     spans: List[AnalysisSpan]
+    version: int = 0
 
     class Config:
         from_attributes = True
@@ -109,3 +112,28 @@ class BatchFeedbackSummary(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class AnalysisVersionInfo(BaseModel):
+    """Schema for one analysis version of a job"""
+    version: int
+    created_at: Optional[datetime] = None
+    default_definitions: List[str]
+    positive_examples: List[str]
+    negative_examples: List[str]
+
+
+class ReanalysisRequest(BaseModel):
+    """Schema for re-running detection on stored transcripts"""
+    job_ids: Optional[List[str]] = None  # defaults to every job of the batch
+    default_definitions: Optional[List[str]] = None  # replaces the batch criteria when given
+    positive_examples: Optional[List[str]] = None
+    negative_examples: Optional[List[str]] = None
+    include_feedback: bool = True  # merge the batch's user feedback into the examples
+
+
+class ReanalysisResponse(BaseModel):
+    """Schema for re-analysis response"""
+    batch_id: str
+    queued_job_ids: List[str]
+    skipped: Dict[str, str]  # job_id -> reason
@@ -0,0 +1,117 @@
+"""
+Stitch overlapping patch transcripts into one transcript on the file's timeline.
+
+``transcribe_patches`` returns words with patch-relative timestamps, and the
+overlap between consecutive patches is transcribed twice. Here every word is
+shifted by its patch offset and each overlap is split at its midpoint: the
+earlier patch owns the words before the cut, the later patch the words after
+it. Each patch's owned range becomes one analysis chunk, so every second of
+audio is analysed exactly once. Kept words go straight into the columns of a
+growing word timeline.
+"""
+from typing import List, Optional, Tuple
+
+from app.word_timeline import TimelineBuilder, WordTimeline
+
+
+class PatchStitcher:
+    """
+    Incremental stitching for transcripts that arrive patch by patch.
+
+    A patch's chunk is final once the next patch is known (its offset fixes
+    the cut), so ``add`` returns the previous patch's chunk, if it has words,
+    and ``finish`` returns the last one together with the whole transcript.
+    """
+
+    def __init__(self):
+        self.words = TimelineBuilder()
+        self.chunks: List[dict] = []
+        self.language = "unknown"
+        self._prev_cut = float("-inf")
+        self._pending: Optional[Tuple[int, dict]] = None
+
+    def add(self, patch: dict) -> Optional[dict]:
+        chunk = None
+        if self._pending is not None:
+            i, previous = self._pending
+            # The cut between this patch and the next lies in the middle of their overlap
+            offset = previous.get("offset_sec", 0.0)
+            patch_end = offset + previous.get("duration_sec", 0.0)
+            cut = (patch.get("offset_sec", patch_end) + patch_end) / 2
+            chunk = self._close(i, previous, cut)
+        self._pending = (self._pending[0] + 1 if self._pending else 0, patch)
+        return chunk
+
+    def finish(self) -> Tuple[Optional[dict], dict]:
+        """(last chunk or None, transcript as returned by stitch_patches)."""
+        chunk = None
+        if self._pending is not None:
+            chunk = self._close(*self._pending, float("inf"))
+            self._pending = None
+        timeline = self.words.finish()
+        return chunk, {
+            "language": self.language,
+            "words": timeline,
+            "chunks": self.chunks,
+            "text": timeline.text(),
+        }
+
+    def timeline(self, start: int = 0, stop: Optional[int] = None) -> WordTimeline:
+        """View of the words stitched so far, e.g. of one chunk's word range."""
+        return self.words.timeline(start, stop)
+
+    def _close(self, i: int, patch: dict, cut: float) -> Optional[dict]:
+        offset = patch.get("offset_sec", 0.0)
+        if self.language == "unknown" and patch.get("language"):
+            self.language = patch["language"]
+
+        words = self.words
+        chunk_start = len(words)
+        last_end = words.last_end
+        chunk_first_start = None
+        texts = []
+        for word in patch["words"]:
+            start, end = word["start"] + offset, word["end"] + offset
+            mid = (start + end) / 2
+            if mid >= cut:
+                break
+            # Words before the previous cut belong to the previous patch; a word straddling
+            # the cut can show up in both patches, so also drop anything overlapping the last kept word
+            if mid < self._prev_cut or (last_end is not None and mid < last_end):
+                continue
+            words.append(word, offset)
+            if chunk_first_start is None:
+                chunk_first_start = start
+            last_end = end
+            texts.append(word["word"])
+
+        self._prev_cut = cut
+        if not texts:
+            return None
+        chunk = {
+            "index": i,
+            "start": chunk_first_start,
+            "end": last_end,
+            "word_start": chunk_start,
+            "word_end": len(words),
+            "text": " ".join(texts),
+        }
+        self.chunks.append(chunk)
+        return chunk
+
+
+def stitch_patches(patches: List[dict]) -> dict:
+    """
+    Merge patch results into a single deduplicated word stream.
+
+    Returns a dict with:
+      - language: language of the first patch that has one
+      - words: WordTimeline of the words with absolute timestamps and global ids
+      - chunks: per-patch analysis units {"index", "start", "end", "word_start", "word_end", "text"}
+        covering non-overlapping ranges of words
+      - text: the full transcript
+    """
+    stitcher = PatchStitcher()
+    for patch in patches:
+        stitcher.add(patch)
+    return stitcher.finish()[1]
@@ -1,58 +1,285 @@
-from pathlib import Path
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 import ffmpeg
-import soundfile as sf
-import librosa
+import numpy as np
 
+# Whisper works on 16 kHz mono audio; decode straight to that
+SAMPLE_RATE = 16000
+# Size of each read from the ffmpeg pipe
+STREAM_BLOCK_SEC = 30
 
-def convert_video_to_audio(video_path: str, output_audio_path: str) -> str:
-    video_path = Path(video_path)
-    audio_path = Path(output_audio_path)
-    audio_path.parent.mkdir(parents=True, exist_ok=True)
+# "vad" packs detected speech into chunks cut at pauses; "fixed" uses overlapping time windows
+CHUNKING_MODES = ("vad", "fixed")
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "vad")
+# Silero VAD settings; only pauses at least VAD_MIN_SILENCE_MS long separate speech regions
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.5"))
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "500"))
+VAD_SPEECH_PAD_MS = int(os.getenv("VAD_SPEECH_PAD_MS", "200"))
+
+
+def chunking_params(chunking: str) -> Optional[str]:
+    """Hash of the settings that shape "vad" chunks, so stored transcripts are only reused under the same ones."""
+    if chunking != "vad":
+        return None
+    params = {
+        "threshold": VAD_THRESHOLD,
+        "min_silence_ms": VAD_MIN_SILENCE_MS,
+        "speech_pad_ms": VAD_SPEECH_PAD_MS,
+        "block_sec": STREAM_BLOCK_SEC,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# (seconds into the chunk's samples, seconds into the file relative to the chunk offset) per speech piece
+TimeMap = List[Tuple[float, float]]
+
+
+def stream_audio(audio_path: str, sample_rate: int = SAMPLE_RATE, block_sec: float = STREAM_BLOCK_SEC) -> Iterator[np.ndarray]:
+    """
+    Decode any audio/video file with ffmpeg and yield mono float32 blocks of
+    at most block_sec seconds. Only one block is held in memory at a time.
+    """
+    process = (
+        ffmpeg
+        .input(str(audio_path))
+        .output('pipe:', format='f32le', acodec='pcm_f32le', ac=1, ar=sample_rate)
+        .global_args('-nostdin', '-loglevel', 'error')
+        .run_async(pipe_stdout=True)
+    )
+    block_bytes = int(block_sec * sample_rate) * 4
     try:
-        print(f"[INFO] Extracting audio from video: {video_path}")
-        stream = ffmpeg.input(str(video_path))
-        stream = ffmpeg.output(stream, str(output_audio_path), acodec='pcm_s16le', ac=1, ar='16k')
-        ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
-        print(f"[INFO] Converted video to audio: {output_audio_path}")
-        return str(output_audio_path)
-    except Exception as e:
-        print(f"[ERROR] Error converting video: {e}")
-        raise
-
-
-def split_audio_to_patches(audio_path: str, patch_duration_sec: int = 120, overlap_sec: int = 30):
-    print(f"[INFO] Loading audio for patching: {audio_path}")
-    y, sr = librosa.load(audio_path, sr=None)
-    total_duration = librosa.get_duration(y=y, sr=sr)
-    print(f"[INFO] Audio duration: {total_duration:.2f} seconds")
-    patch_samples = int(patch_duration_sec * sr)
-    overlap_samples = int(overlap_sec * sr)
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            usable = len(data) - len(data) % 4
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=np.float32)
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        returncode = process.wait()
+
+    if returncode not in (0, None):
+        raise RuntimeError(f"ffmpeg failed to decode {audio_path} (exit code {returncode})")
+
+
+def load_audio_window(audio_path: str, start_sec: float, duration_sec: float,
+                      sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode only [start_sec, start_sec + duration_sec) of a file; ffmpeg seeks instead of decoding from the start."""
+    out, _ = (
+        ffmpeg
+        .input(str(audio_path), ss=max(0.0, start_sec), t=duration_sec)
+        .output('pipe:', format='f32le', acodec='pcm_f32le', ac=1, ar=sample_rate)
+        .global_args('-nostdin', '-loglevel', 'error')
+        .run(capture_stdout=True)
+    )
+    return np.frombuffer(out[:len(out) - len(out) % 4], dtype=np.float32)
+
+
+def split_audio_to_patches(audio_path: str, patch_duration_sec: int = 120, overlap_sec: int = 30) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Stream overlapping windows of the decoded audio.
+    Yields (offset_sec, samples) pairs; memory use is bounded by one patch,
+    independent of the file length.
+    """
+    print(f"[INFO] Streaming audio for patching: {audio_path}")
+    patch_samples = int(patch_duration_sec * SAMPLE_RATE)
+    overlap_samples = min(int(overlap_sec * SAMPLE_RATE), patch_samples - 1)
     step = patch_samples - overlap_samples
-    patches = []
-    for start in range(0, len(y), step):
-        end = min(start + patch_samples, len(y))
-        patch_y = y[start:end]
-        patch_idx = len(patches)
-        patch_path = Path(audio_path).parent / f"patch_{patch_idx:03d}.wav"
-        sf.write(str(patch_path), patch_y, sr)
-        print(f"[INFO] Saved patch {patch_idx}: {patch_path} ({(end-start)/sr:.2f}s)")
-        patches.append(str(patch_path))
-        if end == len(y):
-            break
-    return patches
-
-
-def transcribe_patches(patches, model):
-    all_results = []
-    for i, patch_path in enumerate(patches):
-        print(f"[INFO] Transcribing patch {i}: {patch_path}")
+
+    window = np.empty(patch_samples, dtype=np.float32)
+    filled = 0
+    window_start = 0  # absolute sample index of window[0]
+    patch_idx = 0
+
+    for block in stream_audio(audio_path):
+        pos = 0
+        while pos < len(block):
+            take = min(patch_samples - filled, len(block) - pos)
+            window[filled:filled + take] = block[pos:pos + take]
+            filled += take
+            pos += take
+
+            if filled == patch_samples:
+                print(f"[INFO] Patch {patch_idx}: {window_start / SAMPLE_RATE:.2f}s ({patch_samples / SAMPLE_RATE:.2f}s)")
+                yield window_start / SAMPLE_RATE, window.copy()
+                patch_idx += 1
+                # Keep the overlap as the head of the next window
+                window[:overlap_samples] = window[step:]
+                filled = overlap_samples
+                window_start += step
+
+    # Tail: emit unless it is only the overlap already covered by the previous patch
+    if filled > 0 and (patch_idx == 0 or filled > overlap_samples):
+        print(f"[INFO] Patch {patch_idx}: {window_start / SAMPLE_RATE:.2f}s ({filled / SAMPLE_RATE:.2f}s)")
+        yield window_start / SAMPLE_RATE, window[:filled].copy()
+
+    total_duration = (window_start + filled) / SAMPLE_RATE
+    print(f"[INFO] Audio duration: {total_duration:.2f} seconds")
+
+
+def _silero_regions(block: np.ndarray) -> List[Tuple[int, int]]:
+    """Unpadded (start, end) sample ranges of speech in a block; pauses shorter than VAD_MIN_SILENCE_MS are bridged."""
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    options = VadOptions(threshold=VAD_THRESHOLD, min_silence_duration_ms=VAD_MIN_SILENCE_MS, speech_pad_ms=0)
+    return [(region["start"], region["end"]) for region in get_speech_timestamps(block, options)]
+
+
+def _pad_regions(regions: List[Tuple[int, int]], length: int, pad: int) -> List[Tuple[int, int]]:
+    """Regions widened by pad samples within [0, length), splitting shorter gaps between neighbours as Silero does."""
+    padded = []
+    for k, (start, end) in enumerate(regions):
+        before = pad if k == 0 else min(pad, (start - regions[k - 1][1]) // 2)
+        after = pad if k == len(regions) - 1 else min(pad, (regions[k + 1][0] - end) // 2)
+        padded.append((max(0, start - before), min(length, end + after)))
+    return padded
+
+
+def speech_chunks(blocks: Iterable[np.ndarray], max_chunk_sec: float,
+                  detect: Callable[[np.ndarray], List[Tuple[int, int]]] = _silero_regions
+                  ) -> Iterator[Tuple[float, np.ndarray, TimeMap]]:
+    """
+    Pack the speech regions detect() finds in consecutive audio blocks into
+    chunks, cut only in pauses of at least VAD_MIN_SILENCE_MS.
+
+    Pauses are measured between the unpadded regions, so every boundary
+    between regions of a block is a cut point; at a block boundary the gap is
+    measured across it, and speech that continues into the next block is never
+    cut. A chunk is closed at the last pause before it would exceed
+    max_chunk_sec, so it is longer only when speech runs that long without a
+    pause. Yields (offset_sec, samples, time_map) where time_map maps
+    positions in samples back to the file (see remap_time).
+    """
+    max_samples = int(max_chunk_sec * SAMPLE_RATE)
+    min_silence = VAD_MIN_SILENCE_MS * SAMPLE_RATE // 1000
+    pad = VAD_SPEECH_PAD_MS * SAMPLE_RATE // 1000
+
+    pieces: List[Tuple[int, np.ndarray]] = []  # (absolute start sample, padded samples) of the open chunk
+    chunk_samples = 0
+    run_start = 0  # first piece after the last pause in the open chunk
+    last_end: Optional[int] = None  # absolute end of the last unpadded region
+    block_start = 0
+    speech_samples = 0
+    chunk_idx = 0
+
+    def _take(count: int) -> Tuple[float, np.ndarray, TimeMap]:
+        nonlocal pieces, chunk_samples, run_start, chunk_idx
+        taken, pieces = pieces[:count], pieces[count:]
+        offset = taken[0][0]
+        time_map: TimeMap = []
+        position = 0
+        for start, samples in taken:
+            time_map.append((position / SAMPLE_RATE, (start - offset) / SAMPLE_RATE))
+            position += len(samples)
+        audio = np.concatenate([samples for _, samples in taken])
+        print(f"[INFO] Chunk {chunk_idx}: {offset / SAMPLE_RATE:.2f}s ({len(audio) / SAMPLE_RATE:.2f}s of speech in {len(taken)} regions)")
+        chunk_idx += 1
+        chunk_samples = sum(len(samples) for _, samples in pieces)
+        run_start = 0
+        return offset / SAMPLE_RATE, audio, time_map
+
+    for block in blocks:
+        regions = detect(block)
+        for (start, end), (padded_start, padded_end) in zip(regions, _pad_regions(regions, len(block), pad)):
+            paused = last_end is None or block_start + start - last_end >= min_silence
+            piece = block[padded_start:padded_end].copy()
+            if paused:
+                if pieces and chunk_samples + len(piece) > max_samples:
+                    yield _take(len(pieces))
+                run_start = len(pieces)
+            elif run_start > 0 and chunk_samples + len(piece) > max_samples:
+                # No pause here: close the chunk at the last one and carry the speech since then over
+                yield _take(run_start)
+            pieces.append((block_start + padded_start, piece))
+            chunk_samples += len(piece)
+            speech_samples += end - start
+            last_end = block_start + end
+        block_start += len(block)
+
+    if pieces:
+        yield _take(len(pieces))
+
+    total_duration = block_start / SAMPLE_RATE
+    ratio = speech_samples / block_start if block_start else 0.0
+    print(f"[INFO] Audio duration: {total_duration:.2f} seconds, {ratio:.0%} speech")
+
+
+def split_audio_to_speech_chunks(audio_path: str, max_chunk_sec: int = 1800) -> Iterator[Tuple[float, np.ndarray, TimeMap]]:
+    """
+    Stream speech-only chunks of the decoded audio (see speech_chunks).
+    Silero VAD runs over each streamed block as it is decoded, so no overlap
+    is needed and silence and music never reach Whisper.
+    """
+    print(f"[INFO] Streaming audio for VAD chunking: {audio_path}")
+    yield from speech_chunks(stream_audio(audio_path), max_chunk_sec)
+
+
+def split_audio(audio_path: str, patch_duration_sec: int, overlap_sec: int,
+                chunking: str = CHUNKING_MODE) -> Iterator[tuple]:
+    """Patches for transcribe_patches in the given chunking mode; overlap_sec only applies to "fixed"."""
+    if chunking == "vad":
+        return split_audio_to_speech_chunks(audio_path, patch_duration_sec)
+    return split_audio_to_patches(audio_path, patch_duration_sec, overlap_sec)
+
+
+def remap_time(t: float, time_map: Optional[TimeMap]) -> float:
+    """A time in a chunk's concatenated speech, as seconds from the chunk offset in the file."""
+    if not time_map:
+        return t
+    k = max(0, bisect_right(time_map, (t, float("inf"))) - 1)
+    position, file_time = time_map[k]
+    return file_time + (t - position)
+
+
+def _approximate_words(segment) -> Iterator[Tuple[str, float, float]]:
+    """
+    Words of a segment transcribed without word timestamps, with times
+    spread over the segment in proportion to their length.
+    """
+    words = segment.text.split()
+    total = sum(len(w) for w in words) or 1
+    duration = segment.end - segment.start
+    position = 0
+    for word in words:
+        start = segment.start + duration * position / total
+        position += len(word)
+        yield word, start, segment.start + duration * position / total
+
+
+def transcribe_patches(patches: Iterable[tuple], model, batch_size: int = 0, word_timestamps: bool = True):
+    """
+    Transcribe streamed patches, (offset_sec, samples) or (offset_sec, samples,
+    time_map) as yielded by split_audio. model is a WhisperModel, or a
+    BatchedInferencePipeline when batch_size > 1: the pipeline cuts each patch
+    into VAD chunks and decodes batch_size of them per inference call.
+    Without word_timestamps Whisper skips its alignment pass; word times are
+    then interpolated within each segment and the words marked approximate.
+    """
+    return list(iter_transcribed_patches(patches, model, batch_size, word_timestamps))
+
+
+def iter_transcribed_patches(patches: Iterable[tuple], model, batch_size: int = 0,
+                             word_timestamps: bool = True) -> Iterator[dict]:
+    """transcribe_patches as a generator: each patch result is yielded as soon as it is decoded."""
+    for i, (offset_sec, audio, *rest) in enumerate(patches):
+        # Speech-only chunks carry a map from their samples back to the file's timeline
+        time_map = rest[0] if rest else None
+        print(f"[INFO] Transcribing patch {i} at {offset_sec:.2f}s ({len(audio) / SAMPLE_RATE:.2f}s of audio)")
         
-        # faster-whisper returns (segments_generator, info)
+        # faster-whisper returns (segments_generator, info); numpy input must be 16 kHz mono
+        options = {"batch_size": batch_size} if batch_size > 1 else {}
         segments, info = model.transcribe(
-            patch_path,
-            word_timestamps=True,
+            audio,
+            word_timestamps=word_timestamps,
             vad_filter=True,
-            beam_size=1
+            beam_size=1,
+            **options
         )
         
         # Convert generator to list to allow iteration
@@ -79,12 +306,26 @@ def transcribe_patches(patches, model):
                     result["words"].append({
                         'id': word_id,
                         'word': word.word.strip(),
-                        'start': word.start,
-                        'end': word.end,
+                        'start': remap_time(word.start, time_map),
+                        'end': remap_time(word.end, time_map),
                         'probability': word.probability,
                         'phrase_text': segment.text,
-                        'phrase_start': segment.start,
-                        'phrase_end': segment.end
+                        'phrase_start': remap_time(segment.start, time_map),
+                        'phrase_end': remap_time(segment.end, time_map)
+                    })
+                    word_id += 1
+            elif not word_timestamps:
+                for word, start, end in _approximate_words(segment):
+                    result["words"].append({
+                        'id': word_id,
+                        'word': word,
+                        'start': remap_time(start, time_map),
+                        'end': remap_time(end, time_map),
+                        'probability': None,
+                        'approximate': True,
+                        'phrase_text': segment.text,
+                        'phrase_start': remap_time(segment.start, time_map),
+                        'phrase_end': remap_time(segment.end, time_map)
                     })
                     word_id += 1
         
@@ -92,6 +333,8 @@ def transcribe_patches(patches, model):
             'language': info.language if hasattr(info, 'language') else 'unknown',
             'words': result["words"],
             'patch_index': i,
+            'offset_sec': offset_sec,
+            'duration_sec': remap_time(len(audio) / SAMPLE_RATE, time_map),
             'patch_text': result["text"]
         }
         
@@ -101,6 +344,4 @@ def transcribe_patches(patches, model):
         if not result["words"]:
             print(f"[WARNING] No words detected in patch {i}. Text: '{result['text'][:100]}'")
         
-        all_results.append(patch_result)
-    
-    return all_results
\ No newline at end of file
+        yield patch_result
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Content-addressed transcript store.
+
+Uploads are hashed while they are written to disk. A finished transcript is
+saved under ``TRANSCRIPTS_DIR`` and registered in the ``transcripts`` table,
+keyed by (content hash, Whisper model, compute type, chunking mode and patch
+parameters), so a later job for the same bytes can skip transcription
+entirely. Speech-region ("vad") chunks have no overlap, so overlap_sec is not
+part of their key; a hash of the VAD settings that decide where they are cut
+is.
+
+Transcripts are stored as word-timeline directories (see ``app.word_timeline``)
+and memory-mapped on load; transcripts saved earlier as one JSON file are
+still read.
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import Transcript
+from app.transcribe import chunking_params
+from app.word_timeline import WordTimeline, load_transcript_dir, save_transcript_dir
+
+TRANSCRIPTS_DIR = Path(os.getenv("TRANSCRIPTS_DIR", "transcripts"))
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def save_upload(source: BinaryIO, target_path: Path) -> str:
+    """Copy an upload to disk and return the sha256 of its bytes, in one pass."""
+    digest = hashlib.sha256()
+    with open(target_path, "wb") as target:
+        while True:
+            chunk = source.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+    return digest.hexdigest()
+
+
+def _key_overlap(chunking: str, overlap_sec: int) -> int:
+    return 0 if chunking == "vad" else overlap_sec
+
+
+def find_transcript(db: Session, content_hash: Optional[str], whisper_model: str, patch_duration_sec: int,
+                    overlap_sec: int, compute_type: Optional[str] = None,
+                    chunking: str = "fixed") -> Optional[Transcript]:
+    """
+    Newest stored transcript for these bytes and settings. compute_type may be
+    None when the caller does not know which one the workers resolved to.
+    """
+    if not content_hash:
+        return None
+
+    query = db.query(Transcript).filter(
+        Transcript.content_hash == content_hash,
+        Transcript.whisper_model == whisper_model,
+        Transcript.patch_duration_sec == patch_duration_sec,
+        Transcript.overlap_sec == _key_overlap(chunking, overlap_sec),
+        Transcript.chunking == chunking,
+        Transcript.chunking_params == chunking_params(chunking)
+    )
+    if compute_type:
+        query = query.filter(Transcript.compute_type == compute_type)
+
+    for transcript in query.order_by(Transcript.created_at.desc()).all():
+        if Path(transcript.path).exists():
+            return transcript
+    return None
+
+
+def save_transcript(db: Session, content_hash: str, whisper_model: str, compute_type: str,
+                    patch_duration_sec: int, overlap_sec: int, transcript: dict,
+                    chunking: str = "fixed") -> Transcript:
+    TRANSCRIPTS_DIR.mkdir(parents=True, exist_ok=True)
+    transcript_id = str(uuid.uuid4())
+
+    # Write the directory first so a registered row always points at a complete transcript
+    path = TRANSCRIPTS_DIR / transcript_id
+    tmp_path = TRANSCRIPTS_DIR / f"{transcript_id}.tmp"
+    save_transcript_dir(transcript, tmp_path)
+    shutil.move(str(tmp_path), str(path))
+
+    row = Transcript(
+        id=transcript_id,
+        content_hash=content_hash,
+        whisper_model=whisper_model,
+        compute_type=compute_type,
+        patch_duration_sec=patch_duration_sec,
+        overlap_sec=_key_overlap(chunking, overlap_sec),
+        chunking=chunking,
+        chunking_params=chunking_params(chunking),
+        language=transcript.get("language"),
+        path=str(path)
+    )
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+
+def load_transcript(row: Transcript) -> dict:
+    path = Path(row.path)
+    if path.is_dir():
+        return load_transcript_dir(path)
+    with open(path, "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+    transcript["words"] = WordTimeline.from_words(transcript["words"])
+    return transcript
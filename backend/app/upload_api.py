@@ -1,4 +1,4 @@
-from fastapi import File, UploadFile, Form, routing, BackgroundTasks, Depends, HTTPException
+from fastapi import File, UploadFile, Form, routing, Depends, HTTPException
 from pathlib import Path
 from sqlalchemy.orm import Session
 from app.database import get_db
@@ -6,15 +6,18 @@ import shutil
 import zipfile
 import tempfile
 import json
-from typing import List, Optional
-from app.models import Job, Batch
-from app.background_tasks import main_background_function
+from typing import List, Optional, Tuple
+from app.models import Batch, Job
+from app.job_queue import enqueue_job, retry_job
+from app.transcript_store import save_upload, find_transcript
+from app.whisper_model import MODEL_SIZE, compute_type
+from app.transcribe import CHUNKING_MODE, CHUNKING_MODES
 
 router = routing.APIRouter()
 
 
-def extract_audio_from_zip(zip_file: UploadFile, extract_dir: Path) -> List[Path]:
-    """Extract audio/video files from a ZIP archive"""
+def extract_audio_from_zip(zip_file: UploadFile, extract_dir: Path) -> List[Tuple[Path, str]]:
+    """Extract audio/video files from a ZIP archive, returning (path, sha256) pairs"""
     audio_video_extensions = {'.mp3', '.wav', '.m4a', '.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm'}
     extracted_files = []
     
@@ -40,10 +43,10 @@ def extract_audio_from_zip(zip_file: UploadFile, extract_dir: Path) -> List[Path
                         safe_filename = file_path.name.replace(" ", "_")
                         extract_path = extract_dir / safe_filename
                         
-                        with zip_ref.open(file_info) as source, open(extract_path, 'wb') as target:
-                            shutil.copyfileobj(source, target)
+                        with zip_ref.open(file_info) as source:
+                            content_hash = save_upload(source, extract_path)
                         
-                        extracted_files.append(extract_path)
+                        extracted_files.append((extract_path, content_hash))
     
     Path(temp_zip.name).unlink()  # Clean up temp zip file
     return extracted_files
@@ -51,7 +54,6 @@ def extract_audio_from_zip(zip_file: UploadFile, extract_dir: Path) -> List[Path
 
 @router.post("")
 async def upload_batch(
-    background_tasks: BackgroundTasks,
     name: str = Form(...),
     description: Optional[str] = Form(None),
     default_definitions: str = Form("[]"),
@@ -60,6 +62,7 @@ async def upload_batch(
     files: List[UploadFile] = File(...),
     patch_duration_sec: int = Form(1800),
     overlap_sec: int = Form(30),
+    chunking: str = Form(CHUNKING_MODE),
     db: Session = Depends(get_db)
 ):
     """Upload multiple files as a batch for processing"""
@@ -67,6 +70,9 @@ async def upload_batch(
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
 
+    if chunking not in CHUNKING_MODES:
+        raise HTTPException(status_code=400, detail=f"chunking must be one of {', '.join(CHUNKING_MODES)}")
+
     # Create uploads directory
     uploads_dir = Path("uploads")
     uploads_dir.mkdir(parents=True, exist_ok=True)
@@ -108,8 +114,8 @@ async def upload_batch(
             
             try:
                 extracted_files = extract_audio_from_zip(uploaded_file, zip_extract_dir)
-                for extracted_file in extracted_files:
-                    all_files_to_process.append((extracted_file.name, extracted_file))
+                for extracted_file, content_hash in extracted_files:
+                    all_files_to_process.append((extracted_file.name, extracted_file, content_hash))
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Failed to extract ZIP file {uploaded_file.filename}: {str(e)}")
         else:
@@ -118,39 +124,57 @@ async def upload_batch(
             temp_filename = f"batch_{batch.id}_{file_path.stem}_{len(all_files_to_process)}{file_ext}"
             temp_path = uploads_dir / temp_filename
             
-            with open(temp_path, "wb") as f:
-                shutil.copyfileobj(uploaded_file.file, f)
+            # Hash while writing so identical media can reuse a stored transcript
+            content_hash = save_upload(uploaded_file.file, temp_path)
             
-            all_files_to_process.append((uploaded_file.filename, temp_path))
+            all_files_to_process.append((uploaded_file.filename, temp_path, content_hash))
     
     if not all_files_to_process:
         db.delete(batch)
         db.commit()
         raise HTTPException(status_code=400, detail="No valid audio/video files found")
     
-    # Create jobs for each file
-    for original_filename, file_path in all_files_to_process:
-        job = Job(
-            batch_id=batch.id,
-            original_filename=original_filename,
-            original_file_path=str(file_path),
-            status="pending"
+    # Queue a job for each file; the worker pool (app.worker) picks them up
+    job_ids = []
+    cached_jobs = 0
+    for original_filename, file_path, content_hash in all_files_to_process:
+        # Known media goes straight to analysis on the stored transcript
+        transcript = find_transcript(
+            db,
+            content_hash,
+            whisper_model=MODEL_SIZE,
+            patch_duration_sec=patch_duration_sec,
+            overlap_sec=overlap_sec,
+            compute_type=compute_type(),
+            chunking=chunking
         )
-        db.add(job)
-        db.commit()
-        db.refresh(job)
-        
-        # Launch background task for each job
-        background_tasks.add_task(
-            main_background_function,
-            str(job.id),
-            str(file_path),
-            patch_duration_sec,
-            overlap_sec,
+        job = enqueue_job(
             db,
-            default_defs_list,
-            positive_examples_list,
-            negative_examples_list
+            batch_id=batch.id,
+            original_filename=original_filename,
+            file_path=str(file_path),
+            patch_duration_sec=patch_duration_sec,
+            overlap_sec=overlap_sec,
+            content_hash=content_hash,
+            transcript_id=transcript.id if transcript else None,
+            chunking=chunking
         )
+        job_ids.append(job.id)
+        if transcript:
+            cached_jobs += 1
     
-    return {"batch_id": batch.id}
+    return {"batch_id": batch.id, "job_ids": job_ids, "cached_jobs": cached_jobs}
+
+
+@router.post("/job/{job_id}/retry")
+async def retry_failed_job(job_id: str, db: Session = Depends(get_db)):
+    """Put a failed job back in the queue with a fresh attempt budget"""
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.status != "failed":
+        raise HTTPException(status_code=400, detail=f"Only failed jobs can be retried. Current status: {job.status}")
+
+    retry_job(db, job_id)
+    return {"job_id": job_id, "status": "pending"}
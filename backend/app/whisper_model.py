@@ -0,0 +1,133 @@
+"""
+Lazily loaded Whisper model.
+
+Nothing is loaded at import time: the API process never touches Whisper, and
+each worker process loads the model on first use (or at start-up when
+``WHISPER_PRELOAD`` is set). The device/compute type that worked is written
+to ``WHISPER_DEVICE_CACHE`` so later processes skip the CUDA/Metal probe, and
+the API reads the same file to report readiness on ``/health``.
+"""
+import json
+import os
+import platform
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+MODEL_SIZE = os.getenv("WHISPER_MODEL", "base")
+# Batched inference: VAD-cut chunks of a patch are decoded together; 0 or 1 disables batching
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+# CTranslate2 threading: intra-op threads per decode (0 = library default) and parallel decoders
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+WHISPER_DEVICE_CACHE = Path(os.getenv("WHISPER_DEVICE_CACHE", ".whisper_device.json"))
+
+_lock = threading.Lock()
+_model = None
+_pipeline = None
+_device: Optional[str] = None
+_compute_type: Optional[str] = None
+
+
+def _read_probe() -> Optional[dict]:
+    try:
+        with open(WHISPER_DEVICE_CACHE, "r", encoding="utf-8") as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return probe if probe.get("model") == MODEL_SIZE else None
+
+
+def _write_probe(device: str, compute: str):
+    try:
+        with open(WHISPER_DEVICE_CACHE, "w", encoding="utf-8") as f:
+            json.dump({"model": MODEL_SIZE, "device": device, "compute_type": compute, "loaded_at": time.time()}, f)
+    except OSError as e:
+        print(f"[WARN] Could not cache Whisper device choice: {e}")
+
+
+def _candidates():
+    preferred = os.getenv("WHISPER_DEVICE")  # cuda | metal | cpu (optional)
+
+    if preferred:
+        ct_default = {"cuda": "float16", "metal": "float16", "cpu": "int8"}.get(preferred, "int8")
+        return [(preferred, os.getenv("WHISPER_COMPUTE", ct_default))]
+
+    candidates = [
+        ("cuda",  "float16"),
+        ("metal", "float16") if platform.system() == "Darwin" else None,
+        ("cpu",   os.getenv("WHISPER_COMPUTE", "int8")),
+    ]
+    candidates = [c for c in candidates if c]
+
+    # Try what worked last time first
+    probe = _read_probe()
+    if probe:
+        cached = (probe["device"], probe["compute_type"])
+        candidates = [cached] + [c for c in candidates if c != cached]
+    return candidates
+
+
+def _load():
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+    global _model, _pipeline, _device, _compute_type
+    last_err = None
+    for device, compute in _candidates():
+        try:
+            print(f"[INFO] Loading Whisper model: {MODEL_SIZE} (device={device}, compute={compute})")
+            _model = WhisperModel(
+                MODEL_SIZE,
+                device=device,
+                compute_type=compute,
+                cpu_threads=WHISPER_CPU_THREADS,
+                num_workers=WHISPER_NUM_WORKERS
+            )
+            _pipeline = BatchedInferencePipeline(model=_model) if WHISPER_BATCH_SIZE > 1 else None
+            _device, _compute_type = device, compute
+            _write_probe(device, compute)
+            print("[INFO] Whisper model loaded.")
+            return
+        except Exception as e:
+            print(f"[WARN] Failed on {device} ({compute}): {e}")
+            last_err = e
+
+    raise RuntimeError(f"Whisper init failed. Last error: {last_err}")
+
+
+def get_whisper():
+    """The process-wide WhisperModel, loaded on first call."""
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _load()
+    return _model
+
+
+def get_transcriber():
+    """(model_or_pipeline, batch_size) to hand to transcribe_patches."""
+    model = get_whisper()
+    if _pipeline is not None:
+        return _pipeline, WHISPER_BATCH_SIZE
+    return model, 0
+
+
+def compute_type() -> Optional[str]:
+    """Compute type in use, or the last probed one if this process has not loaded the model."""
+    if _compute_type:
+        return _compute_type
+    probe = _read_probe()
+    return probe["compute_type"] if probe else None
+
+
+def whisper_status() -> dict:
+    """Readiness summary for /health, based on this process and the shared probe file."""
+    probe = _read_probe()
+    return {
+        "model": MODEL_SIZE,
+        "loaded_in_process": _model is not None,
+        "ready": _model is not None or probe is not None,
+        "device": _device or (probe or {}).get("device"),
+        "compute_type": compute_type(),
+    }
@@ -0,0 +1,116 @@
+"""
+Lazy word-level alignment for flagged spans.
+
+With ``WORD_ALIGNMENT=lazy`` files are transcribed without Whisper's word
+timestamp pass, and word times are interpolated within each segment. Once the
+analysis is done, only the audio around each flagged span (its segments plus
+``ALIGN_WINDOW_PAD_SEC``) is decoded and re-transcribed with word timestamps,
+and the span's start and end are taken from the words found there. Window
+results are cached under ``ALIGN_CACHE_DIR`` per media hash, so re-analysing a
+file does not align the same window twice.
+"""
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.alignment import SpanAligner
+from app.transcribe import SAMPLE_RATE, load_audio_window
+from app.whisper_model import MODEL_SIZE, get_whisper
+from app.word_timeline import WordTimeline
+
+# eager: word timestamps for the whole file during transcription; lazy: only around flagged spans
+WORD_ALIGNMENT = os.getenv("WORD_ALIGNMENT", "eager")
+ALIGN_WINDOW_PAD_SEC = float(os.getenv("ALIGN_WINDOW_PAD_SEC", "1.0"))
+ALIGN_CACHE_DIR = Path(os.getenv("ALIGN_CACHE_DIR", "alignments"))
+
+
+def _window(words: WordTimeline, span: dict) -> Tuple[float, float, str]:
+    """(start, end) of the segments the span's words belong to, padded, and the span's transcript text."""
+    first = max(0, int(np.searchsorted(words.start, span["start"], side="right")) - 1)
+    window_start, window_end = span["start"], span["end"]
+    text = []
+    for word in words[first:]:
+        # Words that only touch the span's edges belong to the neighbouring segments
+        if word["start"] >= span["end"]:
+            break
+        if word["end"] <= span["start"]:
+            continue
+        window_start = min(window_start, word["phrase_start"])
+        window_end = max(window_end, word["phrase_end"])
+        text.append(word["word"])
+    # Rounded outwards so re-analyses hit the same cache entry
+    window_start = math.floor(max(0.0, window_start - ALIGN_WINDOW_PAD_SEC) * 10) / 10
+    window_end = math.ceil((window_end + ALIGN_WINDOW_PAD_SEC) * 10) / 10
+    return window_start, window_end, " ".join(text)
+
+
+def _cache_path(content_hash: str, start: float, end: float) -> Path:
+    return ALIGN_CACHE_DIR / f"{content_hash}-{MODEL_SIZE}-{round(start * 1000)}-{round(end * 1000)}.json"
+
+
+def window_words(audio_path: str, start: float, end: float, language: Optional[str] = None,
+                 content_hash: Optional[str] = None) -> List[dict]:
+    """Words with file-timeline timestamps for audio_path[start:end], from the cache when possible."""
+    cache_path = _cache_path(content_hash, start, end) if content_hash else None
+    if cache_path is not None and cache_path.exists():
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    audio = load_audio_window(audio_path, start, end - start)
+    print(f"[INFO] Aligning words in {start:.1f}-{end:.1f}s ({len(audio) / SAMPLE_RATE:.1f}s of audio)")
+    segments, _ = get_whisper().transcribe(
+        audio,
+        word_timestamps=True,
+        beam_size=1,
+        language=language if language and language != "unknown" else None
+    )
+    words = [
+        {"word": word.word.strip(), "start": start + word.start, "end": start + word.end, "probability": word.probability}
+        for segment in segments
+        for word in (segment.words or [])
+    ]
+
+    if cache_path is not None:
+        ALIGN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(words, f)
+        os.replace(tmp_path, cache_path)
+    return words
+
+
+def refine_spans(spans: List[dict], transcript: dict, audio_path: str,
+                 content_hash: Optional[str] = None) -> List[dict]:
+    """
+    Replace the interpolated start/end of each span with word-aligned times
+    from its audio window. Spans that cannot be aligned keep their times and
+    are marked approximate_timing.
+    """
+    words = transcript["words"]
+    windows: Dict[Tuple[float, float], List[dict]] = {}
+    refined = []
+
+    for span in spans:
+        start, end, text = _window(words, span)
+        try:
+            if (start, end) not in windows:
+                windows[(start, end)] = window_words(audio_path, start, end, transcript.get("language"), content_hash)
+            match = SpanAligner(windows[(start, end)]).locate(text or span["text"])
+        except Exception as e:
+            print(f"[WARN] Word alignment failed for {start:.1f}-{end:.1f}s: {e}")
+            match = None
+
+        if match is None:
+            refined.append({**span, "approximate_timing": True})
+            continue
+        first, last, _ = match
+        aligned = windows[(start, end)]
+        refined.append({**span, "start": aligned[first]["start"], "end": aligned[last]["end"]})
+
+    print(f"[INFO] Word-aligned {sum(not s.get('approximate_timing') for s in refined)}/{len(spans)} spans "
+          f"in {len(windows)} windows")
+    return refined
@@ -0,0 +1,292 @@
+"""
+Columnar word timeline of a transcript.
+
+Words are stored as parallel numpy arrays (start, end, probability, token id,
+phrase id, approximate flag) with two string tables: distinct word tokens and
+Whisper phrases (segment texts, with their start and end in their own
+arrays). A phrase is stored once however many words it has. On disk a
+timeline is a directory of ``.npy`` files, string tables as one UTF-8 blob
+plus offsets each, so loading is a memory map of the numeric columns rather
+than a JSON parse of one dict per word.
+
+Indexing a timeline with an int returns the word as the dict the rest of the
+backend works with; slicing returns a view sharing the same arrays.
+``TimelineBuilder`` grows the columns word by word, as stitching produces
+them, and hands out views of the rows written so far.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+COLUMN_DTYPES = {
+    "start": np.float64,
+    "end": np.float64,
+    "probability": np.float32,  # NaN when Whisper gave none (interpolated words)
+    "token": np.int32,
+    "phrase": np.int32,
+    "approximate": np.bool_,
+}
+PHRASE_DTYPES = {"phrase_start": np.float64, "phrase_end": np.float64}
+
+
+class StringTable:
+    """
+    Strings stored as one UTF-8 byte array and their end offsets. A table
+    built from a list of strings encodes them only when saved, and sees
+    strings appended to that list later.
+    """
+
+    def __init__(self, data: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None,
+                 strings: Optional[List[str]] = None):
+        self._data = data
+        self._offsets = offsets
+        self._strings = strings
+
+    @classmethod
+    def from_strings(cls, strings: List[str]) -> "StringTable":
+        return cls(strings=strings)
+
+    def _encode(self):
+        encoded = [s.encode("utf-8") for s in self._strings]
+        self._offsets = np.cumsum([len(b) for b in encoded], dtype=np.int64) if encoded else np.zeros(0, dtype=np.int64)
+        self._data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None or len(self._offsets) != len(self._strings):
+            self._encode()
+        return self._data
+
+    @property
+    def offsets(self) -> np.ndarray:
+        if self._offsets is None or len(self._offsets) != len(self._strings):
+            self._encode()
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self._strings) if self._strings is not None else len(self._offsets)
+
+    def strings(self) -> List[str]:
+        """All strings, decoded once on first use."""
+        if self._strings is None:
+            blob = self._data.tobytes()
+            starts = [0] + self._offsets[:-1].tolist()
+            self._strings = [blob[a:b].decode("utf-8") for a, b in zip(starts, self._offsets.tolist())]
+        return self._strings
+
+    def save(self, directory: Path, name: str):
+        np.save(directory / f"{name}.utf8.npy", self.data)
+        np.save(directory / f"{name}.offsets.npy", self.offsets)
+
+    @classmethod
+    def load(cls, directory: Path, name: str, mmap: bool = True) -> "StringTable":
+        mode = "r" if mmap else None
+        return cls(np.load(directory / f"{name}.utf8.npy", mmap_mode=mode),
+                   np.load(directory / f"{name}.offsets.npy", mmap_mode=mode))
+
+
+class WordTimeline:
+    """Words of a transcript as columns; see the module docstring."""
+
+    def __init__(self, columns: Dict[str, np.ndarray], tokens: StringTable, phrases: StringTable,
+                 phrase_columns: Dict[str, np.ndarray], base: int = 0):
+        self.columns = columns
+        self.tokens = tokens
+        self.phrases = phrases
+        self.phrase_columns = phrase_columns
+        # Global id of the first row, so slices keep the transcript's word ids
+        self.base = base
+
+    @classmethod
+    def from_words(cls, words: Sequence[dict]) -> "WordTimeline":
+        """Build from word dicts as produced by transcribe_patches and stitching."""
+        builder = TimelineBuilder(capacity=len(words))
+        for word in words:
+            builder.append(word)
+        return builder.finish()
+
+    def __len__(self) -> int:
+        return len(self.columns["start"])
+
+    @property
+    def start(self) -> np.ndarray:
+        return self.columns["start"]
+
+    @property
+    def end(self) -> np.ndarray:
+        return self.columns["end"]
+
+    def word_texts(self) -> List[str]:
+        """Text of every word, in order (references into the token table)."""
+        tokens = self.tokens.strings()
+        return [tokens[t] for t in self.columns["token"].tolist()]
+
+    def text(self) -> str:
+        """Words joined by single spaces, as stitching builds transcript and chunk texts."""
+        return " ".join(self.word_texts())
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[dict, "WordTimeline"]:
+        if isinstance(index, slice):
+            start, _, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("WordTimeline slices must be contiguous")
+            return WordTimeline({name: column[index] for name, column in self.columns.items()},
+                                self.tokens, self.phrases, self.phrase_columns, self.base + start)
+
+        if index < 0:
+            index += len(self)
+        columns = self.columns
+        phrase = int(columns["phrase"][index])
+        probability = float(columns["probability"][index])
+        word = {
+            "id": self.base + index,
+            "word": self.tokens.strings()[int(columns["token"][index])],
+            "start": float(columns["start"][index]),
+            "end": float(columns["end"][index]),
+            "probability": None if np.isnan(probability) else probability,
+            "phrase_text": self.phrases.strings()[phrase],
+            "phrase_start": float(self.phrase_columns["phrase_start"][phrase]),
+            "phrase_end": float(self.phrase_columns["phrase_end"][phrase]),
+        }
+        if columns["approximate"][index]:
+            word["approximate"] = True
+        return word
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def save(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, column in {**self.columns, **self.phrase_columns}.items():
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(column))
+        self.tokens.save(directory, "tokens")
+        self.phrases.save(directory, "phrases")
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> "WordTimeline":
+        mode = "r" if mmap else None
+        return cls(
+            {name: np.load(directory / f"{name}.npy", mmap_mode=mode) for name in COLUMN_DTYPES},
+            StringTable.load(directory, "tokens", mmap),
+            StringTable.load(directory, "phrases", mmap),
+            {name: np.load(directory / f"{name}.npy", mmap_mode=mode) for name in PHRASE_DTYPES}
+        )
+
+
+class TimelineBuilder:
+    """
+    Columns that grow as words are appended (capacity doubles when full), with
+    the token and phrase tables deduplicated as they go. Rows already written
+    never change, so views handed out earlier stay valid as the builder grows.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        capacity = max(1, capacity)
+        self._columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        self._phrase_columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in PHRASE_DTYPES.items()}
+        self._size = 0
+        self._phrase_count = 0
+        self._token_ids: Dict[str, int] = {}
+        self._phrase_ids: Dict[tuple, int] = {}
+        # Shared with every view's string tables, which therefore see later additions
+        self._token_list: List[str] = []
+        self._phrase_list: List[str] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_end(self) -> Optional[float]:
+        """End time of the last word appended, if any."""
+        return float(self._columns["end"][self._size - 1]) if self._size else None
+
+    @staticmethod
+    def _grow(columns: Dict[str, np.ndarray], needed: int):
+        capacity = len(next(iter(columns.values())))
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name, column in columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            columns[name] = grown
+
+    def append(self, word: dict, offset: float = 0.0) -> int:
+        """Append a word dict, shifting its times by offset; returns its row."""
+        i = self._size
+        self._grow(self._columns, i + 1)
+        columns = self._columns
+        columns["start"][i] = word["start"] + offset
+        columns["end"][i] = word["end"] + offset
+        probability = word.get("probability")
+        columns["probability"][i] = np.nan if probability is None else probability
+
+        token = word["word"]
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            token_id = self._token_ids[token] = len(self._token_list)
+            self._token_list.append(token)
+        columns["token"][i] = token_id
+
+        key = (word.get("phrase_text", ""), word.get("phrase_start", word["start"]) + offset,
+               word.get("phrase_end", word["end"]) + offset)
+        phrase_id = self._phrase_ids.get(key)
+        if phrase_id is None:
+            phrase_id = self._phrase_ids[key] = self._phrase_count
+            self._grow(self._phrase_columns, phrase_id + 1)
+            self._phrase_columns["phrase_start"][phrase_id] = key[1]
+            self._phrase_columns["phrase_end"][phrase_id] = key[2]
+            self._phrase_list.append(key[0])
+            self._phrase_count += 1
+        columns["phrase"][i] = phrase_id
+        columns["approximate"][i] = bool(word.get("approximate"))
+
+        self._size += 1
+        return i
+
+    def timeline(self, start: int = 0, stop: Optional[int] = None) -> WordTimeline:
+        """View of rows [start, stop) written so far, sharing the builder's arrays."""
+        stop = self._size if stop is None else min(stop, self._size)
+        return WordTimeline(
+            {name: column[start:stop] for name, column in self._columns.items()},
+            StringTable.from_strings(self._token_list),
+            StringTable.from_strings(self._phrase_list),
+            {name: column[:self._phrase_count] for name, column in self._phrase_columns.items()},
+            base=start
+        )
+
+    def finish(self) -> WordTimeline:
+        """The whole timeline, trimmed to its rows so unused capacity is released."""
+        return WordTimeline(
+            {name: column[:self._size].copy() for name, column in self._columns.items()},
+            StringTable.from_strings(self._token_list),
+            StringTable.from_strings(self._phrase_list),
+            {name: column[:self._phrase_count].copy() for name, column in self._phrase_columns.items()}
+        )
+
+
+def save_transcript_dir(transcript: dict, directory: Path):
+    """Write a transcript (language, words, chunks, ...) as a timeline directory plus meta.json."""
+    words = transcript["words"]
+    timeline = words if isinstance(words, WordTimeline) else WordTimeline.from_words(words)
+    timeline.save(directory)
+    # Transcript and chunk texts are rebuilt from the token table on load
+    meta = {key: value for key, value in transcript.items() if key not in ("words", "text")}
+    meta["chunks"] = [{k: v for k, v in chunk.items() if k != "text"} for chunk in transcript.get("chunks", [])]
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+
+def load_transcript_dir(directory: Path, mmap: bool = True) -> dict:
+    with open(directory / "meta.json", "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+    timeline = WordTimeline.load(directory, mmap)
+    texts = timeline.word_texts()
+    transcript["words"] = timeline
+    transcript["text"] = " ".join(texts)
+    for chunk in transcript.get("chunks", []):
+        chunk["text"] = " ".join(texts[chunk["word_start"]:chunk["word_end"]])
+    return transcript
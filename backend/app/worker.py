@@ -0,0 +1,119 @@
+"""
+Worker pool that drains the job queue.
+
+Run alongside the API:
+
+    python -m app.worker
+
+``WORKER_PROCESSES`` controls how many processes claim jobs in parallel. Each
+process loads Whisper once (see ``app.whisper_model``) and opens its own DB
+sessions, so transcription and analysis never run inside the API process.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+
+from app.database import SessionLocal
+from app.job_queue import (
+    JOB_HEARTBEAT_INTERVAL_SEC, claim_next_job, default_worker_id, fail_job, heartbeat, requeue_dead_worker_jobs,
+    requeue_stale_jobs
+)
+from app.migrate import upgrade_schema
+from app.background_tasks import main_background_function
+from app.whisper_model import get_whisper
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+WORKER_POLL_INTERVAL_SEC = float(os.getenv("WORKER_POLL_INTERVAL_SEC", "2"))
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "true").lower() == "true"
+STALE_CHECK_INTERVAL_SEC = 60
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+
+
+def _heartbeat_loop(job_id: str, done: threading.Event):
+    """Refresh the job's heartbeat on a timer, however long a single Whisper or agent call takes."""
+    while not done.wait(JOB_HEARTBEAT_INTERVAL_SEC):
+        try:
+            with SessionLocal() as db:
+                heartbeat(db, job_id)
+        except Exception as e:
+            print(f"[WARN] Heartbeat for job {job_id} failed: {e}")
+
+
+def run_worker(worker_index: int):
+    """Claim and run jobs until asked to stop."""
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    worker_id = f"{default_worker_id()}#{worker_index}"
+    print(f"[INFO] Worker {worker_id} started")
+
+    # Load Whisper before claiming work so the first job doesn't pay for it
+    if WHISPER_PRELOAD:
+        get_whisper()
+    last_stale_check = 0.0
+
+    while not _stopping:
+        with SessionLocal() as db:
+            if time.monotonic() - last_stale_check > STALE_CHECK_INTERVAL_SEC:
+                requeue_stale_jobs(db)
+                last_stale_check = time.monotonic()
+            job = claim_next_job(db, worker_id)
+            job_id = job.id if job else None
+
+        if job_id is None:
+            time.sleep(WORKER_POLL_INTERVAL_SEC)
+            continue
+
+        print(f"[INFO] Worker {worker_id} claimed job {job_id}")
+        done = threading.Event()
+        beat = threading.Thread(target=_heartbeat_loop, args=(job_id, done), daemon=True)
+        beat.start()
+        try:
+            main_background_function(job_id)
+        except Exception as e:
+            traceback.print_exc()
+            with SessionLocal() as db:
+                retried = fail_job(db, job_id, f"{type(e).__name__}: {e}")
+            print(f"[ERROR] Job {job_id} failed ({'requeued' if retried else 'giving up'}): {e}")
+        finally:
+            done.set()
+            beat.join()
+
+    print(f"[INFO] Worker {worker_id} stopped")
+
+
+def main():
+    upgrade_schema()
+    # Jobs left behind by a previous run of the pool on this host need not wait out the stale timeout
+    with SessionLocal() as db:
+        requeue_dead_worker_jobs(db)
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=run_worker, args=(i,), daemon=False) for i in range(WORKER_PROCESSES)]
+    for p in processes:
+        p.start()
+    print(f"[INFO] Started {len(processes)} worker processes")
+
+    def _forward(signum, frame):
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
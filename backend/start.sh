@@ -37,11 +37,14 @@ docker-compose up -d mysql
 sleep 5
 echo ""
 
-# Kill port and start backend
+# Kill port and start backend + workers
 echo "[4/4] Starting backend..."
 cd ${SCRIPT_DIR}
 lsof -ti:8000 | xargs kill -9 2>/dev/null || true
+pkill -f "app.worker" 2>/dev/null || true
 echo ""
+echo "Starting job workers (WORKER_PROCESSES=${WORKER_PROCESSES:-2})..."
+mamba run -n ${ENV_NAME} python -m app.worker &
 echo "Backend: http://localhost:8000"
 echo "Docs: http://localhost:8000/docs"
 echo ""
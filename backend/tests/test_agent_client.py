@@ -0,0 +1,174 @@
+"""Tests for app.agent_client against a local stand-in for the agent (httpx.MockTransport)."""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import agent_client
+
+_real_sleep = asyncio.sleep
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Route the client to a handler set by the test; records requests and retry delays."""
+    state = {"handler": None, "requests": [], "delays": []}
+
+    async def _handle(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(request)
+        return await state["handler"](request)
+
+    async def _sleep(delay, *args, **kwargs):
+        state["delays"].append(delay)
+        await _real_sleep(0)
+
+    monkeypatch.setattr(agent_client, "_client",
+                        httpx.AsyncClient(base_url="http://agent", transport=httpx.MockTransport(_handle)))
+    monkeypatch.setattr(agent_client, "_process_limit", asyncio.Semaphore(agent_client.AGENT_MAX_IN_FLIGHT_PER_PROCESS))
+    monkeypatch.setattr(agent_client, "AGENT_MAX_RETRIES", 2)
+    monkeypatch.setattr(agent_client.asyncio, "sleep", _sleep)
+    return state
+
+
+def _ndjson(*events) -> bytes:
+    return "".join(json.dumps(event) + "\n" for event in events).encode()
+
+
+def test_post_json_retries_overload_honouring_retry_after(agent):
+    replies = iter([
+        httpx.Response(429, headers={"Retry-After": "7"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"spans": [], "failed_segments": []}),
+    ])
+
+    async def handler(request):
+        return next(replies)
+
+    agent["handler"] = handler
+    result = asyncio.run(agent_client.post_json("/detect", {"transcription": "x"}))
+
+    assert result == {"spans": [], "failed_segments": []}
+    assert len(agent["requests"]) == 3
+    assert agent["delays"][0] == 7.0
+
+
+def test_post_json_gives_up_after_max_retries(agent):
+    async def handler(request):
+        return httpx.Response(503)
+
+    agent["handler"] = handler
+    with pytest.raises(agent_client.AgentError):
+        asyncio.run(agent_client.post_json("/detect", {"transcription": "x"}))
+    assert len(agent["requests"]) == agent_client.AGENT_MAX_RETRIES + 1
+
+
+def test_post_json_does_not_retry_client_errors(agent):
+    async def handler(request):
+        return httpx.Response(422, json={"detail": "bad request"})
+
+    agent["handler"] = handler
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(agent_client.post_json("/detect", {"transcription": "x"}))
+    assert len(agent["requests"]) == 1
+
+
+def test_post_json_retries_transport_errors(agent):
+    calls = {"n": 0}
+
+    async def handler(request):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    agent["handler"] = handler
+    assert asyncio.run(agent_client.post_json("/detect", {})) == {"ok": True}
+    assert calls["n"] == 2
+
+
+def test_detect_stream_delivers_each_segment_once_across_retries(agent):
+    span_a = {"text": "a", "start_char": 0, "end_char": 1}
+    span_b = {"text": "b", "start_char": 5, "end_char": 6}
+    bodies = iter([
+        # Broken off after the first segment, without a "done" event
+        _ndjson({"event": "segment", "segment_index": 0, "spans": [span_a]}),
+        _ndjson(
+            {"event": "segment", "segment_index": 0, "spans": [span_a]},
+            {"event": "segment", "segment_index": 1, "spans": [span_b]},
+            {"event": "done", "failed_segments": [], "skipped_segments": [2]},
+        ),
+    ])
+
+    async def handler(request):
+        assert request.url.path == "/detect/stream"
+        return httpx.Response(200, content=next(bodies))
+
+    agent["handler"] = handler
+    seen = []
+    result = asyncio.run(agent_client.detect_stream("a ... b", on_segment=lambda event: seen.append(event["segment_index"])))
+
+    assert seen == [0, 1]
+    assert result == {"spans": [span_a, span_b], "failed_segments": [], "skipped_segments": [2]}
+
+
+def test_detect_stream_retries_on_error_event(agent):
+    bodies = iter([
+        _ndjson({"event": "error", "detail": "model unavailable"}),
+        _ndjson({"event": "done", "failed_segments": []}),
+    ])
+
+    async def handler(request):
+        return httpx.Response(200, content=next(bodies))
+
+    agent["handler"] = handler
+    result = asyncio.run(agent_client.detect_stream("x"))
+    assert result == {"spans": [], "failed_segments": [], "skipped_segments": []}
+    assert len(agent["requests"]) == 2
+
+
+def test_detect_batch_splits_requests_and_keeps_order(agent, monkeypatch):
+    monkeypatch.setattr(agent_client, "AGENT_BATCH_MAX_ITEMS", 2)
+
+    async def handler(request):
+        items = json.loads(request.content)["items"]
+        return httpx.Response(200, json={
+            "results": {item["id"]: [{"text": item["transcription"]}] for item in items},
+            "failed_segments": {items[0]["id"]: [{"segment_index": 0, "error": "unparseable reply"}]},
+            "skipped_segments": {},
+        })
+
+    agent["handler"] = handler
+    results = asyncio.run(agent_client.detect_batch(["t0", "t1", "t2"]))
+
+    assert len(agent["requests"]) == 2
+    assert [r["spans"] for r in results] == [[{"text": "t0"}], [{"text": "t1"}], [{"text": "t2"}]]
+    assert [len(r["failed_segments"]) for r in results] == [1, 0, 1]
+
+
+def test_in_flight_requests_bounded_per_process(agent, monkeypatch):
+    monkeypatch.setattr(agent_client, "AGENT_MAX_IN_FLIGHT_PER_JOB", 4)
+    monkeypatch.setattr(agent_client, "_process_limit", asyncio.Semaphore(2))
+    load = {"now": 0, "peak": 0}
+
+    async def handler(request):
+        load["now"] += 1
+        load["peak"] = max(load["peak"], load["now"])
+        await _real_sleep(0.01)
+        load["now"] -= 1
+        return httpx.Response(200, json={"spans": [], "failed_segments": []})
+
+    agent["handler"] = handler
+    results = asyncio.run(agent_client.detect_many(["a", "b", "c", "d", "e", "f"]))
+
+    assert len(results) == 6
+    assert load["peak"] == 2
+
+
+def test_compile_criteria_reports_fallback(agent):
+    async def handler(request):
+        criteria = json.loads(request.content)["criteria"]
+        return httpx.Response(200, json={"criteria": criteria, "criteria_hash": "h", "cached": False, "compiled": False})
+
+    agent["handler"] = handler
+    assert asyncio.run(agent_client.compile_criteria(["a", "b"])) == (["a", "b"], False)
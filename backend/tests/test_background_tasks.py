@@ -0,0 +1,63 @@
+"""Tests for app.background_tasks with Whisper and the agent replaced by local stand-ins."""
+import asyncio
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import agent_client, background_tasks, transcript_store
+from app.database import Base
+from app.job_queue import claim_next_job, enqueue_job
+from app.models import Batch, Job, Transcript
+
+
+def _fake_process_file(path, patch_duration_sec, overlap_sec, chunking="fixed", word_timestamps=True):
+    for i in range(3):
+        words = [
+            {"word": word, "start": k * 1.0, "end": k * 1.0 + 0.5, "probability": 1.0,
+             "phrase_text": "", "phrase_start": 0.0, "phrase_end": 4.0}
+            for k, word in enumerate(f"patch{i} we must go".split())
+        ]
+        yield {"language": "en", "words": words, "offset_sec": i * 4.0, "duration_sec": 6.0}
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(background_tasks, "SessionLocal", factory)
+    monkeypatch.setattr(background_tasks, "process_file", _fake_process_file)
+    monkeypatch.setattr(background_tasks, "compute_type", lambda: "int8")
+    monkeypatch.setattr(background_tasks, "CRITERIA_COMPILE", False)
+    monkeypatch.setattr(transcript_store, "TRANSCRIPTS_DIR", tmp_path / "transcripts")
+    return factory
+
+
+def test_transcript_is_stored_when_analysis_fails(session_factory, tmp_path, monkeypatch):
+    async def handler(request):
+        return httpx.Response(500, json={"detail": "agent down"})
+
+    monkeypatch.setattr(agent_client, "_client",
+                        httpx.AsyncClient(base_url="http://agent", transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(agent_client, "_process_limit", asyncio.Semaphore(4))
+
+    media = tmp_path / "a.mp3"
+    media.write_bytes(b"x")
+    with session_factory() as db:
+        batch = Batch(name="b")
+        db.add(batch)
+        db.commit()
+        job_id = enqueue_job(db, batch.id, "a.mp3", str(media), 6, 2, content_hash="h").id
+        claim_next_job(db, "worker")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        background_tasks.main_background_function(job_id)
+
+    with session_factory() as db:
+        stored = db.query(Transcript).filter(Transcript.content_hash == "h").one()
+        assert db.get(Job, job_id).transcript_id == stored.id
+        transcript = transcript_store.load_transcript(stored)
+        assert transcript["text"].startswith("patch0 we must go")
+        assert transcript["word_timestamps"] is True
@@ -0,0 +1,64 @@
+"""Tests for POST /batch/{batch_id}/reanalyze, called directly with a SQLite session."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Batch, Job, Transcript
+from app.reanalysis_api import reanalyze_batch
+from app.schemas import ReanalysisRequest
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as session:
+        yield session
+
+
+def _batch(db, tmp_path, statuses):
+    batch = Batch(name="b")
+    batch.set_default_definitions(["old"])
+    db.add(batch)
+    db.commit()
+    stored = tmp_path / "transcript"
+    stored.mkdir()
+    transcript = Transcript(content_hash="h", whisper_model="m", compute_type="int8",
+                            patch_duration_sec=6, overlap_sec=0, path=str(stored))
+    db.add(transcript)
+    db.commit()
+    for status in statuses:
+        db.add(Job(batch_id=batch.id, original_filename="a.mp3", original_file_path="a.mp3", status=status,
+                   transcript_id=transcript.id))
+    db.commit()
+    return batch
+
+
+def test_criteria_unchanged_when_every_job_is_skipped(db, tmp_path):
+    batch = _batch(db, tmp_path, ["pending", "transcribing"])
+    request = ReanalysisRequest(default_definitions=["new"], positive_examples=["p"])
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(reanalyze_batch(batch.id, request, db))
+
+    assert raised.value.status_code == 409
+    assert len(raised.value.detail["skipped"]) == 2
+    db.expire_all()
+    assert batch.get_default_definitions() == ["old"]
+    assert batch.get_positive_examples() == []
+
+
+def test_criteria_saved_with_the_requeued_jobs(db, tmp_path):
+    batch = _batch(db, tmp_path, ["completed", "pending"])
+    request = ReanalysisRequest(default_definitions=["new"])
+
+    response = asyncio.run(reanalyze_batch(batch.id, request, db))
+
+    assert len(response.queued_job_ids) == 1 and len(response.skipped) == 1
+    db.expire_all()
+    assert batch.get_default_definitions() == ["new"]
+    assert db.get(Job, response.queued_job_ids[0]).status == "pending"
@@ -0,0 +1,106 @@
+"""Tests for VAD chunking in app.transcribe, on a synthetic signal with a stand-in for Silero."""
+import numpy as np
+import pytest
+
+from app import transcribe
+from app.transcribe import SAMPLE_RATE, speech_chunks
+
+MIN_SILENCE_MS = 500
+PAD_MS = 200
+BLOCK_SEC = 10
+MAX_CHUNK_SEC = 10
+
+
+def _energy_vad(block: np.ndarray):
+    """Unpadded speech regions by frame energy, bridging pauses shorter than MIN_SILENCE_MS like Silero."""
+    frame = SAMPLE_RATE // 100
+    n = len(block) // frame
+    active = np.abs(block[:n * frame]).reshape(n, frame).max(axis=1) > 0.1
+    regions = []
+    k = 0
+    while k < n:
+        if not active[k]:
+            k += 1
+            continue
+        start = k
+        while k < n and active[k]:
+            k += 1
+        regions.append([start * frame, k * frame])
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < MIN_SILENCE_MS * SAMPLE_RATE // 1000:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+    return [tuple(region) for region in merged]
+
+
+def _signal(speech):
+    """Tone wherever speech has an interval (in seconds), silence elsewhere."""
+    total = max(end for _, end in speech) + 2.0
+    audio = np.zeros(int(total * SAMPLE_RATE), dtype=np.float32)
+    t = np.arange(len(audio)) / SAMPLE_RATE
+    for start, end in speech:
+        a, b = int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)
+        audio[a:b] = 0.5 * np.sin(2 * np.pi * 220 * t[a:b])
+    return audio
+
+
+def _file_span(offset, audio, time_map):
+    position, file_time = time_map[-1]
+    return offset, offset + file_time + len(audio) / SAMPLE_RATE - position
+
+
+@pytest.fixture(autouse=True)
+def vad_settings(monkeypatch):
+    monkeypatch.setattr(transcribe, "VAD_MIN_SILENCE_MS", MIN_SILENCE_MS)
+    monkeypatch.setattr(transcribe, "VAD_SPEECH_PAD_MS", PAD_MS)
+
+
+def _chunks(audio):
+    block = BLOCK_SEC * SAMPLE_RATE
+    blocks = [audio[i:i + block] for i in range(0, len(audio), block)]
+    return list(speech_chunks(blocks, MAX_CHUNK_SEC, detect=_energy_vad))
+
+
+def test_chunks_cut_only_in_pauses_and_respect_max_length():
+    # 3 s of speech, then 0.6 s pauses: just over MIN_SILENCE_MS, well under it plus the padding on both sides
+    speech = []
+    t = 0.5
+    while t < 60:
+        speech.append((t, t + 3.0))
+        t += 3.6
+    chunks = _chunks(_signal(speech))
+
+    spans = [_file_span(*chunk) for chunk in chunks]
+    for start, end in speech:
+        # Every speech interval lies whole inside one chunk
+        assert any(s <= start and end <= e for s, e in spans), (start, end, spans)
+    for offset, audio, _ in chunks:
+        assert len(audio) / SAMPLE_RATE <= MAX_CHUNK_SEC
+    # Short pauses are usable cut points, so chunks are packed close to the limit
+    assert all(len(audio) / SAMPLE_RATE > MAX_CHUNK_SEC / 2 for _, audio, _ in chunks[:-1])
+
+
+def test_speech_across_block_boundaries_is_never_cut():
+    # 25 s without a pause crosses two block boundaries and exceeds the chunk limit
+    speech = [(1.0, 4.0), (4.7, 7.5), (8.5, 33.5), (34.2, 37.0)]
+    chunks = _chunks(_signal(speech))
+    spans = [_file_span(*chunk) for chunk in chunks]
+
+    for start, end in speech:
+        assert any(s <= start and end <= e for s, e in spans), (start, end, spans)
+    long_run = [audio for offset, audio, _ in chunks if offset <= 8.5 < offset + len(audio) / SAMPLE_RATE]
+    assert len(long_run) == 1
+    # Only the pause-free run itself may exceed the limit, plus its padding
+    assert len(long_run[0]) / SAMPLE_RATE <= 25.0 + 2 * PAD_MS / 1000
+    for audio in (audio for _, audio, _ in chunks if audio is not long_run[0]):
+        assert len(audio) / SAMPLE_RATE <= MAX_CHUNK_SEC
+
+
+def test_time_map_points_back_to_the_file():
+    speech = [(1.0, 2.0), (5.0, 6.0)]
+    (offset, audio, time_map), = _chunks(_signal(speech))
+    assert transcribe.remap_time(0.0, time_map) + offset == pytest.approx(1.0 - PAD_MS / 1000)
+    second_piece = time_map[1][0]
+    assert transcribe.remap_time(second_piece, time_map) + offset == pytest.approx(5.0 - PAD_MS / 1000)
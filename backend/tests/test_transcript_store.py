@@ -0,0 +1,41 @@
+"""Tests for the reuse key of app.transcript_store."""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import transcribe, transcript_store
+from app.database import Base
+from app.transcript_store import find_transcript, save_transcript
+
+TRANSCRIPT = {"language": "en", "text": "we must go", "word_timestamps": True, "chunks": [], "words": [
+    {"word": word, "start": k * 1.0, "end": k * 1.0 + 0.5, "probability": 1.0,
+     "phrase_text": "we must go", "phrase_start": 0.0, "phrase_end": 3.0}
+    for k, word in enumerate("we must go".split())
+]}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcript_store, "TRANSCRIPTS_DIR", tmp_path / "transcripts")
+    engine = create_engine(f"sqlite:///{tmp_path / 'db.sqlite'}")
+    Base.metadata.create_all(engine)
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as session:
+        yield session
+
+
+@pytest.mark.parametrize("setting, value", [
+    ("VAD_MIN_SILENCE_MS", 1000), ("VAD_SPEECH_PAD_MS", 50), ("VAD_THRESHOLD", 0.7),
+])
+def test_vad_transcript_not_reused_under_other_vad_settings(db, monkeypatch, setting, value):
+    stored = save_transcript(db, "h", "small", "int8", 600, 30, TRANSCRIPT, "vad")
+    assert find_transcript(db, "h", "small", 600, 10, "int8", "vad").id == stored.id
+
+    monkeypatch.setattr(transcribe, setting, value)
+    assert find_transcript(db, "h", "small", 600, 30, "int8", "vad") is None
+
+
+def test_fixed_transcript_ignores_vad_settings(db, monkeypatch):
+    stored = save_transcript(db, "h", "small", "int8", 600, 30, TRANSCRIPT, "fixed")
+    monkeypatch.setattr(transcribe, "VAD_MIN_SILENCE_MS", 1000)
+    assert find_transcript(db, "h", "small", 600, 30, "int8", "fixed").id == stored.id
+    assert find_transcript(db, "h", "small", 600, 30, "int8", "vad") is None
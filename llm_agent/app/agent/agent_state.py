@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Tuple
 
 
 class AgentState(BaseModel):
@@ -7,8 +7,12 @@ class AgentState(BaseModel):
 
     transcription: str = ""
     transcription_segments: List[str] = Field(default_factory=list)
+    # (start, end) character offsets of each segment in transcription
+    segment_offsets: List[Tuple[int, int]] = Field(default_factory=list)
+    prescreen_skipped: List[int] = Field(default_factory=list)
     default_definitions: List[str] = Field(default_factory=list)
     positive_examples: List[str] = Field(default_factory=list)
     negative_examples: List[str] = Field(default_factory=list)
     messages: list = Field(default_factory=list)
     response: str = ""
+    failed_segments: List[dict] = Field(default_factory=list)
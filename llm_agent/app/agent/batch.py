@@ -0,0 +1,101 @@
+"""Detection over many transcriptions that share criteria and examples."""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from .agent_state import AgentState
+from .nodes import segment_transcription, prescreen_node, content_check_node
+
+logger = logging.getLogger(__name__)
+
+
+def _shift_spans(segments: List[Tuple[List[dict], int]]) -> List[dict]:
+    """Concatenate (spans, segment start) pairs with absolute offsets, keeping each offset range once."""
+    shifted = []
+    seen = set()
+    for spans, start in segments:
+        for span in spans:
+            if span.get("start_char") is not None:
+                span = {**span, "start_char": span["start_char"] + start, "end_char": span["end_char"] + start}
+                key = (span["start_char"], span["end_char"])
+                if key in seen:
+                    continue
+                seen.add(key)
+            shifted.append(span)
+    return shifted
+
+
+async def detect_batch(transcriptions: Dict[str, str], default_definitions: List[str],
+                       positive_examples: List[str], negative_examples: List[str],
+                       configurable: Optional[dict] = None) -> Tuple[Dict[str, List[dict]], Dict[str, int]]:
+    """
+    Segment every transcription, score each distinct segment once as one pool
+    of model calls, and return the spans per transcription ID in segment order,
+    with counts of total and unique segments and the failed and pre-screened
+    segments per ID.
+    """
+    base = AgentState(
+        default_definitions=default_definitions,
+        positive_examples=positive_examples,
+        negative_examples=negative_examples
+    )
+    config = {"configurable": dict(configurable or {})}
+
+    # Segment each input the same way /detect would
+    segment_ids: Dict[str, List[int]] = {}
+    segment_starts: Dict[str, List[int]] = {}
+    unique_index: Dict[str, int] = {}
+    unique_segments: List[str] = []
+    for item_id, text in transcriptions.items():
+        result = await segment_transcription(base.model_copy(update={"transcription": text}), config=config)
+        ids = []
+        for segment in result["transcription_segments"]:
+            if segment not in unique_index:
+                unique_index[segment] = len(unique_segments)
+                unique_segments.append(segment)
+            ids.append(unique_index[segment])
+        segment_ids[item_id] = ids
+        segment_starts[item_id] = [start for start, _ in result["segment_offsets"]]
+
+    segments_total = sum(len(ids) for ids in segment_ids.values())
+    logger.info(
+        f"→ BATCH DETECT: {len(transcriptions)} inputs, {segments_total} segments, "
+        f"{len(unique_segments)} unique"
+    )
+
+    # One content check over the distinct segments; the scheduler spreads the calls over the model
+    unique_spans: List[List[dict]] = [[] for _ in unique_segments]
+    unique_errors: Dict[int, str] = {}
+    unique_skipped: set = set()
+
+    def _on_segment_result(index: int, spans: List[dict], total: int, error: Optional[str] = None):
+        unique_spans[index] = spans
+        if error is not None:
+            unique_errors[index] = error
+
+    if unique_segments:
+        config["configurable"]["on_segment_result"] = _on_segment_result
+        state = base.model_copy(update={"transcription_segments": unique_segments})
+        state = state.model_copy(update=await prescreen_node(state, config=config))
+        unique_skipped.update(state.prescreen_skipped)
+        await content_check_node(state, config=config)
+
+    # Unique segments are resolved relative to themselves; shift offsets to each input's position
+    results = {
+        item_id: _shift_spans([(unique_spans[i], start) for i, start in zip(ids, segment_starts[item_id])])
+        for item_id, ids in segment_ids.items()
+    }
+    failed_segments = {
+        item_id: [{"segment_index": n, "error": unique_errors[i]} for n, i in enumerate(ids) if i in unique_errors]
+        for item_id, ids in segment_ids.items()
+    }
+    skipped_segments = {
+        item_id: [n for n, i in enumerate(ids) if i in unique_skipped]
+        for item_id, ids in segment_ids.items()
+    }
+    return results, {
+        "segments_total": segments_total,
+        "unique_segments": len(unique_segments),
+        "failed_segments": {item_id: failed for item_id, failed in failed_segments.items() if failed},
+        "skipped_segments": {item_id: skipped for item_id, skipped in skipped_segments.items() if skipped}
+    }
@@ -0,0 +1,230 @@
+"""Persistent content-addressed cache for LLM responses."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from .scheduler import scheduled_abatch
+from .utils import get_model_name, LLM_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "200000"))
+LLM_CACHE_MAX_AGE_SEC = int(os.getenv("LLM_CACHE_MAX_AGE_SEC", str(30 * 24 * 3600)))
+
+# Run eviction every N writes rather than on every insert
+_EVICT_EVERY = 200
+# Write deferred last_used_at updates at the latest after this many hits
+_TOUCH_FLUSH_EVERY = 500
+# Stay under SQLite's default limit of bound parameters per statement
+_MAX_SQL_PARAMS = 900
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of model replies.
+
+    Keys hash the model name, the generation options and the fully rendered
+    messages. The rendered messages contain the segment text, criteria,
+    examples and both prompt templates, so a change to any of them is a miss.
+    Entries are evicted by age and, beyond max_entries, least recently used first.
+    """
+
+    def __init__(self, path: str, max_entries: int, max_age_sec: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_sec = max_age_sec
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        # key -> last hit time, written with the next put rather than one commit per hit
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, commits no longer fsync; a crash can lose the last few entries, never corrupt the file
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(messages: Sequence[BaseMessage], options: Optional[dict] = None) -> str:
+        payload = {
+            "model": get_model_name(),
+            "options": {**LLM_OPTIONS, **(options or {})},
+            "messages": [[m.type, m.content] for m in messages],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, str]:
+        """Cached replies for the given keys, in one query; recency updates are deferred to the next write."""
+        now = time.time()
+        unique = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        with self._lock:
+            for i in range(0, len(unique), _MAX_SQL_PARAMS):
+                part = unique[i:i + _MAX_SQL_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT key, content, created_at FROM llm_cache WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, content, created_at in rows:
+                    if now - created_at <= self.max_age_sec:
+                        found[key] = content
+            for key in found:
+                self._touched[key] = now
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+            if len(self._touched) >= _TOUCH_FLUSH_EVERY:
+                self._flush_touched()
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: Sequence[Tuple[str, str]]):
+        """Store (key, content) pairs in a single transaction."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO llm_cache (key, content, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                [(key, content, now, now) for key, content in items],
+            )
+            self._flush_touched()
+            self._conn.commit()
+            previous = self._writes
+            self._writes += len(items)
+            if self._writes // _EVICT_EVERY > previous // _EVICT_EVERY:
+                self._evict(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._touched.pop(key, None)
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE llm_cache SET last_used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self, now: float):
+        self._flush_touched()
+        expired = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age_sec,)
+        ).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = max(0, count - self.max_entries)
+        if overflow:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_used_at ASC LIMIT ?)",
+                (overflow,),
+            )
+        self._conn.commit()
+        self.evictions += expired + overflow
+        if expired or overflow:
+            logger.info(f"→ CACHE: evicted {expired} expired and {overflow} LRU entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+# Singleton instance
+_cache_instance: Optional[LLMCache] = None
+
+
+def get_cache() -> Optional[LLMCache]:
+    """Get the LLM response cache (singleton), or None when disabled."""
+    global _cache_instance
+    if LLM_CACHE_ENABLED and _cache_instance is None:
+        _cache_instance = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_SEC)
+    return _cache_instance
+
+
+def _is_json(content: str) -> bool:
+    try:
+        json.loads(content)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+async def cached_abatch(all_messages: List[List[BaseMessage]], options: Optional[dict] = None,
+                        validate: Optional[Callable[[str], bool]] = None) -> List[BaseMessage]:
+    """
+    Drop-in replacement for get_llm().abatch: answers cached prompts locally
+    and sends only the misses to the model. options overrides LLM_OPTIONS for
+    these calls and is part of their cache keys. Only replies that validate
+    accepts (by default: any JSON) are stored, and a stored reply it rejects
+    counts as a miss.
+    """
+    cache = get_cache()
+    if cache is None:
+        return await scheduled_abatch(all_messages, options)
+    validate = validate or _is_json
+
+    keys = [LLMCache.make_key(messages, options) for messages in all_messages]
+    # SQLite calls block, so they run in a worker thread rather than on the event loop
+    cached = await asyncio.to_thread(cache.get_many, keys)
+    responses: List[Optional[BaseMessage]] = [None] * len(all_messages)
+    miss_indices = []
+    rejected = []
+    for i, key in enumerate(keys):
+        if key in cached and validate(cached[key]):
+            responses[i] = AIMessage(content=cached[key])
+        else:
+            if key in cached:
+                rejected.append(key)
+            miss_indices.append(i)
+
+    if miss_indices:
+        fresh = await scheduled_abatch([all_messages[i] for i in miss_indices], options)
+        items = []
+        for i, response in zip(miss_indices, fresh):
+            responses[i] = response
+            # Never pin an unusable reply; retries of the same prompt would replay it forever
+            if validate(response.content):
+                items.append((keys[i], response.content))
+        stored = {key for key, _ in items}
+        for key in rejected:
+            if key not in stored:
+                await asyncio.to_thread(cache.delete, key)
+        if items:
+            await asyncio.to_thread(cache.put_many, items)
+
+    logger.info(f"→ CACHE: {len(all_messages) - len(miss_indices)} hits, {len(miss_indices)} misses")
+    return responses
+
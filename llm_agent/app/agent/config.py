@@ -32,18 +32,97 @@ class AgentConfiguration:
         },
     )
 
+    packed_human_prompt: str = field(
+        default=prompts.PACKED_HUMAN_PROMPT,
+        metadata={
+            "description": "The human prompt used when several segments share one call.",
+            "parameters": "Takes criteria, example lists and ID-tagged segments."
+        },
+    )
+
+    repair_prompt: str = field(
+        default=prompts.REPAIR_PROMPT,
+        metadata={
+            "description": "Follow-up sent after a reply that could not be parsed, asking for valid JSON only."
+        },
+    )
+
     # PARAMETERS
-    max_segment_length: int = field(
-        default=300,
+    max_segment_tokens: int = field(
+        default=0,
+        metadata={
+            "description": "Upper bound on transcript tokens per segment; 0 fills whatever the context window leaves"
+        },
+    )
+
+    min_segment_tokens: int = field(
+        default=256,
+        metadata={
+            "description": "Lower bound on transcript tokens per segment when criteria and examples crowd the context"
+        },
+    )
+
+    output_token_reserve: Optional[int] = field(
+        default=None,
+        metadata={
+            "description": "Context tokens kept free for the model's reply; defaults to the model's num_predict"
+        },
+    )
+
+    context_safety_margin: int = field(
+        default=128,
+        metadata={
+            "description": "Extra context tokens left unused to absorb token-count estimation error"
+        },
+    )
+
+    segment_overlap_sentences: int = field(
+        default=0,
+        metadata={
+            "description": "Number of trailing sentences of a segment repeated at the start of the next one"
+        },
+    )
+
+    max_segments_per_pack: int = field(
+        default=8,
+        metadata={
+            "description": "Maximum number of ID-tagged segments packed into one prompt; 1 disables packing"
+        },
+    )
+
+    few_shot_k: int = field(
+        default=5,
+        metadata={
+            "description": "Positive and negative examples injected per prompt, the most similar to the segment; 0 sends all"
+        },
+    )
+
+    segment_max_retries: int = field(
+        default=2,
+        metadata={
+            "description": "Retries for a segment whose reply failed or could not be parsed: a repair prompt first, then retry_temperature"
+        },
+    )
+
+    retry_temperature: float = field(
+        default=0.4,
+        metadata={
+            "description": "Sampling temperature for retries after the repair prompt, to get away from a deterministic bad reply"
+        },
+    )
+
+    prescreen_enabled: bool = field(
+        default=False,
         metadata={
-            "description": "Maximum character length before segmenting transcription"
+            "description": "Skip the LLM for segments the lexical pre-screen scores below prescreen_threshold; "
+                           "trades recall for throughput, so off by default"
         },
     )
 
-    max_extension: int = field(
-        default=30,
+    prescreen_threshold: float = field(
+        default=1.0,
         metadata={
-            "description": "Maximum character length before segmenting transcription"
+            "description": "Distinct criteria/example/cue terms a segment needs to be sent to the LLM; lower raises recall"
         },
     )
 
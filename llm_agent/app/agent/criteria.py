@@ -0,0 +1,67 @@
+"""Criteria compilation: merge and tighten user criteria once per distinct criteria set."""
+
+import hashlib
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from .cache import cached_abatch
+from .config import AgentConfiguration as Configuration
+
+logger = logging.getLogger(__name__)
+
+# Compiled sets kept in memory; the LLM cache keeps them across restarts
+_MAX_COMPILED = 256
+_compiled: Dict[str, List[str]] = {}
+
+
+def criteria_hash(criteria: List[str]) -> str:
+    """Hash of a criteria set, insensitive to case, surrounding whitespace and exact repeats."""
+    normalised = sorted({" ".join(c.lower().split()) for c in criteria if c.strip()})
+    return hashlib.sha256(json.dumps(normalised).encode("utf-8")).hexdigest()
+
+
+def _parse(content: str) -> Optional[List[str]]:
+    try:
+        criteria = json.loads(content).get("criteria")
+    except (TypeError, ValueError, AttributeError):
+        return None
+    if not isinstance(criteria, list):
+        return None
+    criteria = [c.strip() for c in criteria if isinstance(c, str) and c.strip()]
+    return criteria or None
+
+
+async def compile_criteria(criteria: List[str],
+                           cfg: Optional[Configuration] = None) -> Tuple[List[str], str, bool, bool]:
+    """
+    Run REFINE_CRITERIA over a criteria set. Returns (criteria, hash, whether
+    the result came from memory, whether it was compiled). If the model's
+    reply is unusable the input is returned with exact repeats dropped and
+    compiled False; neither this process nor the LLM cache keeps the reply,
+    so the next call for the set tries again.
+    """
+    cfg = cfg or Configuration()
+    key = criteria_hash(criteria)
+    if key in _compiled:
+        return _compiled[key], key, True, True
+
+    unique = list(dict.fromkeys(c.strip() for c in criteria if c.strip()))
+    if len(unique) <= 1:
+        return unique, key, False, True
+
+    prompt = cfg.criteria_refinement_prompt.format(additional_criteria="\n".join(f"- {c}" for c in unique))
+    messages = [HumanMessage(content=prompt)]
+    response = (await cached_abatch([messages], validate=lambda content: _parse(content) is not None))[0]
+    compiled = _parse(response.content)
+    if compiled is None:
+        logger.warning("→ CRITERIA: refinement reply unusable, keeping the criteria as given")
+        return unique, key, False, False
+
+    logger.info(f"→ CRITERIA: {len(unique)} criteria compiled to {len(compiled)}")
+    if len(_compiled) >= _MAX_COMPILED:
+        _compiled.pop(next(iter(_compiled)))
+    _compiled[key] = compiled
+    return compiled, key, False, True
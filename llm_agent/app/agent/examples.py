@@ -0,0 +1,78 @@
+"""TF-IDF index over few-shot examples, so each prompt carries only the most relevant ones."""
+
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from .prescreen import tokens
+
+# Examples at least this similar to one already kept are treated as the same example
+NEAR_DUPLICATE_SIMILARITY = 0.9
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0.0) for term, weight in a.items())
+
+
+class ExampleIndex:
+    """
+    Examples as L2-normalised TF-IDF vectors over stemmed content words.
+    Near-duplicates (normalised text or vector similarity) are collapsed
+    when the index is built, keeping the first occurrence.
+    """
+
+    def __init__(self, examples: Tuple[str, ...]):
+        seen_texts = set()
+        token_lists: List[List[str]] = []
+        kept: List[str] = []
+        for example in examples:
+            normalised = " ".join(example.lower().split())
+            if not normalised or normalised in seen_texts:
+                continue
+            seen_texts.add(normalised)
+            kept.append(example)
+            token_lists.append(tokens(example))
+
+        document_frequency = Counter(term for toks in token_lists for term in set(toks))
+        self._idf = {term: math.log((1 + len(kept)) / (1 + df)) + 1.0 for term, df in document_frequency.items()}
+
+        self.examples: List[str] = []
+        self._vectors: List[Dict[str, float]] = []
+        for example, toks in zip(kept, token_lists):
+            vector = self._vectorize(toks)
+            if vector and any(_cosine(vector, other) >= NEAR_DUPLICATE_SIMILARITY for other in self._vectors):
+                continue
+            self.examples.append(example)
+            self._vectors.append(vector)
+
+    def _vectorize(self, toks: List[str]) -> Dict[str, float]:
+        counts = Counter(t for t in toks if t in self._idf)
+        vector = {term: (1.0 + math.log(count)) * self._idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {term: w / norm for term, w in vector.items()} if norm else {}
+
+    def top_k(self, text: str, k: int) -> List[str]:
+        """
+        The k examples most similar to text, most similar first; ties keep the
+        original order. k <= 0 returns every (de-duplicated) example.
+        """
+        if k <= 0 or len(self.examples) <= k:
+            return list(self.examples)
+        query = self._vectorize(tokens(text))
+        ranked = sorted(range(len(self.examples)), key=lambda i: (-_cosine(query, self._vectors[i]), i))
+        return [self.examples[i] for i in ranked[:k]]
+
+    def longest(self, k: int) -> List[str]:
+        """The k longest examples: an upper bound on what top_k can put into a prompt."""
+        if k <= 0 or len(self.examples) <= k:
+            return list(self.examples)
+        return sorted(self.examples, key=len, reverse=True)[:k]
+
+
+@lru_cache(maxsize=32)
+def get_example_index(examples: Tuple[str, ...]) -> ExampleIndex:
+    """Index for an example list; batches reuse the same lists across many requests."""
+    return ExampleIndex(examples)
@@ -1,211 +1,195 @@
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage
 from .agent_state import AgentState
 from typing import Optional, List, Dict, Tuple
 from .config import AgentConfiguration as Configuration
 from langchain_core.runnables import RunnableConfig
-from .utils import get_llm
+from .cache import cached_abatch
+from .prescreen import screen
+from .examples import ExampleIndex, get_example_index
+from .parsing import parse_spans
+from .resolve import resolve_spans
+from .segmenter import iter_segments
+from .utils import count_tokens, LLM_OPTIONS
+import asyncio
 import json
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 
-# _SENTENCE_RE = re.compile(r'.+?(?:[\.!\?;:](?=\s|$)|$)', re.DOTALL)
-_SENTENCE_RE = re.compile(
-    r"""
-    (?:[^.!?;"]+?|"(?:[^"]+)"|\([^)]+\)|\[[^\]]+\])+?
-    (?:[.!?;]+(?=\s|$)|$)                                 
-    """,
-    re.VERBOSE | re.UNICODE
-)
-
-def _sentences(text: str) -> List[str]:
-    """Regex-based sentence splitter; trims empties."""
-    return [m.group(0).strip() for m in _SENTENCE_RE.finditer(text or "") if m.group(0).strip()]
-
-def _ws_split_prefix(s: str, limit: int) -> Optional[Tuple[str, str]]:
-    """
-    Longest prefix of s with length <= limit that ends on whitespace.
-    Returns (head, tail) or None if no whitespace boundary within limit.
-    """
-    s = s.rstrip()
-    if len(s) <= limit:
-        return s, ""
-    window = s[:limit + 1]
-    i = max((j for j, ch in enumerate(window) if ch.isspace()), default=-1)
-    if i <= 0:
-        return None
-    return s[:i].rstrip(), s[i+1:].lstrip()
-
-def _split_overlong(s: str, max_len: int) -> List[str]:
-    """
-    Split s into <= max_len chunks, preferring whitespace; last resort: hard cuts.
+# Approximate tokens taken by the "[ID] " tag and separator of a packed segment
+_PACK_TAG_TOKENS = 4
+
+def _prompt_sections(state: AgentState, positive_examples: Optional[List[str]] = None,
+                     negative_examples: Optional[List[str]] = None) -> Dict[str, str]:
+    """Criteria and example blocks as they are pasted into HUMAN_PROMPT; examples default to the state's."""
+    positive_examples = state.positive_examples if positive_examples is None else positive_examples
+    negative_examples = state.negative_examples if negative_examples is None else negative_examples
+    return {
+        # Format extremism criteria (only default definitions - abstract rules)
+        "extremism_criteria": "\n".join(f"- {c}" for c in state.default_definitions) if state.default_definitions else "None provided",
+        # Format positive examples (concrete examples TO flag)
+        "positive_examples": "\n".join(f"- {p}" for p in positive_examples) if positive_examples else "None provided",
+        # Format negative examples (concrete examples NOT to flag)
+        "negative_examples": "\n".join(f"- {n}" for n in negative_examples) if negative_examples else "None provided",
+    }
+
+def _example_indexes(state: AgentState) -> Tuple[ExampleIndex, ExampleIndex]:
+    return get_example_index(tuple(state.positive_examples)), get_example_index(tuple(state.negative_examples))
+
+def _bound_sections(cfg: Configuration, state: AgentState) -> Dict[str, str]:
+    """Sections with the few_shot_k longest examples: the most any selected prompt can take, for token budgets."""
+    positive, negative = _example_indexes(state)
+    return _prompt_sections(state, positive.longest(cfg.few_shot_k), negative.longest(cfg.few_shot_k))
+
+def _selected_sections(cfg: Configuration, state: AgentState, text: str) -> Dict[str, str]:
+    """Sections with the few_shot_k positive and negative examples most similar to text."""
+    positive, negative = _example_indexes(state)
+    return _prompt_sections(state, positive.top_k(text, cfg.few_shot_k), negative.top_k(text, cfg.few_shot_k))
+
+def segment_token_budget(cfg: Configuration, sections: Dict[str, str], packed: bool = False) -> int:
     """
-    s = s.strip()
-    if not s:
-        return []
-    out: List[str] = []
-    cur = s
-    while cur:
-        if len(cur) <= max_len:
-            out.append(cur)
-            break
-        ws = _ws_split_prefix(cur, max_len)
-        if ws:
-            head, tail = ws
-            out.append(head)
-            cur = tail
-        else:
-            # hard cut
-            out.append(cur[:max_len])
-            cur = cur[max_len:].lstrip()
-    return out
-
-def _pack_sentences_stable(sents: List[str], max_len: int, max_extension: int) -> List[str]:
+    Tokens left for transcript text in one call: the context window minus the
+    system prompt, the human prompt with criteria and examples filled in, the
+    room reserved for the reply and a safety margin.
     """
-    Stable-order packing:
-      1) Greedily append sentences while <= max_len.
-      2) If overflow and current chunk has >=2 sentences:
-           finalize all but the last; start new chunk with that last; retry pending sentence.
-      3) If overflow and chunk has <2 sentences:
-           a) allow if overflow <= max_extension (then finalize immediately),
-           b) else try whitespace split to fill,
-           c) else hard cut.
-    Never reorders sentences.
-    """
-    chunks: List[str] = []
-    cur_sents: List[str] = []
-
-    def cur_text() -> str:
-        return " ".join(cur_sents).strip()
-
-    i = 0
-    while i < len(sents):
-        s = sents[i].strip()
-        if not s:
-            i += 1
-            continue
-
-        cur = cur_text()
-        sep = "" if not cur else " "
-        candidate = s if not cur else (cur + sep + s)
-
-        # Fits → take it
-        if len(candidate) <= max_len:
-            cur_sents.append(s)
-            i += 1
-            continue
-
-        # Overflow handling
-        if len(cur_sents) >= 2:
-            # Finalize all except last; carry last forward as new head; retry same sentence
-            last = cur_sents.pop()
-            kept = cur_text()
-            if kept:
-                chunks.append(kept)
-            cur_sents = [last]
-            continue
-
-        # len(cur_sents) is 0 or 1
-        if cur and len(candidate) <= max_len + max_extension:
-            # Allow small overflow; finalize immediately (no cascading)
-            cur_sents.append(s)
-            chunks.append(cur_text())
-            cur_sents.clear()
-            i += 1
-            continue
-
-        # Try whitespace split of pending sentence to fill remaining
-        remaining = max_len - len(cur) - (0 if not cur else 1)
-        if remaining > 0:
-            ws = _ws_split_prefix(s, remaining)
-            if ws:
-                head, tail = ws
-                if head:
-                    if cur:
-                        cur_sents.append(head)
-                        chunks.append(cur_text())
-                        cur_sents.clear()
-                    else:
-                        chunks.append(head)
-                    if tail:
-                        # Replace current sentence with its tail; retry without advancing i
-                        sents = sents[:i] + [tail] + sents[i+1:]
-                    else:
-                        i += 1
-                    continue
-
-        # Hard cut fallback
-        if cur:
-            # Flush current and retry sentence with fresh space
-            chunks.append(cur_text())
-            cur_sents.clear()
-            continue
-
-        # cur is empty → cut s
-        head = s[:max_len]
-        tail = s[max_len:].lstrip()
-        chunks.append(head)
-        if tail:
-            sents = sents[:i] + [tail] + sents[i+1:]
-        else:
-            i += 1
-
-    if cur_sents:
-        chunks.append(cur_text())
-
-    # Remove accidental empties
-    return [c for c in (x.strip() for x in chunks) if c]
+    if packed:
+        prompt = cfg.packed_human_prompt.format(segments="", **sections)
+    else:
+        prompt = cfg.human_prompt.format(transcription="", **sections)
+    overhead = count_tokens(cfg.system_prompt) + count_tokens(prompt)
+    reserve = cfg.output_token_reserve if cfg.output_token_reserve is not None else LLM_OPTIONS["num_predict"]
+    budget = LLM_OPTIONS["num_ctx"] - overhead - reserve - cfg.context_safety_margin
+    if cfg.max_segment_tokens:
+        budget = min(budget, cfg.max_segment_tokens)
+    if budget < cfg.min_segment_tokens:
+        logger.warning(
+            f"→ SEGMENT: prompt overhead ({overhead} tokens) leaves only {budget} tokens per segment; "
+            f"using {cfg.min_segment_tokens}"
+        )
+        budget = cfg.min_segment_tokens
+    return budget
 
 # === Public entrypoint ===
 async def segment_transcription(state: "AgentState", *, config: Optional["RunnableConfig"] = None) -> Dict:
     """
     Segment long transcriptions for extremist-content scanning:
-      - Split into sentences,
-      - Greedily pack up to max_segment_length,
-      - On overflow: stable-order backoff, optional small extension, whitespace split, then hard cut.
-    Expects config to provide:
-      - max_segment_length: int
-      - max_extension: int (optional, default 100)
+      - Split into sentences in a single linear pass over character offsets,
+      - Greedily pack sentences up to the token budget left in the model context
+        after the prompt, criteria, examples and reply reserve,
+      - Optionally repeat the last few sentences of each segment at the start of the next.
     """
     cfg = Configuration.from_runnable_config(config)
-    text = (state.transcription or "").strip()
-    max_len = int(cfg.max_segment_length)
-    max_ext = int(cfg.max_extension)
+    text = state.transcription or ""
 
-    if not text:
+    if not text.strip():
         logger.info("→ SEGMENT: empty transcription → 0 segments")
-        return {"transcription_segments": []}
+        return {"transcription_segments": [], "segment_offsets": []}
 
-    if len(text) <= max_len:
-        logger.info(f"→ SEGMENT: {len(text)} chars → 1 segment (threshold: {max_len})")
-        return {"transcription_segments": [text]}
+    budget = segment_token_budget(cfg, _bound_sections(cfg, state))
+    total_tokens = count_tokens(text)
+
+    if total_tokens <= budget:
+        start = len(text) - len(text.lstrip())
+        end = len(text.rstrip())
+        logger.info(f"→ SEGMENT: {total_tokens} tokens → 1 segment (budget: {budget})")
+        return {"transcription_segments": [text[start:end]], "segment_offsets": [(start, end)]}
 
     try:
-        sents = _sentences(text)
-        segments = _pack_sentences_stable(sents, max_len, max_ext)
+        offsets = list(iter_segments(text, budget, int(cfg.segment_overlap_sentences)))
         logger.info(
-            f"→ SEGMENT: {len(text)} chars → {len(segments)} segments "
-            f"(max_len: {max_len}, max_ext: {max_ext})"
+            f"→ SEGMENT: {len(text)} chars / {total_tokens} tokens → {len(offsets)} segments "
+            f"(budget: {budget} tokens, overlap: {cfg.segment_overlap_sentences} sentences)"
         )
-        logger.info(f"\n segments: {' '.join(f'{i}) {seg}' for i, seg in enumerate(segments))}")
-        return {"transcription_segments": segments}
+        return {"transcription_segments": [text[start:end] for start, end in offsets], "segment_offsets": offsets}
     except Exception:
         logger.exception("Segmentation failed, using single segment")
-        return {"transcription_segments": [text]}
+        return {"transcription_segments": [text], "segment_offsets": [(0, len(text))]}
 
-async def content_check_node(state: AgentState, *, config: Optional[RunnableConfig] = None) -> dict:
-    """Detect extremist content in parallel batches."""
+async def prescreen_node(state: AgentState, *, config: Optional[RunnableConfig] = None) -> Dict:
+    """
+    Score segments lexically against the criteria, positive examples and a
+    seed list of violent/extremist cue words; segments below the threshold
+    skip the LLM.
+    """
     cfg = Configuration.from_runnable_config(config)
+    segments = state.transcription_segments
+    if not cfg.prescreen_enabled or not segments:
+        return {"prescreen_skipped": []}
+
+    skipped = screen(segments, state.default_definitions, state.positive_examples, cfg.prescreen_threshold)
+    logger.info(
+        f"→ PRESCREEN: {len(segments) - len(skipped)}/{len(segments)} segments forwarded to the LLM, "
+        f"{len(skipped)} skipped (threshold: {cfg.prescreen_threshold})"
+    )
+    return {"prescreen_skipped": skipped}
+
+def _single_messages(cfg: Configuration, segment: str, sections: Dict[str, str]) -> List[BaseMessage]:
+    return [
+        SystemMessage(content=cfg.system_prompt),
+        HumanMessage(content=cfg.human_prompt.format(transcription=segment, **sections))
+    ]
+
+def _packed_messages(cfg: Configuration, pack: List[int], segments: List[str], sections: Dict[str, str]) -> List[BaseMessage]:
+    tagged = "\n\n".join(f"[{i}] {segments[i]}" for i in pack)
+    return [
+        SystemMessage(content=cfg.system_prompt),
+        HumanMessage(content=cfg.packed_human_prompt.format(segments=tagged, **sections))
+    ]
+
+def _plan_packs(cfg: Configuration, segments: List[str], sections: Dict[str, str],
+                indices: List[int]) -> List[List[int]]:
+    """
+    Group the given segments, in order, into packs that fit the packed prompt's
+    token budget, at most max_segments_per_pack each. Segments that fill a
+    context on their own stay single.
+    """
+    max_pack = int(cfg.max_segments_per_pack)
+    if max_pack <= 1 or len(indices) <= 1:
+        return [[i] for i in indices]
+
+    budget = segment_token_budget(cfg, sections, packed=True)
+    packs: List[List[int]] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i in indices:
+        n = count_tokens(segments[i]) + _PACK_TAG_TOKENS
+        if cur and (cur_tokens + n > budget or len(cur) >= max_pack):
+            packs.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        packs.append(cur)
+    return packs
+
+def _parse_packed(content: str, pack: List[int]) -> Optional[Dict[int, List[dict]]]:
+    """
+    Split a packed reply into spans per segment ID. Returns None when the reply
+    is not complete JSON or a span lacks a usable segment_id, so the caller can
+    fall back to single-segment calls.
+    """
+    # A truncated pack would silently lose its last segments, so it must parse completely
+    spans = parse_spans(content, allow_truncated=False)
+    if spans is None:
+        return None
 
-    # Format extremism criteria (only default definitions - abstract rules)
-    extremism_criteria = "\n".join(f"- {c}" for c in state.default_definitions) if state.default_definitions else "None provided"
+    per_segment: Dict[int, List[dict]] = {i: [] for i in pack}
+    for span in spans:
+        try:
+            segment_id = int(span.get("segment_id"))
+        except (TypeError, ValueError):
+            return None
+        if segment_id not in per_segment:
+            return None
+        per_segment[segment_id].append({k: v for k, v in span.items() if k != "segment_id"})
+    return per_segment
 
-    # Format positive examples (concrete examples TO flag)
-    positive_examples = "\n".join(f"- {p}" for p in state.positive_examples) if state.positive_examples else "None provided"
+async def content_check_node(state: AgentState, *, config: Optional[RunnableConfig] = None) -> dict:
+    """Detect extremist content in parallel batches."""
+    cfg = Configuration.from_runnable_config(config)
 
-    # Format negative examples (concrete examples NOT to flag)
-    negative_examples = "\n".join(f"- {n}" for n in state.negative_examples) if state.negative_examples else "None provided"
+    # Budgets use the largest examples any prompt can get; each prompt gets the most relevant ones
+    sections = _bound_sections(cfg, state)
 
     logger.info(f"→ BATCH: Processing {len(state.transcription_segments)} segments in parallel")
     
@@ -234,24 +218,23 @@ async def content_check_node(state: AgentState, *, config: Optional[RunnableConf
     logger.info("=" * 80)
 
     try:
-        # Build messages for each segment
+        segments = state.transcription_segments
+        skipped = set(state.prescreen_skipped)
+        to_check = [i for i in range(len(segments)) if i not in skipped]
+
+        # Pack short segments together so the instructions and examples are paid once per pack
+        packs = _plan_packs(cfg, segments, sections, to_check)
         all_messages = [
-            [
-                SystemMessage(content=cfg.system_prompt),
-                HumanMessage(content=cfg.human_prompt.format(
-                    transcription=seg,
-                    extremism_criteria=extremism_criteria,
-                    positive_examples=positive_examples,
-                    negative_examples=negative_examples
-                ))
-            ]
-            for seg in state.transcription_segments
+            _single_messages(cfg, segments[pack[0]], _selected_sections(cfg, state, segments[pack[0]])) if len(pack) == 1
+            else _packed_messages(cfg, pack, segments, _selected_sections(cfg, state, " ".join(segments[i] for i in pack)))
+            for pack in packs
         ]
+        logger.info(f"→ BATCH: {len(to_check)} of {len(segments)} segments in {len(packs)} calls")
         
-        # Print the complete prompt for the first segment
+        # Print the complete prompt for the first call
         if all_messages:
             logger.info("\n" + "=" * 80)
-            logger.info("COMPLETE PROMPT SENT TO LLM (FIRST SEGMENT):")
+            logger.info("COMPLETE PROMPT SENT TO LLM (FIRST CALL):")
             logger.info("=" * 80)
             logger.info("\n🔧 SYSTEM PROMPT:")
             logger.info("-" * 80)
@@ -259,32 +242,118 @@ async def content_check_node(state: AgentState, *, config: Optional[RunnableConf
             logger.info("-" * 80)
             logger.info("\n💬 HUMAN PROMPT:")
             logger.info("-" * 80)
-            formatted_prompt = cfg.human_prompt.format(
-                transcription=state.transcription_segments[0],
-                extremism_criteria=extremism_criteria,
-                positive_examples=positive_examples,
-                negative_examples=negative_examples
-            )
-            logger.info(formatted_prompt)
+            logger.info(all_messages[0][1].content)
             logger.info("-" * 80)
             logger.info("=" * 80 + "\n")
 
-        # Batch process all segments in parallel
-        responses = await get_llm().abatch(all_messages)
-
-        # Parse and concatenate all spans
+        # Streaming callers get each segment's spans as soon as its call returns
+        on_segment_result = (config or {}).get("configurable", {}).get("on_segment_result")
+        segment_spans: List[Optional[List[dict]]] = [None] * len(segments)
+        failed: Dict[int, str] = {}
+        first_response: List[BaseMessage] = []
+
+        # Offsets are absolute when the segments' place in the transcription is known
+        offsets = state.segment_offsets if len(state.segment_offsets) == len(segments) else None
+
+        def _finish(i: int, spans: List[dict], error: Optional[str] = None):
+            spans = resolve_spans(segments[i], spans, offsets[i][0] if offsets else 0)
+            segment_spans[i] = spans
+            if error is not None:
+                failed[i] = error
+            if on_segment_result:
+                on_segment_result(i, spans, len(segments), error)
+
+        def _parses(content: str) -> bool:
+            return parse_spans(content) is not None
+
+        async def _call(messages: List[BaseMessage], options: Optional[dict] = None,
+                        validate=_parses) -> Tuple[Optional[BaseMessage], Optional[str]]:
+            # Cached prompts never reach the model; a failed call is reported, not raised.
+            # Only replies that validate accepts are cached, so a retry never replays an unusable one
+            try:
+                response = (await cached_abatch([messages], options, validate))[0]
+            except Exception as e:
+                return None, f"model call failed: {e}"
+            if not first_response:
+                first_response.append(response)
+            return response, None
+
+        async def _check_single(i: int, messages: List[BaseMessage], response: Optional[BaseMessage] = None,
+                                error: Optional[str] = None):
+            """Score one segment, retrying only this segment when its reply is unusable."""
+            if response is None and error is None:
+                response, error = await _call(messages)
+            for attempt in range(int(cfg.segment_max_retries) + 1):
+                if response is not None:
+                    spans = parse_spans(response.content)
+                    if spans is not None:
+                        _finish(i, spans)
+                        return
+                    error = "unparseable reply"
+                if attempt == cfg.segment_max_retries:
+                    break
+                logger.warning(f"→ RETRY: segment {i} ({error}), attempt {attempt + 1}/{cfg.segment_max_retries}")
+                if attempt == 0 and response is not None:
+                    # Show the model its own reply and ask for the JSON alone
+                    response, error = await _call(
+                        messages + [AIMessage(content=response.content), HumanMessage(content=cfg.repair_prompt.format())]
+                    )
+                else:
+                    # Same prompt, sampled away from the deterministic reply
+                    response, error = await _call(messages, {"temperature": cfg.retry_temperature})
+            logger.error(f"→ FAILED: segment {i} after {cfg.segment_max_retries} retries ({error})")
+            _finish(i, [], error)
+
+        async def _check_pack(pack: List[int], messages: List[BaseMessage]):
+            if len(pack) == 1:
+                await _check_single(pack[0], messages)
+                return
+
+            # Split the reply back into per-segment results
+            response, error = await _call(messages, validate=lambda content: _parse_packed(content, pack) is not None)
+            parsed = _parse_packed(response.content, pack) if response is not None else None
+            if parsed is not None:
+                for i in pack:
+                    _finish(i, parsed[i])
+                return
+
+            # Fallback: a pack that could not be split gets single-segment calls
+            logger.warning(f"→ PACK: {error or 'unparseable reply'} for segments {pack}; retrying them one by one")
+            await asyncio.gather(*(
+                _check_single(i, _single_messages(cfg, segments[i], _selected_sections(cfg, state, segments[i])))
+                for i in pack
+            ))
+
+        # Segments the pre-screen ruled out are finished without a model call
+        for i in sorted(skipped):
+            _finish(i, [])
+
+        # All calls run in parallel; the scheduler decides how many reach the model at once
+        await asyncio.gather(*(_check_pack(pack, messages) for pack, messages in zip(packs, all_messages)))
+
+        # Concatenate all spans in segment order; a span found again in the overlap of the next segment is kept once
         all_spans = []
         span_counts = []
-        for response in responses:
-            spans = json.loads(response.content).get("spans", [])
-            all_spans.extend(spans)
-            span_counts.append(len(spans))
+        seen = set()
+        for spans in segment_spans:
+            for span in spans or []:
+                if offsets and span["start_char"] is not None:
+                    key = (span["start_char"], span["end_char"])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                all_spans.append(span)
+            span_counts.append(len(spans or []))
 
         logger.info(f"→ BATCH: Completed - found {len(all_spans)} spans total ({', '.join(f'seg{i+1}: {c}' for i, c in enumerate(span_counts))})")
 
+        if failed:
+            logger.warning(f"→ BATCH: {len(failed)} segments failed: {sorted(failed)}")
+
         return {
-            "messages": all_messages[0] + [responses[0]] if responses else [],
-            "response": json.dumps({"spans": all_spans})
+            "messages": all_messages[0] + first_response if all_messages else [],
+            "response": json.dumps({"spans": all_spans}),
+            "failed_segments": [{"segment_index": i, "error": failed[i]} for i in sorted(failed)]
         }
     except Exception:
         logger.exception("Batch content check failed")
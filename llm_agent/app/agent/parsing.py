@@ -0,0 +1,78 @@
+"""Tolerant parsing of the model's span replies."""
+
+import json
+import re
+from typing import List, Optional
+
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+_SPANS_KEY_RE = re.compile(r'"spans"\s*:\s*\[')
+
+_decoder = json.JSONDecoder()
+
+
+def _clean_span(span) -> Optional[dict]:
+    """A span with the fields the API promises, or None if it has no usable text."""
+    if not isinstance(span, dict):
+        return None
+    text = span.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    try:
+        confidence = min(1.0, max(0.0, float(span.get("confidence", 0.5))))
+    except (TypeError, ValueError):
+        confidence = 0.5
+    cleaned = {"text": text, "rationale": str(span.get("rationale") or ""), "confidence": confidence}
+    if "segment_id" in span:
+        cleaned["segment_id"] = span["segment_id"]
+    return cleaned
+
+
+def _salvage_spans(text: str) -> Optional[List]:
+    """
+    Recover the span objects from a reply cut off mid-array, as happens when
+    generation stops at num_predict. Returns None when the cut falls inside a
+    span object or before the first one: a span was lost, so an empty or
+    short list would pass for a complete answer.
+    """
+    match = _SPANS_KEY_RE.search(text)
+    if match is None:
+        return None
+    spans = []
+    pos = match.end()
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(text) and text[pos] == "]":
+            return spans
+        if pos >= len(text):
+            return spans or None
+        try:
+            span, pos = _decoder.raw_decode(text, pos)
+        except ValueError:
+            return None
+        spans.append(span)
+
+
+def parse_spans(content, allow_truncated: bool = True) -> Optional[List[dict]]:
+    """
+    Spans from a model reply, or None if no span list can be recovered.
+    Tolerates reasoning blocks, code fences, text around the JSON object and,
+    unless allow_truncated is False, truncation between complete spans; spans
+    without text are dropped and confidence is clamped to [0, 1].
+    """
+    if not isinstance(content, str):
+        return None
+    text = _FENCE_RE.sub("", _THINK_RE.sub("", content).strip())
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    try:
+        reply, _ = _decoder.raw_decode(text, start)
+        spans = reply.get("spans", []) if isinstance(reply, dict) else None
+    except ValueError:
+        spans = _salvage_spans(text[start:]) if allow_truncated else None
+    if not isinstance(spans, list):
+        return None
+    return [cleaned for cleaned in map(_clean_span, spans) if cleaned is not None]
@@ -0,0 +1,133 @@
+"""Cheap lexical pre-screen that decides which segments are worth an LLM call."""
+
+import re
+import threading
+from typing import Dict, Iterable, List, Set
+
+# Cue words for violent or extremist advocacy, used on top of the request's own terms
+SEED_TERMS = (
+    "kill", "murder", "slaughter", "exterminate", "eliminate", "eradicate", "destroy", "annihilate",
+    "attack", "bomb", "shoot", "stab", "burn", "hang", "execute", "behead", "massacre", "genocide",
+    "weapon", "gun", "rifle", "explosive", "violence", "violent", "war", "fight", "revenge", "blood",
+    "enemy", "enemies", "traitor", "invader", "vermin", "parasite", "subhuman", "purge", "cleanse",
+    "jihad", "martyr", "crusade", "uprising", "revolution", "overthrow", "terror", "terrorist",
+    "militia", "recruit", "hate", "die", "death", "deserve", "supremacy", "superior", "race",
+)
+
+# Words common in criteria and examples that say nothing about a segment
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further had
+has have having he her here hers herself him himself his how i if in into is it its itself just
+let me more most my myself no nor not of off on once only or other our ours ourselves out over own
+same she should so some such than that the their theirs them themselves then there these they this
+those through to too under until up very was we were what when where which while who whom why
+will with would you your yours yourself yourselves
+content speech statement statements text span spans example examples criteria criterion rule
+rules flag flagged include including includes promote promotes promoting support supports
+supporting advocate advocates advocating encourage encourages call calls calling express
+expresses expressing people person group groups individual individuals based specific specifically
+explicit explicitly clear clearly directly indirectly towards toward using use used etc e g
+""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_LETTERS_RE = re.compile(r"[^\W\d_]+")
+
+# Function words frequent in any English text and rare in other languages
+ENGLISH_MARKERS = frozenset("""
+the and of to is that it you we they this for with are was be have not will what them their there
+would should our your from but been were has had who which
+""".split())
+# Below this share of marker words (or with any non-ASCII letters) the English lexicon cannot judge a segment
+MIN_ENGLISH_MARKER_SHARE = 0.1
+_SUFFIXES = ("ations", "ation", "ments", "ment", "ings", "ing", "ers", "er", "ed", "es", "s", "ly")
+_STEM_LEN = 6
+
+
+def stem(word: str) -> str:
+    """Crude suffix-stripping stem, truncated so "violence" and "violent" meet."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: -len(suffix)]
+            break
+    return word[:_STEM_LEN]
+
+
+def tokens(text: str) -> List[str]:
+    """Stemmed content words of a text, in order and with repeats."""
+    return [
+        stem(word)
+        for word in _WORD_RE.findall(text.lower().replace("’", "'"))
+        if len(word) >= 3 and word not in STOPWORDS
+    ]
+
+
+def terms(text: str) -> Set[str]:
+    return set(tokens(text))
+
+
+def build_lexicon(default_definitions: Iterable[str], positive_examples: Iterable[str]) -> Set[str]:
+    """Stems that make a segment worth scoring: seed cues plus the request's criteria and positive examples."""
+    lexicon = {stem(term) for term in SEED_TERMS}
+    for text in list(default_definitions) + list(positive_examples):
+        lexicon |= terms(text)
+    return lexicon
+
+
+def lexicon_applies(segment: str) -> bool:
+    """
+    Whether the English cue lexicon can judge a segment: it is written in
+    ASCII letters and enough of its words are common English function words.
+    """
+    words = _LETTERS_RE.findall(segment.lower())
+    if not words:
+        return True
+    if any(not word.isascii() for word in words):
+        return False
+    return sum(word in ENGLISH_MARKERS for word in words) / len(words) >= MIN_ENGLISH_MARKER_SHARE
+
+
+def score(segment: str, lexicon: Set[str]) -> int:
+    """Number of distinct lexicon stems in the segment."""
+    return len(terms(segment) & lexicon)
+
+
+class PrescreenStats:
+    """Process-wide counts of segments skipped and forwarded, for /health."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seen = 0
+        self.forwarded = 0
+
+    def record(self, seen: int, forwarded: int):
+        with self._lock:
+            self.seen += seen
+            self.forwarded += forwarded
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "segments_seen": self.seen,
+                "segments_forwarded": self.forwarded,
+                "segments_skipped": self.seen - self.forwarded,
+                "forward_rate": round(self.forwarded / self.seen, 3) if self.seen else None
+            }
+
+
+prescreen_stats = PrescreenStats()
+
+
+def screen(segments: List[str], default_definitions: List[str], positive_examples: List[str],
+           threshold: float) -> List[int]:
+    """
+    Indices of segments scoring below threshold, i.e. the ones the LLM can
+    skip. Segments the English lexicon cannot judge are always forwarded.
+    """
+    lexicon = build_lexicon(default_definitions, positive_examples)
+    skipped = [
+        i for i, segment in enumerate(segments)
+        if lexicon_applies(segment) and score(segment, lexicon) < threshold
+    ]
+    prescreen_stats.record(len(segments), len(segments) - len(skipped))
+    return skipped
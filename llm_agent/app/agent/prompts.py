@@ -68,3 +68,49 @@ Constraints:
 - Confidence: 0.0-1.0 (higher = more certain it matches the criteria)
 - Return ONLY valid JSON, no other text
 """
+
+PACKED_HUMAN_PROMPT = """Task: Detect extremist spans in each of the transcript segments below using the criteria and reference examples.
+
+EXTREMISM CRITERIA (abstract rules to detect):
+{extremism_criteria}
+
+POSITIVE EXAMPLES (examples of extremist content TO flag - use these to guide your judgment):
+{positive_examples}
+
+NEGATIVE EXAMPLES (examples of normal content NOT to flag - use these to avoid false positives):
+{negative_examples}
+
+Transcript segments (analyze each exactly as given; each segment starts with its ID in square brackets):
+{segments}
+
+Return ONLY this JSON schema:
+
+{{
+  "spans": [
+    {{
+      "segment_id": 0,    // ID of the segment the span was taken from
+      "text": "",         // exact text span from that segment
+      "rationale": "",    // brief explanation why this matches the criteria
+      "confidence": 0.0   // confidence score 0.0-1.0
+    }}
+  ]
+}}
+
+Constraints:
+- Analyze every segment independently; a span must never cross two segments
+- Every span MUST carry the segment_id of the segment it was copied from
+- Do not include the [ID] tag in the span text
+- If no extremist content matches in any segment: {{"spans": []}}
+- Keep spans minimal (no extra context)
+- Confidence: 0.0-1.0 (higher = more certain it matches the criteria)
+- Return ONLY valid JSON, no other text
+"""
+
+REPAIR_PROMPT = """Your previous reply could not be parsed as the required JSON.
+
+Reply again for the same transcript with ONLY a valid JSON object of this form, nothing before or after it:
+
+{{"spans": [{{"text": "", "rationale": "", "confidence": 0.0}}]}}
+
+Keep each rationale to one short sentence. If nothing matches: {{"spans": []}}
+"""
@@ -0,0 +1,83 @@
+"""Resolve span texts quoted by the model to character offsets in their segment."""
+
+import re
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+# Spans the model paraphrased below this similarity are returned without offsets
+MIN_MATCH_SCORE = 0.6
+
+
+def _words(text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    matches = list(_WORD_RE.finditer(text))
+    return [m.group(0).lower() for m in matches], [m.span() for m in matches]
+
+
+def _fuzzy(segment: str, span_text: str) -> Optional[Tuple[int, int, float]]:
+    """
+    Word-level match around the longest run of words the span shares with the
+    segment, trimmed to the first and last matching word.
+    """
+    seg_words, seg_offsets = _words(segment)
+    query, _ = _words(span_text)
+    if not seg_words or not query:
+        return None
+
+    matcher = SequenceMatcher(None, seg_words, query, autojunk=False)
+    anchor = matcher.find_longest_match(0, len(seg_words), 0, len(query))
+    if anchor.size == 0:
+        return None
+
+    # A window the span's length around the anchor, with slack for inserted or dropped words
+    slack = max(1, len(query) // 4)
+    lo = max(0, anchor.a - anchor.b - slack)
+    hi = min(len(seg_words), anchor.a - anchor.b + len(query) + slack)
+    blocks = [b for b in SequenceMatcher(None, seg_words[lo:hi], query, autojunk=False).get_matching_blocks() if b.size]
+    first = lo + blocks[0].a
+    last = lo + blocks[-1].a + blocks[-1].size - 1
+    matched = sum(b.size for b in blocks)
+    score = 2.0 * matched / (len(query) + last - first + 1)
+    if score < MIN_MATCH_SCORE:
+        return None
+    return seg_offsets[first][0], seg_offsets[last][1], score
+
+
+def resolve_span(segment: str, span_text: str) -> Optional[Tuple[int, int, float]]:
+    """
+    (start, end, match_score) of span_text within segment, or None. Verbatim
+    quotes score 1.0, case-insensitive ones too; otherwise the best word-level
+    match scores its similarity to the quote.
+    """
+    needle = span_text.strip()
+    if not needle:
+        return None
+    start = segment.find(needle)
+    if start >= 0:
+        return start, start + len(needle), 1.0
+
+    # lower() keeps offsets only when it keeps the length
+    lowered = segment.lower()
+    if len(lowered) == len(segment):
+        start = lowered.find(needle.lower())
+        if start >= 0:
+            return start, start + len(needle), 1.0
+
+    return _fuzzy(segment, needle)
+
+
+def resolve_spans(segment: str, spans: List[dict], base: int = 0) -> List[dict]:
+    """
+    Spans with start_char/end_char (offsets into the text segment was cut from,
+    segment starting at base) and match_score added; unresolved spans get None.
+    """
+    resolved = []
+    for span in spans:
+        match = resolve_span(segment, span["text"])
+        if match is None:
+            resolved.append({**span, "start_char": None, "end_char": None, "match_score": None})
+        else:
+            start, end, score = match
+            resolved.append({**span, "start_char": base + start, "end_char": base + end, "match_score": round(score, 3)})
+    return resolved
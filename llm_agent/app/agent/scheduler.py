@@ -0,0 +1,207 @@
+"""Process-wide scheduler for model calls with adaptive concurrency."""
+
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from langchain_core.messages import BaseMessage
+
+from .utils import get_llm
+
+logger = logging.getLogger(__name__)
+
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+# Model calls allowed to wait for a slot before new /detect requests get a 429
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+# Back off when recent latency exceeds the long-run average by this factor
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "2.0"))
+LLM_DECREASE_FACTOR = float(os.getenv("LLM_DECREASE_FACTOR", "0.7"))
+
+# Smoothing for the short- and long-run latency averages
+_SHORT_ALPHA = 0.3
+_LONG_ALPHA = 0.02
+
+# Calls made outside a /detect request share this queue
+_DEFAULT_REQUEST = "default"
+
+current_request: contextvars.ContextVar[str] = contextvars.ContextVar("current_request", default=_DEFAULT_REQUEST)
+
+T = TypeVar("T")
+
+
+class QueueFull(Exception):
+    """Raised at admission when too many model calls are already waiting."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """
+    Limits in-flight model calls with an AIMD window.
+
+    The limit grows by one call per window's worth of fast completions and is
+    cut by LLM_DECREASE_FACTOR when the short-run latency average exceeds the
+    long-run one by LLM_LATENCY_TOLERANCE, or a call fails. Waiting calls are
+    queued per request and released round-robin, so one long transcript cannot
+    starve the requests that arrive after it.
+    """
+
+    def __init__(self, min_limit: int, max_limit: int, initial_limit: int, max_queue: int):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._waiting = 0
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self.completed = 0
+        self.decreases = 0
+        self.rejected = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, at least one."""
+        latency = self._long_latency or 1.0
+        return max(1, math.ceil(self._waiting / max(self.limit, 1.0) * latency))
+
+    def admit(self):
+        """Refuse new work while the queue is full."""
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Run one model call once a slot is free."""
+        await self._acquire(current_request.get())
+        started = time.monotonic()
+        latency: Optional[float] = None
+        cancelled = False
+        try:
+            result = await call()
+            latency = time.monotonic() - started
+            return result
+        except asyncio.CancelledError:
+            # The caller went away (client disconnect, timeout); not a sign of overload
+            cancelled = True
+            raise
+        finally:
+            self._release(latency, cancelled)
+
+    async def _acquire(self, request_id: str):
+        if self.in_flight < int(self.limit) and not self._waiting:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(request_id, deque()).append(future)
+        self._waiting += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before the cancel; hand it on
+                self.in_flight -= 1
+                self._dispatch()
+            else:
+                self._discard(request_id, future)
+            raise
+
+    def _discard(self, request_id: str, future: asyncio.Future):
+        queue = self._queues.get(request_id)
+        if queue and future in queue:
+            queue.remove(future)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[request_id]
+
+    def _release(self, latency: Optional[float], cancelled: bool = False):
+        self.in_flight -= 1
+        if latency is not None:
+            self._observe(latency)
+        elif not cancelled:
+            self._decrease("call failed")
+        self._dispatch()
+
+    def _observe(self, latency: float):
+        self.completed += 1
+        if self._short_latency is None:
+            self._short_latency = self._long_latency = latency
+            return
+        self._short_latency += _SHORT_ALPHA * (latency - self._short_latency)
+        self._long_latency += _LONG_ALPHA * (latency - self._long_latency)
+
+        if self._short_latency > LLM_LATENCY_TOLERANCE * self._long_latency:
+            self._decrease(f"latency {self._short_latency:.1f}s vs {self._long_latency:.1f}s")
+        elif self.in_flight + 1 >= int(self.limit):
+            # Additive increase: about +1 per full window, and only while the window is in use
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self, reason: str):
+        # At most one cut per typical call duration, so one slow burst is not punished repeatedly
+        now = time.monotonic()
+        if now - self._last_decrease < (self._short_latency or 0.0):
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(float(self.min_limit), self.limit * LLM_DECREASE_FACTOR)
+        self.decreases += 1
+        logger.info(f"→ SCHEDULER: limit {previous:.1f} -> {self.limit:.1f} ({reason})")
+
+    def _dispatch(self):
+        while self._queues and self.in_flight < int(self.limit):
+            request_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues.move_to_end(request_id)
+            else:
+                del self._queues[request_id]
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": self._waiting,
+            "waiting_requests": len(self._queues),
+            "latency_short_sec": round(self._short_latency, 2) if self._short_latency else None,
+            "latency_long_sec": round(self._long_latency, 2) if self._long_latency else None,
+            "completed": self.completed,
+            "decreases": self.decreases,
+            "rejected": self.rejected
+        }
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler(LLM_MIN_CONCURRENCY, LLM_MAX_CONCURRENCY, LLM_INITIAL_CONCURRENCY, LLM_MAX_QUEUE)
+    return _scheduler
+
+
+async def scheduled_abatch(all_messages: List[List[BaseMessage]], options: Optional[dict] = None) -> List[BaseMessage]:
+    """get_llm().abatch with every call going through the shared scheduler."""
+    llm = get_llm(**(options or {}))
+    scheduler = get_scheduler()
+    return await asyncio.gather(*(scheduler.run(lambda m=messages: llm.ainvoke(m)) for messages in all_messages))
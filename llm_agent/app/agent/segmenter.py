@@ -0,0 +1,128 @@
+"""
+Single-pass sentence splitting and segment packing over character offsets.
+
+Everything here works on (start, end) offsets into the original transcription,
+so a segment's text is always ``text[start:end]`` and positions found inside a
+segment map straight back to the transcription. Each stage is a generator that
+looks at every character a bounded number of times, so segmentation stays
+linear however long or badly punctuated the transcript is.
+"""
+
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+from .utils import count_tokens
+
+Span = Tuple[int, int]
+
+# Sentence terminators, plus the quote and bracket characters that can suspend them. A terminator
+# run is only tried from its first character, so long runs of punctuation cannot cause backtracking.
+_BOUNDARY_RE = re.compile(r'(?<![.!?;])[.!?;]+(?=\s|$)|["()\[\]]')
+_WORD_RE = re.compile(r"\S+")
+
+# A quote or bracket left open this long is treated as stray punctuation
+MAX_PROTECTED_CHARS = 500
+
+
+def _trimmed(text: str, start: int, end: int) -> Span:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def iter_sentences(text: str) -> Iterator[Span]:
+    """
+    Sentence offsets, whitespace-trimmed. A run of . ! ? ; followed by
+    whitespace or the end closes a sentence, except inside "quotes",
+    (parentheses) or [brackets] opened at most MAX_PROTECTED_CHARS earlier.
+    """
+    start = 0
+    in_quote = False
+    depth = 0
+    opened_at = 0
+    for match in _BOUNDARY_RE.finditer(text):
+        char = match.group(0)[0]
+        pos = match.start()
+        if (in_quote or depth) and pos - opened_at > MAX_PROTECTED_CHARS:
+            in_quote, depth = False, 0
+        if char == '"':
+            in_quote = not in_quote
+            opened_at = pos
+        elif char in "([":
+            if not depth and not in_quote:
+                opened_at = pos
+            depth += 1
+        elif char in ")]":
+            depth = max(0, depth - 1)
+        elif not in_quote and not depth:
+            s, e = _trimmed(text, start, match.end())
+            if s < e:
+                yield s, e
+            start = match.end()
+    s, e = _trimmed(text, start, len(text))
+    if s < e:
+        yield s, e
+
+
+def _split_overlong(text: str, start: int, end: int, budget: int) -> Iterator[Tuple[int, int, int]]:
+    """
+    Pieces of a sentence that alone exceeds the budget, cut at word boundaries,
+    with their token counts. A single "word" over the budget (no whitespace at
+    all) is cut every `budget` characters, which never exceeds the budget since
+    no character counts as more than one token.
+    """
+    piece_start = None
+    piece_end = start
+    tokens = 0
+    for word in _WORD_RE.finditer(text, start, end):
+        n = count_tokens(word.group(0))
+        if piece_start is not None and tokens + n > budget:
+            yield piece_start, piece_end, tokens
+            piece_start, tokens = None, 0
+        if n > budget:
+            for cut in range(word.start(), word.end(), budget):
+                cut_end = min(cut + budget, word.end())
+                yield cut, cut_end, count_tokens(text[cut:cut_end])
+            continue
+        if piece_start is None:
+            piece_start = word.start()
+        piece_end = word.end()
+        tokens += n
+    if piece_start is not None:
+        yield piece_start, piece_end, tokens
+
+
+def _units(text: str, sentences: Iterable[Span], budget: int) -> Iterator[Tuple[int, int, int]]:
+    for start, end in sentences:
+        n = count_tokens(text[start:end])
+        if n <= budget:
+            yield start, end, n
+        else:
+            yield from _split_overlong(text, start, end, budget)
+
+
+def iter_segments(text: str, budget: int, overlap: int = 0) -> Iterator[Span]:
+    """
+    Greedily pack sentences into segments of at most `budget` tokens, in order.
+    Each new segment repeats the last `overlap` sentences of the previous one
+    (as long as they take at most half the budget), so spans crossing a
+    boundary are still seen whole. Overlong sentences are split at word boundaries.
+    """
+    cur: List[Tuple[int, int, int]] = []
+    cur_tokens = 0
+    for unit in _units(text, iter_sentences(text), budget):
+        if cur and cur_tokens + unit[2] > budget:
+            yield cur[0][0], cur[-1][1]
+            carry = cur[-overlap:] if overlap else []
+            carry_tokens = sum(n for _, _, n in carry)
+            while carry and (carry_tokens > budget // 2 or carry_tokens + unit[2] > budget):
+                carry_tokens -= carry[0][2]
+                carry = carry[1:]
+            cur = list(carry)
+            cur_tokens = carry_tokens
+        cur.append(unit)
+        cur_tokens += unit[2]
+    if cur:
+        yield cur[0][0], cur[-1][1]
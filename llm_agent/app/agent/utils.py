@@ -1,23 +1,71 @@
 from langchain_ollama import ChatOllama
+import math
 import os
+import re
 
-# Singleton instance
+# Generation options; part of the LLM cache key, so anything that changes the output belongs here
+LLM_OPTIONS = {
+    "temperature": 0,
+    "format": "json",
+    "num_ctx": 4096,
+    "num_predict": 2048,
+    "top_p": 0.9,
+    "repeat_penalty": 1.1,
+}
+
+# Words and single punctuation marks, the units count_tokens estimates from
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Average characters per BPE token for ASCII word pieces; other scripts (CJK, Cyrillic, Greek, ...)
+# get about one token per character or less, so every non-ASCII character counts as a token
+_CHARS_PER_TOKEN = 4
+
+# Singleton instance, plus one per set of option overrides (e.g. a retry temperature)
 _llm_instance = None
+_llm_variants = {}
+
+
+def get_model_name() -> str:
+    return os.getenv("OLLAMA_MODEL", "qwen3:8b")
 
 
-def get_llm() -> ChatOllama:
-    """Get the Ollama LLM instance (singleton)."""
+def get_llm(**overrides) -> ChatOllama:
+    """Get the Ollama LLM instance (singleton), or a cached variant with some LLM_OPTIONS overridden."""
     global _llm_instance
+    if overrides:
+        key = tuple(sorted(overrides.items()))
+        if key not in _llm_variants:
+            _llm_variants[key] = ChatOllama(
+                model=get_model_name(),
+                keep_alive="24h",
+                **{**LLM_OPTIONS, **overrides}
+            )
+        return _llm_variants[key]
     if _llm_instance is None:
-        model_name = os.getenv("OLLAMA_MODEL", "qwen3:8b")
         _llm_instance = ChatOllama(
-            model=model_name,
-            temperature=0,
-            format="json",
-            num_ctx=4096,
-            num_predict=2048,
-            top_p=0.9,
-            repeat_penalty=1.1,
-            keep_alive="24h"
+            model=get_model_name(),
+            keep_alive="24h",
+            **LLM_OPTIONS
         )
     return _llm_instance
+
+
+def _word_tokens(word: str) -> int:
+    if word.isascii():
+        return math.ceil(len(word) / _CHARS_PER_TOKEN)
+    ascii_chars = sum(c.isascii() for c in word)
+    return math.ceil(ascii_chars / _CHARS_PER_TOKEN) + len(word) - ascii_chars
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate the number of model tokens in text without loading a tokenizer.
+    Each punctuation mark counts as one token, each non-ASCII character as one
+    token, and the ASCII characters of a word as one token per started 4.
+    This overestimates BPE counts for English and for scripts without spaces
+    or with multi-byte letters (CJK, Cyrillic, Greek), so segments sized with
+    it fit the context.
+    """
+    return sum(
+        _word_tokens(piece) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _TOKEN_RE.findall(text or "")
+    )
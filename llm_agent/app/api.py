@@ -1,15 +1,28 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+import asyncio
 import json
+import uuid
 import logging
 from contextlib import asynccontextmanager
+from typing import List, Optional
 
 from .agent.graph import graph
 from .agent.agent_state import AgentState
 from .agent.utils import get_llm
+from .agent.cache import get_cache
+from .agent.batch import detect_batch
+from .agent.criteria import compile_criteria
+from .agent.prescreen import prescreen_stats
+from .agent.scheduler import get_scheduler, current_request, QueueFull
 from .models import (
     DetectionRequest,
     DetectionResponse,
-    ExtremistSpan
+    ExtremistSpan,
+    BatchDetectionRequest,
+    BatchDetectionResponse,
+    CriteriaCompileRequest,
+    CriteriaCompileResponse
 )
 
 # Configure logging
@@ -30,6 +43,8 @@ async def lifespan(app: FastAPI):
     try:
         llm_instance = get_llm()
         logger.info("→ STARTUP: LLM model loaded")
+        if get_cache():
+            logger.info(f"→ STARTUP: LLM cache ready ({get_cache().stats()['entries']} entries)")
     except Exception:
         logger.exception("Failed to load LLM model")
         raise
@@ -51,18 +66,19 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "extremist-content-detection",
-        "model_loaded": llm_instance is not None
+        "model_loaded": llm_instance is not None,
+        "llm_cache": get_cache().stats() if get_cache() else None,
+        "scheduler": get_scheduler().stats(),
+        "prescreen": prescreen_stats.stats()
     }
 
 
-@app.post("/detect", response_model=DetectionResponse)
-async def detect_extremist_content(request: DetectionRequest):
-    """Detect extremist content in transcribed text."""
+def _log_request(request: DetectionRequest, endpoint: str):
     logger.info(f"→ REQUEST: {len(request.transcription)} chars, {len(request.default_definitions)} criteria, {len(request.positive_examples)} positive examples, {len(request.negative_examples)} negative examples")
 
     # Log detailed request information
     logger.info("\n" + "=" * 80)
-    logger.info("INCOMING REQUEST TO /detect ENDPOINT:")
+    logger.info(f"INCOMING REQUEST TO {endpoint} ENDPOINT:")
     logger.info("=" * 80)
     logger.info(f"\n📝 TRANSCRIPTION LENGTH: {len(request.transcription)} characters")
     logger.info(f"First 200 chars: {request.transcription[:200]}...")
@@ -87,23 +103,50 @@ async def detect_extremist_content(request: DetectionRequest):
 
     logger.info("=" * 80 + "\n")
 
+
+def _admit():
+    """Reject the request up front when the model is missing or the LLM queue is full."""
     if llm_instance is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
 
+    # Backpressure: shed new requests while the model-call queue is full
     try:
-        initial_state = AgentState(
-            transcription=request.transcription,
-            default_definitions=request.default_definitions,
-            positive_examples=request.positive_examples,
-            negative_examples=request.negative_examples
-        )
+        get_scheduler().admit()
+    except QueueFull as e:
+        logger.warning(f"→ REJECTED: {e}")
+        raise HTTPException(status_code=429, detail="LLM queue full", headers={"Retry-After": str(e.retry_after)})
+
+
+def _initial_state(request: DetectionRequest) -> AgentState:
+    return AgentState(
+        transcription=request.transcription,
+        default_definitions=request.default_definitions,
+        positive_examples=request.positive_examples,
+        negative_examples=request.negative_examples
+    )
+
+
+@app.post("/detect", response_model=DetectionResponse)
+async def detect_extremist_content(request: DetectionRequest):
+    """Detect extremist content in transcribed text."""
+    _log_request(request, "/detect")
+    _admit()
+
+    # Model calls made for this request share one fair-queue slot in the scheduler
+    current_request.set(uuid.uuid4().hex)
 
-        result = await graph.ainvoke(initial_state)
+    try:
+        result = await graph.ainvoke(_initial_state(request))
         parsed_response = json.loads(result["response"])
         spans = [ExtremistSpan(**span) for span in parsed_response.get("spans", [])]
+        failed_segments = result.get("failed_segments", [])
+        skipped_segments = result.get("prescreen_skipped", [])
 
-        logger.info(f"→ RESULT: {len(spans)} spans detected")
-        return DetectionResponse(spans=spans)
+        logger.info(
+            f"→ RESULT: {len(spans)} spans detected, {len(failed_segments)} segments failed, "
+            f"{len(skipped_segments)} pre-screened out"
+        )
+        return DetectionResponse(spans=spans, failed_segments=failed_segments, skipped_segments=skipped_segments)
     except json.JSONDecodeError:
         logger.exception("JSON parsing failed, returning empty spans")
         return DetectionResponse(spans=[])
@@ -112,6 +155,128 @@ async def detect_extremist_content(request: DetectionRequest):
         raise HTTPException(status_code=500, detail="Detection failed")
 
 
+@app.post("/detect/stream")
+async def detect_extremist_content_stream(request: DetectionRequest):
+    """
+    Detect extremist content, streaming NDJSON: one "segment" event per
+    segment as soon as it is scored (segments finish out of order), then a
+    final "done" event, or an "error" event if detection fails.
+    """
+    _log_request(request, "/detect/stream")
+    _admit()
+
+    events: asyncio.Queue = asyncio.Queue()
+    request_id = uuid.uuid4().hex
+
+    async def _run():
+        current_request.set(request_id)
+        segments_done = 0
+
+        def _on_segment_result(index: int, spans: List[dict], segments_total: int, error: Optional[str] = None):
+            nonlocal segments_done
+            segments_done += 1
+            event = {
+                "event": "segment",
+                "segment_index": index,
+                "spans": spans,
+                "segments_done": segments_done,
+                "segments_total": segments_total
+            }
+            if error is not None:
+                event["error"] = error
+            events.put_nowait(event)
+
+        try:
+            result = await graph.ainvoke(
+                _initial_state(request),
+                config={"configurable": {"on_segment_result": _on_segment_result}}
+            )
+            segments_total = len(result.get("transcription_segments", []))
+            spans_total = len(json.loads(result["response"]).get("spans", []))
+            logger.info(f"→ RESULT: {spans_total} spans detected (streamed)")
+            events.put_nowait({
+                "event": "done",
+                "segments_total": segments_total,
+                "spans_total": spans_total,
+                "failed_segments": result.get("failed_segments", []),
+                "skipped_segments": result.get("prescreen_skipped", [])
+            })
+        except Exception:
+            logger.exception("Streaming detection failed")
+            events.put_nowait({"event": "error", "detail": "Detection failed"})
+
+    async def _stream():
+        task = asyncio.create_task(_run())
+        try:
+            while True:
+                event = await events.get()
+                if event["event"] == "segment":
+                    event["spans"] = [ExtremistSpan(**span).model_dump() for span in event["spans"]]
+                yield json.dumps(event) + "\n"
+                if event["event"] in ("done", "error"):
+                    break
+        finally:
+            # Client went away: stop scoring segments nobody will read
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
+
+@app.post("/detect/batch", response_model=BatchDetectionResponse)
+async def detect_extremist_content_batch(request: BatchDetectionRequest):
+    """
+    Detect extremist content in many transcriptions that share criteria and
+    examples. Identical segments across the batch are scored once, and all
+    segments are scheduled as one pool against the model.
+    """
+    logger.info(f"→ BATCH REQUEST: {len(request.items)} transcriptions, {sum(len(item.transcription) for item in request.items)} chars, {len(request.default_definitions)} criteria, {len(request.positive_examples)} positive examples, {len(request.negative_examples)} negative examples")
+
+    if len({item.id for item in request.items}) != len(request.items):
+        raise HTTPException(status_code=422, detail="Item ids must be unique")
+    _admit()
+
+    # One fair-queue slot in the scheduler for the whole batch
+    current_request.set(uuid.uuid4().hex)
+
+    try:
+        results, counts = await detect_batch(
+            {item.id: item.transcription for item in request.items},
+            request.default_definitions,
+            request.positive_examples,
+            request.negative_examples
+        )
+        logger.info(f"→ RESULT: {sum(len(spans) for spans in results.values())} spans detected across {len(results)} transcriptions")
+        return BatchDetectionResponse(
+            results={item_id: [ExtremistSpan(**span) for span in spans] for item_id, spans in results.items()},
+            **counts
+        )
+    except json.JSONDecodeError:
+        logger.exception("JSON parsing failed, returning empty spans")
+        return BatchDetectionResponse(results={item.id: [] for item in request.items})
+    except Exception:
+        logger.exception("Batch detection failed")
+        raise HTTPException(status_code=500, detail="Detection failed")
+
+
+@app.post("/criteria/compile", response_model=CriteriaCompileResponse)
+async def compile_detection_criteria(request: CriteriaCompileRequest):
+    """
+    Merge and tighten a criteria set with the refinement prompt. Results are
+    remembered by the set's hash, so callers pay for each distinct set once.
+    """
+    logger.info(f"→ CRITERIA REQUEST: {len(request.criteria)} criteria")
+    _admit()
+    current_request.set(uuid.uuid4().hex)
+
+    try:
+        criteria, key, cached, compiled = await compile_criteria(request.criteria)
+        return CriteriaCompileResponse(criteria=criteria, criteria_hash=key, cached=cached, compiled=compiled)
+    except Exception:
+        logger.exception("Criteria compilation failed")
+        raise HTTPException(status_code=500, detail="Criteria compilation failed")
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -121,6 +286,9 @@ async def root():
         "endpoints": {
             "health": "/health",
             "detect": "POST /detect",
+            "detect_stream": "POST /detect/stream",
+            "detect_batch": "POST /detect/batch",
+            "compile_criteria": "POST /criteria/compile",
             "docs": "/docs"
         }
     }
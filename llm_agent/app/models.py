@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List, Optional
 
 
 class DetectionRequest(BaseModel):
@@ -24,8 +24,84 @@ class ExtremistSpan(BaseModel):
     text: str = Field(..., description="The exact text span identified as extremist")
     rationale: str = Field(..., description="Explanation of why this span is extremist")
     confidence: float = Field(..., description="Confidence score 0.0-1.0")
+    start_char: Optional[int] = Field(None, description="Offset of the span's first character in the submitted transcription")
+    end_char: Optional[int] = Field(None, description="Offset just past the span's last character in the submitted transcription")
+    match_score: Optional[float] = Field(
+        None,
+        description="How closely the quoted text matches transcription[start_char:end_char], 1.0 for verbatim; "
+                    "None when the quote could not be found"
+    )
+
+
+class FailedSegment(BaseModel):
+    """A segment that produced no usable reply after all retries."""
+    segment_index: int = Field(..., description="Index of the segment within its transcription")
+    error: str = Field(..., description="Why the last attempt failed")
 
 
 class DetectionResponse(BaseModel):
     """Response model for extremist content detection."""
     spans: List[ExtremistSpan] = Field(..., description="List of detected extremist spans")
+    failed_segments: List[FailedSegment] = Field(
+        default_factory=list,
+        description="Segments with no result; spans from all other segments are still returned"
+    )
+    skipped_segments: List[int] = Field(
+        default_factory=list,
+        description="Indices of segments the lexical pre-screen kept from the model: not scored, rather than clean"
+    )
+
+
+class BatchDetectionItem(BaseModel):
+    """One transcription in a batch detection request."""
+    id: str = Field(..., description="Caller's key for this transcription; results are returned under it")
+    transcription: str = Field(..., description="Transcribed text to analyze")
+
+
+class BatchDetectionRequest(BaseModel):
+    """Request model for detecting extremist content in many transcriptions at once."""
+    items: List[BatchDetectionItem] = Field(..., description="Transcriptions sharing the criteria and examples below")
+    default_definitions: List[str] = Field(
+        default_factory=list,
+        description="Abstract extremism criteria rules"
+    )
+    positive_examples: List[str] = Field(
+        default_factory=list,
+        description="Concrete examples of extremist content TO flag"
+    )
+    negative_examples: List[str] = Field(
+        default_factory=list,
+        description="Concrete examples of normal content NOT to flag"
+    )
+
+
+class BatchDetectionResponse(BaseModel):
+    """Response model for batch detection."""
+    results: Dict[str, List[ExtremistSpan]] = Field(..., description="Detected spans per item id")
+    failed_segments: Dict[str, List[FailedSegment]] = Field(
+        default_factory=dict,
+        description="Failed segments per item id, for items that have any"
+    )
+    skipped_segments: Dict[str, List[int]] = Field(
+        default_factory=dict,
+        description="Pre-screened (not scored) segment indices per item id, for items that have any"
+    )
+    segments_total: int = Field(0, description="Segments across all items")
+    unique_segments: int = Field(0, description="Distinct segments actually scored")
+
+
+class CriteriaCompileRequest(BaseModel):
+    """Request model for compiling a batch's criteria."""
+    criteria: List[str] = Field(..., description="User-supplied extremism criteria, possibly overlapping")
+
+
+class CriteriaCompileResponse(BaseModel):
+    """Response model for criteria compilation."""
+    criteria: List[str] = Field(..., description="Deduplicated, merged criteria to use in detection prompts")
+    criteria_hash: str = Field(..., description="Hash of the input criteria set this result belongs to")
+    cached: bool = Field(False, description="Whether the compiled set was already known")
+    compiled: bool = Field(
+        True,
+        description="False when the model's reply was unusable and criteria are the input with repeats dropped; "
+                    "callers should not store them as compiled"
+    )
@@ -0,0 +1,120 @@
+"""
+Segmentation benchmark on pathological transcripts.
+
+Times the offset segmenter on inputs of growing size and prints the
+per-megabyte cost, which should stay flat (linear scaling). The old regex
+splitter is timed on the small sizes only, in a child process that is
+stopped after OLD_REGEX_TIMEOUT_SEC, for comparison (it includes process
+start-up time).
+
+Run from llm_agent/:  python -m benchmarks.segmentation [--max-mb 8]
+"""
+import argparse
+import multiprocessing
+import random
+import re
+import time
+
+from app.agent.segmenter import iter_segments
+
+# The nested lazy alternation segment_transcription used before the offset segmenter
+OLD_SENTENCE_RE = re.compile(
+    r"""
+    (?:[^.!?;"]+?|"(?:[^"]+)"|\([^)]+\)|\[[^\]]+\])+?
+    (?:[.!?;]+(?=\s|$)|$)
+    """,
+    re.VERBOSE | re.UNICODE
+)
+OLD_REGEX_MAX_CHARS = 20_000
+# The old regex backtracks catastrophically on some cases; give up on it after this long
+OLD_REGEX_TIMEOUT_SEC = 10.0
+BUDGET = 1500
+
+WORDS = "we they people country must will never again right now all of them today".split()
+
+
+def _words(n_chars: int, rng: random.Random) -> str:
+    out, size = [], 0
+    while size < n_chars:
+        word = rng.choice(WORDS)
+        out.append(word)
+        size += len(word) + 1
+    return " ".join(out)
+
+
+def no_punctuation(n_chars: int, rng: random.Random) -> str:
+    """Whisper output of a long monologue with no sentence ends at all."""
+    return _words(n_chars, rng)
+
+
+def open_quotes(n_chars: int, rng: random.Random) -> str:
+    """Stray quotes and brackets that are never closed."""
+    text = _words(n_chars, rng).split(" ")
+    for i in range(0, len(text), 7):
+        text[i] = rng.choice(['"', "(", "["]) + text[i]
+    return " ".join(text)
+
+
+def punctuation_runs(n_chars: int, rng: random.Random) -> str:
+    """Long runs of terminators that are not followed by whitespace."""
+    return "".join(rng.choice(WORDS) + "!" * rng.randint(50, 500) + "x" for _ in range(n_chars // 300 + 1))[:n_chars]
+
+
+def regular(n_chars: int, rng: random.Random) -> str:
+    """Normally punctuated speech, the common case."""
+    text = _words(n_chars, rng).split(" ")
+    for i in range(9, len(text), 12):
+        text[i] += rng.choice([".", "?", "!", ";"])
+    return " ".join(text)
+
+
+CASES = [regular, no_punctuation, open_quotes, punctuation_runs]
+
+
+def _time(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def _run_old_regex(text: str):
+    list(OLD_SENTENCE_RE.finditer(text))
+
+
+def _time_old_regex(text: str) -> str:
+    """Old splitter's time in a child process, so a runaway match can be stopped."""
+    process = multiprocessing.Process(target=_run_old_regex, args=(text,))
+    start = time.perf_counter()
+    process.start()
+    process.join(OLD_REGEX_TIMEOUT_SEC)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return f">{OLD_REGEX_TIMEOUT_SEC:.0f}"
+    return f"{time.perf_counter() - start:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-mb", type=float, default=8.0, help="largest input size in megabytes")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sizes = [10_000, 100_000, 1_000_000]
+    while sizes[-1] * 2 <= args.max_mb * 1_000_000:
+        sizes.append(sizes[-1] * 2)
+
+    print(f"{'case':<18}{'chars':>12}{'segments':>10}{'seconds':>10}{'s/MB':>8}{'old regex s':>14}")
+    for case in CASES:
+        for size in sizes:
+            text = case(size, rng)
+            segments = []
+            seconds = _time(lambda: segments.extend(iter_segments(text, BUDGET, overlap=1)))
+            old = ""
+            if size <= OLD_REGEX_MAX_CHARS:
+                old = _time_old_regex(text)
+            print(f"{case.__name__:<18}{size:>12}{len(segments):>10}{seconds:>10.3f}{seconds / size * 1e6:>8.2f}{old:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Tests for the SQLite LLM cache in front of the model scheduler."""
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.agent import cache
+
+
+@pytest.fixture
+def llm_cache(tmp_path, monkeypatch):
+    instance = cache.LLMCache(str(tmp_path / "cache.sqlite3"), max_entries=1000, max_age_sec=3600)
+    monkeypatch.setattr(cache, "_cache_instance", instance)
+    monkeypatch.setattr(cache, "LLM_CACHE_ENABLED", True)
+    statements = []
+    instance._conn.set_trace_callback(statements.append)
+    return instance, statements
+
+
+@pytest.fixture
+def model(monkeypatch):
+    calls = []
+
+    async def fake_abatch(all_messages, options=None):
+        calls.append(len(all_messages))
+        return [AIMessage(content='{"spans": []}' if "good" in m[0].content else "no json") for m in all_messages]
+
+    monkeypatch.setattr(cache, "scheduled_abatch", fake_abatch)
+    return calls
+
+
+def _prompts(*texts):
+    return [[HumanMessage(content=text)] for text in texts]
+
+
+def test_batch_is_read_with_one_query_and_written_in_one_transaction(llm_cache, model):
+    instance, statements = llm_cache
+    prompts = _prompts("good 1", "good 2", "good 3", "bad")
+
+    asyncio.run(cache.cached_abatch(prompts))
+    assert model == [4]
+    assert sum(s.startswith("SELECT") for s in statements) == 1
+    assert sum(s.startswith("INSERT") for s in statements) == 3
+    assert sum(s == "COMMIT" for s in statements) == 1
+
+    statements.clear()
+    responses = asyncio.run(cache.cached_abatch(prompts))
+    # Only the reply that was not JSON is asked for again
+    assert model == [4, 1]
+    assert [r.content for r in responses[:3]] == ['{"spans": []}'] * 3
+    assert sum(s.startswith("SELECT") for s in statements) == 1
+    assert instance.hits == 3 and instance.misses == 5
+
+
+def test_hits_update_recency_with_the_next_write(llm_cache, model):
+    instance, _ = llm_cache
+    asyncio.run(cache.cached_abatch(_prompts("good 1")))
+    key = cache.LLMCache.make_key(_prompts("good 1")[0])
+    stored_at = instance._conn.execute("SELECT last_used_at FROM llm_cache WHERE key = ?", (key,)).fetchone()[0]
+
+    asyncio.run(cache.cached_abatch(_prompts("good 1")))
+    assert key in instance._touched
+    asyncio.run(cache.cached_abatch(_prompts("good 2")))
+    used_at = instance._conn.execute("SELECT last_used_at FROM llm_cache WHERE key = ?", (key,)).fetchone()[0]
+    assert used_at > stored_at
+    assert not instance._touched
+
+
+
+def test_replies_the_caller_rejects_are_not_cached(llm_cache, model):
+    instance, _ = llm_cache
+    prompts = _prompts("good 1")
+    # Valid JSON, but not the shape the caller needs
+    asyncio.run(cache.cached_abatch(prompts, validate=lambda content: "criteria" in content))
+    asyncio.run(cache.cached_abatch(prompts, validate=lambda content: "criteria" in content))
+    assert model == [1, 1]
+    assert instance._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 0
+
+
+def test_stored_reply_the_caller_rejects_is_dropped(llm_cache, model):
+    instance, _ = llm_cache
+    prompts = _prompts("good 1")
+    asyncio.run(cache.cached_abatch(prompts))
+    asyncio.run(cache.cached_abatch(prompts, validate=lambda content: "criteria" in content))
+    assert model == [1, 1]
+    assert instance._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 0
@@ -0,0 +1,35 @@
+"""Tests for the tokenizer-free token estimate used to size segments."""
+from app.agent.segmenter import iter_segments
+from app.agent.utils import count_tokens
+
+CJK = "我们必须在今晚之前把他们全部赶出这个城市否则一切都太迟了" * 7
+CYRILLIC = "Мы должны уничтожить их всех сегодня ночью, пока не стало слишком поздно."
+
+
+def test_english_counts_started_four_character_pieces():
+    assert count_tokens("we will fight them") == 5
+    assert count_tokens("extraordinary!") == 5
+
+
+def test_cjk_counts_one_token_per_character():
+    assert count_tokens(CJK) == len(CJK) == 196
+
+
+def test_cyrillic_counts_one_token_per_letter():
+    letters = sum(c.isalpha() for c in CYRILLIC)
+    punctuation = sum(c in ",." for c in CYRILLIC)
+    assert count_tokens(CYRILLIC) == letters + punctuation
+
+
+def test_mixed_scripts_add_up():
+    assert count_tokens("Hello мир") == 2 + 3
+
+
+def test_cjk_segments_stay_within_budget():
+    text = "。".join([CJK] * 5)
+    budget = 100
+    segments = list(iter_segments(text, budget))
+    assert len(segments) > 1
+    for start, end in segments:
+        # A model tokenizer never needs more than one token per CJK character
+        assert end - start <= budget
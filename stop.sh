@@ -13,6 +13,7 @@ echo ""
 # Stop Backend (port 8000)
 echo "[2/4] Stopping Backend..."
 lsof -ti:8000 | xargs kill -9 2>/dev/null && echo "Backend stopped" || echo "Backend not running"
+pkill -f "app.worker" 2>/dev/null && echo "Workers stopped" || echo "Workers not running"
 echo ""
 
 # Stop LLM Agent (port 8001)